@@ -1,10 +1,123 @@
-from django.contrib import admin
-from django.db import models
-from django.db.models.signals import pre_save, post_save, post_delete
+import json
+
+from django import forms
+from django.conf import settings
+from django.conf.urls import url
+from django.contrib import admin, messages
+from django.contrib.admin.views.main import ChangeList
+from django.core.cache import cache
+from django.core.exceptions import PermissionDenied
+from django.core.paginator import Paginator
+from django.db import connections, models
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.forms import TextInput, NumberInput
+from django.http import Http404, JsonResponse
+from django.shortcuts import get_object_or_404, redirect
+from django.template.response import TemplateResponse
+from django.utils.functional import cached_property
+
+from . import hooks
+from .models import Competition, Gymnast, Mark, Performance, Team, TeamGymnast
+from .rules import scorer
+from .scoring import D_SLOTS, E_SLOTS, enter_marks, from_thousandths, mark_names, to_thousandths
+from .startlist import StartListError, import_start_list
+
+
+class StartListForm(forms.Form):
+    file = forms.FileField(label='Файл CSV или XLSX')
+
+
+def mark_field(label):
+    # Оценки вводятся в баллах, хранятся в тысячных (см. scoring.to_thousandths)
+    return forms.DecimalField(label=label, required=False, min_value=0, max_value=10,
+                              max_digits=5, decimal_places=3,
+                              widget=NumberInput(attrs={'size': '5', 'step': '0.1'}))
+
+
+class JudgeMarksForm(forms.Form):
+    # Оценки судей за одно выступление; ключи как в scoring.mark_names()
+    d1 = mark_field('D1/D2')
+    d2 = mark_field('D3/D4')
+    e1 = mark_field('E1/E2')
+    e2 = mark_field('E3')
+    e3 = mark_field('E4')
+    e4 = mark_field('E5')
+    e5 = mark_field('E6')
+    penalty = mark_field('сбавка')
+
+    @staticmethod
+    def initial_marks(performance):
+        if performance is None:
+            return {}
+        values = (performance.panel_marks(Mark.D, D_SLOTS) + performance.panel_marks(Mark.E, E_SLOTS) +
+                  [performance.penalty])
+        return dict(zip(mark_names(), map(from_thousandths, values)))
+
+
+class MarksForm(JudgeMarksForm):
+    id = forms.IntegerField(widget=forms.HiddenInput)
+
+
+def panel_form(form, rules):
+    """Форма только с оценками судей, которые есть в бригаде по правилам rules."""
+    unused = set(mark_names()) - set(scorer(rules).mark_names())
+    return type(form.__name__, (form,), dict.fromkeys(unused))
+
+
+class PerformanceForm(JudgeMarksForm, forms.ModelForm):
+
+    class Meta:
+        model = Performance
+        fields = ['apparatus']
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        if self.instance.pk:
+            for name, value in self.initial_marks(self.instance).items():
+                self.initial.setdefault(name, value)
 
-from .models import Competition, Gymnast, Team, TeamGymnast
+    def save(self, commit=True):
+        performance = super().save(commit=False)
+        performance.penalty = to_thousandths(self.cleaned_data['penalty'])
+        if commit:
+            data = self.cleaned_data
+            # оценки судей, которых нет в бригаде по правилам, остаются как были
+            marks = {name: data[name] if name in self.fields else self.initial.get(name)
+                     for name in mark_names()}
+            performance.set_marks(d=[marks['d%s' % slot] for slot in D_SLOTS],
+                                  e=[marks['e%s' % slot] for slot in E_SLOTS])
+        return performance
+
+
+class PerformanceInline(admin.TabularInline):
+    # Итог участника пересчитывается после сохранения всех выступлений, см. save_related
+    model = Performance
+    form = PerformanceForm
+    extra = 0
+    ordering = ('apparatus',)
+    fields = ['apparatus', 'd1', 'd2', 'e1', 'e2', 'e3', 'e4', 'e5', 'penalty',
+              'tv_d', 'tv_e', 'score', 'result']
+    readonly_fields = ('tv_d', 'tv_e', 'score', 'result')
+
+    def get_fields(self, request, obj=None):
+        if obj is None:
+            return self.fields
+        names = scorer(obj.competition.scoring_rules(self.parent_model)).mark_names()
+        return [name for name in self.fields if name not in mark_names() or name in names]
+
+    def get_formset(self, request, obj=None, **kwargs):
+        if obj is not None:
+            kwargs['form'] = panel_form(self.form, obj.competition.scoring_rules(self.parent_model))
+        formset = super().get_formset(request, obj, **kwargs)
+        if obj is not None:
+            names = obj.competition.apparatus(self.parent_model)
+            formset.form.base_fields['apparatus'] = forms.TypedChoiceField(
+                label='вид программы', coerce=int, choices=list(enumerate(names, 1)))
+        return formset
+
+    def get_queryset(self, request):
+        return super().get_queryset(request).prefetch_related('marks')
 
 
 class TeamGymnastInline(admin.StackedInline):
@@ -12,6 +125,93 @@ class TeamGymnastInline(admin.StackedInline):
     extra = 0
 
 
+def estimated_count(model, using='default'):
+    """Примерное число строк таблицы без COUNT(*); None, если оценить нельзя.
+    В SQLite это разность крайних ключей: после удалений (например, переноса
+    соревнований в архив) ключи идут с пропусками, и оценка больше числа строк."""
+    connection = connections[using]
+    table = model._meta.db_table
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute('SELECT reltuples FROM pg_class WHERE relname = %s', [table])
+        elif connection.vendor == 'sqlite':
+            # Каждый MIN/MAX отдельным подзапросом: так SQLite берёт их из индекса
+            table = connection.ops.quote_name(table)
+            cursor.execute('SELECT (SELECT MAX("id") FROM %s) - (SELECT MIN("id") FROM %s) + 1'
+                           % (table, table))
+        else:
+            return None
+        row = cursor.fetchone()
+    if row is None or row[0] is None or row[0] < 0:
+        return None
+    return int(row[0])
+
+
+class EstimatedCountPaginator(Paginator):
+    """Список всех участников за все сезоны считается по оценке из
+    estimated_count, а не COUNT(*) по всей таблице. Отфильтрованный список
+    (например, одно соревнование) считается точно, по индексу. Таблица, где
+    строк меньше estimate_from, считается точно, даже если оценка больше."""
+    estimate_from = 10000
+
+    @cached_property
+    def count(self):
+        queryset = self.object_list
+        if not queryset.query.where:
+            estimate = estimated_count(queryset.model, queryset.db)
+            if estimate is not None and estimate >= self.estimate_from:
+                # оценка бывает завышена после удалений: COUNT(*) не дальше порога
+                counted = queryset.order_by()[:self.estimate_from].count()
+                return estimate if counted >= self.estimate_from else counted
+        return super().count
+
+
+class CachedValuesFieldListFilter(admin.AllValuesFieldListFilter):
+    """Значения для фильтра -- DISTINCT по всей таблице -- запрашиваются не
+    чаще раза в settings.ADMIN_FILTER_CACHE_TIMEOUT секунд. Сбрасывать кэш
+    при каждом изменении участников нельзя: во время соревнования они
+    меняются постоянно."""
+
+    def __init__(self, field, request, params, model, model_admin, field_path):
+        super().__init__(field, request, params, model, model_admin, field_path)
+        key = 'competitions:filter:%s:%s' % (model._meta.label_lower, field_path)
+        choices = cache.get(key)
+        if choices is None:
+            choices = list(self.lookup_choices)
+            cache.set(key, choices, settings.ADMIN_FILTER_CACHE_TIMEOUT)
+        self.lookup_choices = choices
+
+
+class LeanChangeList(ChangeList):
+
+    def get_queryset(self, request):
+        # Только столбцы списка, а не все поля участника
+        return super().get_queryset(request).only(*self.model_admin.list_only)
+
+
+class CompetitorAdmin(admin.ModelAdmin):
+    list_select_related = ('competition',)
+    paginator = EstimatedCountPaginator
+    # иначе рядом с отфильтрованным списком -- ещё COUNT(*) по всей таблице
+    show_full_result_count = False
+    list_only = ()
+
+    def get_changelist(self, request, **kwargs):
+        return LeanChangeList
+
+    def formfield_for_foreignkey(self, db_field, request, **kwargs):
+        # в архивные соревнования участники не добавляются
+        if db_field.name == 'competition':
+            kwargs['queryset'] = Competition.objects.filter(archived=False)
+        return super().formfield_for_foreignkey(db_field, request, **kwargs)
+
+    def save_related(self, request, form, formsets, change):
+        super().save_related(request, form, formsets, change)
+        form.instance.update_result()
+        # члены команды сохраняются после самой команды
+        form.instance.competition.update_standings(type(form.instance), [form.instance.pk])
+
+
 # @receiver(pre_save, sender=Competition)
 # def sortition(sender, instance, **kwargs):
 #     instance.sortition()
@@ -19,7 +219,7 @@ class TeamGymnastInline(admin.StackedInline):
 
 @admin.register(Competition)
 class CompetitionAdmin(admin.ModelAdmin):
-    list_display = ['title', 'full_name', 'place', 'gymnasts_are_sorted', 'teams_are_sorted']
+    list_display = ['title', 'full_name', 'place', 'gymnasts_are_sorted', 'teams_are_sorted', 'archived']
     list_filter = ['place', ]
     search_fields = ['title', 'place']
     fieldsets = [
@@ -34,115 +234,215 @@ class CompetitionAdmin(admin.ModelAdmin):
             'fields': [
                 'gymnasts_are_sorted',
                 'teams_are_sorted',
+                'draw_seed',
+                'archived',
                 ],
         }),
+        ('Виды программы', {
+            'fields': [('gymnast_apparatus', 'gymnast_rules'), ('team_apparatus', 'team_rules')],
+            'description': 'При смене правил оценки участников пересчитываются.',
+        }),
     ]
     prepopulated_fields = {'slug': ('title',)}
     save_as = True  # Включить возможность “сохранять как” на странице редактирования объекта (сохранит с новым ID)
     readonly_fields = ('full_name',
                        'gymnasts_are_sorted',
-                       'teams_are_sorted'
+                       'teams_are_sorted',
+                       'draw_seed',
+                       'archived',
                        )
     date_hierarchy = 'start'  # Отображение дат
 
+    def has_change_permission(self, request, obj=None):
+        # архивное соревнование только просматривается
+        if obj is not None and obj.archived:
+            return False
+        return super().has_change_permission(request, obj)
+
     def make_sorted(self, request, queryset):
-        for obj in queryset:
-            obj.sortition()
-            obj.save()
+        if queryset.filter(archived=True).exists():
+            self.message_user(request, 'Соревнования в архиве не разыгрываются', messages.ERROR)
+            return None
+        Competition.sortition_many(queryset)
     make_sorted.short_description = "Провести жеребьёвку"
 
-    actions = [make_sorted]
+    def load_start_list(self, request, queryset):
+        if queryset.count() != 1:
+            self.message_user(request, 'Выберите одно соревнование', messages.ERROR)
+            return None
+        return redirect('admin:competitions_competition_import', queryset.get().pk)
+    load_start_list.short_description = "Загрузить стартовый лист"
+
+    def enter_marks(self, request, queryset):
+        if queryset.count() != 1:
+            self.message_user(request, 'Выберите одно соревнование', messages.ERROR)
+            return None
+        return redirect('admin:competitions_competition_marks', queryset.get().pk, 'gymnast', 1)
+    enter_marks.short_description = "Ввод оценок"
+
+    actions = [make_sorted, load_start_list, enter_marks]
+
+    def get_urls(self):
+        return [
+            url(r'^(?P<object_id>\d+)/import/$', self.admin_site.admin_view(self.import_view),
+                name='competitions_competition_import'),
+            url(r'^(?P<object_id>\d+)/marks/(?P<kind>gymnast|team)/(?P<apparatus>\d+)/$',
+                self.admin_site.admin_view(self.marks_view),
+                name='competitions_competition_marks'),
+        ] + super().get_urls()
+
+    def marks_view(self, request, object_id, kind, apparatus):
+        """Оценки за один вид сразу для всех участников одним POST.
+        Принимает форму или JSON: [{"id": 1, "d1": 4.5, "e1": 1.2, ...}, ...]."""
+        competition = get_object_or_404(Competition, pk=object_id)
+        model = Team if kind == 'team' else Gymnast
+        apparatus, names = int(apparatus), competition.apparatus(model)
+        if not 1 <= apparatus <= len(names):
+            raise Http404('Нет такого вида')
+        rules = competition.scoring_rules(model)
+        MarksFormSet = forms.formset_factory(panel_form(MarksForm, rules), extra=0)
+        if not self.has_change_permission(request, competition):
+            raise PermissionDenied
+        as_json = request.content_type == 'application/json'
+
+        if request.method == 'POST' and as_json:
+            try:
+                rows = json.loads(request.body.decode())
+                data = {'form-TOTAL_FORMS': len(rows), 'form-INITIAL_FORMS': len(rows)}
+                for i, row in enumerate(rows):
+                    data.update(('form-%s-%s' % (i, name), '' if value is None else value)
+                                for name, value in row.items())
+            except (ValueError, TypeError, AttributeError):
+                return JsonResponse({'error': 'Ожидается список оценок участников'}, status=400)
+            formset = MarksFormSet(data)
+        elif request.method == 'POST':
+            formset = MarksFormSet(request.POST)
+        else:
+            owner = model._meta.model_name
+            competitors = (model.objects.filter(competition=competition)
+                           .only('name', 'number').order_by('number', 'pk'))
+            performances = {getattr(performance, owner + '_id'): performance
+                            for performance in Performance.objects
+                            .filter(**{owner + '__competition': competition, 'apparatus': apparatus})
+                            .prefetch_related('marks')}
+            formset = MarksFormSet(initial=[
+                dict(MarksForm.initial_marks(performances.get(competitor.pk)), id=competitor.pk)
+                for competitor in competitors])
+            listed = {competitor.pk: competitor for competitor in competitors}
+
+        if request.method == 'POST':
+            if formset.is_valid():
+                marks = {form.cleaned_data['id']: {name: form.cleaned_data[name]
+                                                   for name in scorer(rules).mark_names()}
+                         for form in formset}
+                try:
+                    count = enter_marks(competition, model, apparatus, marks)
+                except model.DoesNotExist as error:
+                    if as_json:
+                        return JsonResponse({'error': str(error)}, status=400)
+                    raise Http404(error)
+                if as_json:
+                    return JsonResponse({'saved': count})
+                self.message_user(request, 'Сохранены оценки %s участников' % count)
+                return redirect(request.path)
+            if as_json:
+                return JsonResponse({'errors': formset.errors}, status=400)
+            listed = {competitor.pk: competitor for competitor in model.objects.filter(
+                competition=competition).only('name', 'number')}
+
+        rows = [(listed.get(form['id'].value() and int(form['id'].value())), form) for form in formset]
+        context = dict(self.admin_site.each_context(request),
+                       title='Ввод оценок: %s (%s)' % (names[apparatus - 1], scorer(rules).rules),
+                       opts=self.model._meta,
+                       original=competition,
+                       formset=formset,
+                       rows=rows,
+                       kind=kind,
+                       choices=[('gymnast', i, name)
+                                for i, name in enumerate(competition.apparatus(Gymnast), 1)] +
+                               [('team', i, 'Команды: %s' % name)
+                                for i, name in enumerate(competition.apparatus(Team), 1)])
+        return TemplateResponse(request, 'admin/competitions/competition/enter_marks.html', context)
+
+    def import_view(self, request, object_id):
+        competition = get_object_or_404(Competition, pk=object_id)
+        if not self.has_change_permission(request, competition):
+            raise PermissionDenied
+        form = StartListForm(request.POST or None, request.FILES or None)
+        if form.is_valid():
+            upload = form.cleaned_data['file']
+            try:
+                counts = import_start_list(competition, upload, upload.name)
+            except StartListError as error:
+                for message in error.errors:
+                    form.add_error('file', message)
+            else:
+                self.message_user(request, 'Загружено: гимнасток %s, команд %s, членов команд %s' % (
+                    counts[Gymnast], counts[Team], counts[TeamGymnast]))
+                return redirect('admin:competitions_competition_change', competition.pk)
+        context = dict(self.admin_site.each_context(request),
+                       title='Загрузка стартового листа',
+                       opts=self.model._meta,
+                       original=competition,
+                       form=form)
+        return TemplateResponse(request, 'admin/competitions/competition/import_start_list.html', context)
+
+
+@receiver(post_save, sender=Competition)
+def touch_competition(sender, instance, **kwargs):
+    instance.touch()
+
+
+@receiver(post_save, sender=Competition)
+def rescore_on_rules_change(sender, instance, created, **kwargs):
+    # Смена правил посреди соревнования: один пакетный пересчёт вместо
+    # пересохранения каждой гимнастки
+    changed = instance.rules_changed()
+    if changed and not hooks.is_suspended():
+        instance.rescore(models=changed)
+    elif created:
+        instance.remember_rules()
 
 
 @receiver(post_save, sender=Gymnast)
 def make_rank_list_gymnast(sender, instance, created, **kwargs):
-    instance.competition.make_rank_list(instance)
+    if not hooks.postpone_rank(instance, created):
+        instance.update_rank(created)
+        instance.competition.touch()
+
+
+@receiver(post_delete, sender=Gymnast)
+def make_rank_list_gymnast_delete(sender, instance, **kwargs):
+    if not hooks.postpone_full_rank(instance):
+        instance.competition.make_rank_list(instance)
+        instance.competition.update_standings(sender, [instance.pk])
+        instance.competition.touch()
 
 
 @receiver(post_save, sender=Gymnast)
 def make_non_sorted_gymnasts_add(sender, instance, created, **kwargs):
-    if created:
+    if created and not hooks.postpone_unsortition(instance):
         instance.competition.unsortition_gymnast()
 
 
 @receiver(post_delete, sender=Gymnast)
 def make_non_sorted_gymnasts_delete(sender, instance, **kwargs):
-    instance.competition.unsortition_gymnast()
-
-
-@receiver(pre_save, sender=Gymnast)
-def calc_gymnast_results(sender, instance, **kwargs):
-    if (instance.v1d1 or instance.v1d2 or
-            instance.v1e1 or instance.v1e2 or instance.v1e3 or
-            instance.v1e4 or instance.v1e5 or
-            instance.v2d1 or instance.v2d2 or
-            instance.v2e1 or instance.v2e2 or instance.v2e3 or
-            instance.v2e4 or instance.v2e5 or
-            instance.v3d1 or instance.v3d2 or
-            instance.v3e1 or instance.v3e2 or instance.v3e3 or
-            instance.v3e4 or instance.v3e5 or
-            instance.v4d1 or instance.v4d2 or
-            instance.v4e1 or instance.v4e2 or instance.v4e3 or
-            instance.v4e4 or instance.v4e5):
-        instance.tv1d = instance.make_tv_d(instance.v1d1,
-                                           instance.v1d2)
-        instance.tv1e = instance.make_tv_e(instance.v1e1,
-                                           instance.v1e2,
-                                           instance.v1e3,
-                                           instance.v1e4,
-                                           instance.v1e5)
-        instance.tv2d = instance.make_tv_d(instance.v2d1,
-                                           instance.v2d2)
-        instance.tv2e = instance.make_tv_e(instance.v2e1,
-                                           instance.v2e2,
-                                           instance.v2e3,
-                                           instance.v2e4,
-                                           instance.v2e5)
-        instance.tv3d = instance.make_tv_d(instance.v3d1,
-                                           instance.v3d2)
-        instance.tv3e = instance.make_tv_e(instance.v3e1,
-                                           instance.v3e2,
-                                           instance.v3e3,
-                                           instance.v3e4,
-                                           instance.v3e5)
-        instance.tv4d = instance.make_tv_d(instance.v4d1,
-                                           instance.v4d2)
-        instance.tv4e = instance.make_tv_e(instance.v4e1,
-                                           instance.v4e2,
-                                           instance.v4e3,
-                                           instance.v4e4,
-                                           instance.v4e5)
-        instance.score1 = instance.calc_total_score(instance.tv1d,
-                                                    instance.tv1e)
-        instance.score2 = instance.calc_total_score(instance.tv2d,
-                                                    instance.tv2e)
-        instance.score3 = instance.calc_total_score(instance.tv3d,
-                                                    instance.tv3e)
-        instance.score4 = instance.calc_total_score(instance.tv4d,
-                                                    instance.tv4e)
-        instance.result1 = instance.calc_total_result(instance.score1,
-                                                      instance.pv1k)
-        instance.result2 = instance.calc_total_result(instance.score2,
-                                                      instance.pv2k)
-        instance.result3 = instance.calc_total_result(instance.score3,
-                                                      instance.pv3k)
-        instance.result4 = instance.calc_total_result(instance.score4,
-                                                      instance.pv4k)
-        instance.result = instance.calc_result(instance.result1,
-                                               instance.result2,
-                                               instance.result3,
-                                               instance.result4)
+    if not hooks.postpone_unsortition(instance):
+        instance.competition.unsortition_gymnast()
 
 
 @admin.register(Gymnast)
-class GymnastAdmin(admin.ModelAdmin):
+class GymnastAdmin(CompetitorAdmin):
     list_display = ['competition',
                     'name', 'year_of_birth', 'category', 'city', 'coach',
                     'number',
                     'rank',
                     ]
+    list_only = ('competition__title', 'name', 'year_of_birth', 'category', 'city', 'coach',
+                 'number', 'rank')
     list_display_links = ('name',)
-    list_filter = ['competition', 'number', 'category', 'city', ]
+    list_filter = ['competition', ('number', CachedValuesFieldListFilter), 'category',
+                   ('city', CachedValuesFieldListFilter), ]
     search_fields = ['name', ]
     fieldsets = [
         (None, {'fields': ['competition', ]}),
@@ -155,122 +455,63 @@ class GymnastAdmin(admin.ModelAdmin):
                 'result',
                 # 'rank_position',
                 'rank',
+                'category_rank',
+                'age_rank',
             )],
         }),
-        ('Результаты', {
-            'fields': [],
-            # 'classes': ('wide', 'extrapretty'),
-             }),
-        ('Обруч', {
-            'classes': ('collapse',),
-            'fields': [
-                ('v1d1', 'v1d2',),
-                ('v1e1', 'v1e2', 'v1e3', 'v1e4', 'v1e5',),
-                ('tv1d', 'tv1e', 'score1',),
-                ('pv1k', 'result1',),
-                ]}),
-        ('Мяч', {
-            'classes': ('collapse',),
-            'fields': [
-                ('v2d1', 'v2d2',),
-                ('v2e1', 'v2e2', 'v2e3', 'v2e4', 'v2e5',),
-                ('tv2d', 'tv2e', 'score2',),
-                ('pv2k', 'result2',),
-                ]}),
-        ('Булава', {
-            'classes': ('collapse',),
-            'fields': [
-                ('v3d1', 'v3d2',),
-                ('v3e1', 'v3e2', 'v3e3', 'v3e4', 'v3e5',),
-                ('tv3d', 'tv3e', 'score3',),
-                ('pv3k', 'result3',),
-                ]}),
-        ('Лента', {
-            'classes': ('collapse',),
-            'fields': [
-                ('v4d1', 'v4d2',),
-                ('v4e1', 'v4e2', 'v4e3', 'v4e4', 'v4e5',),
-                ('tv4d', 'tv4e', 'score4',),
-                ('pv4k', 'result4',),
-                ]}),
     ]
     formfield_overrides = {
-        models.FloatField: {'widget': NumberInput(attrs={'size': '5', 'min': '0', 'max': '10', 'step': '0.1'})},
         models.CharField: {'widget': TextInput(attrs={'size': '15'})},
     }
     readonly_fields = (
-        'tv1d', 'tv1e',
-        'tv2d', 'tv2e',
-        'tv3d', 'tv3e',
-        'tv4d', 'tv4e',
-        'score1', 'score2', 'score3', 'score4',
-        'result1', 'result2', 'result3', 'result4',
         'result',
         # 'rank_position',
         'rank',
+        'category_rank',
+        'age_rank',
         'number',
     )
+    inlines = [PerformanceInline, ]
 
 
 @receiver(post_save, sender=Team)
 def make_rank_list_team(sender, instance, created, **kwargs):
-    instance.competition.make_rank_list(instance)
+    if not hooks.postpone_rank(instance, created):
+        instance.update_rank(created)
+        instance.competition.touch()
+
+
+@receiver(post_delete, sender=Team)
+def make_rank_list_team_delete(sender, instance, **kwargs):
+    if not hooks.postpone_full_rank(instance):
+        instance.competition.make_rank_list(instance)
+        instance.competition.update_standings(sender, [instance.pk])
+        instance.competition.touch()
 
 
 @receiver(post_save, sender=Team)
 def make_non_sorted_teams_add(sender, instance, created, **kwargs):
-    if created:
+    if created and not hooks.postpone_unsortition(instance):
         instance.competition.unsortition_team()
 
 
 @receiver(post_delete, sender=Team)
 def make_non_sorted_teams_delete(sender, instance, **kwargs):
-    instance.competition.unsortition_team()
-
-
-@receiver(pre_save, sender=Team)
-def calc_team_results(sender, instance, **kwargs):
-    if (instance.v1d1 or instance.v1d2 or
-            instance.v1e1 or instance.v1e2 or instance.v1e3 or
-            instance.v1e4 or instance.v1e5 or
-            instance.v2d1 or instance.v2d2 or
-            instance.v2e1 or instance.v2e2 or instance.v2e3 or
-            instance.v2e4 or instance.v2e5):
-        instance.tv1d = instance.make_tv_d(instance.v1d1,
-                                           instance.v1d2)
-        instance.tv1e = instance.make_tv_e(instance.v1e1,
-                                           instance.v1e2,
-                                           instance.v1e3,
-                                           instance.v1e4,
-                                           instance.v1e5)
-        instance.tv2d = instance.make_tv_d(instance.v2d1,
-                                           instance.v2d2)
-        instance.tv2e = instance.make_tv_e(instance.v2e1,
-                                           instance.v2e2,
-                                           instance.v2e3,
-                                           instance.v2e4,
-                                           instance.v2e5)
-        instance.score1 = instance.calc_total_score(instance.tv1d,
-                                                    instance.tv1e)
-        instance.score2 = instance.calc_total_score(instance.tv2d,
-                                                    instance.tv2e)
-        instance.result1 = instance.calc_total_result(instance.score1,
-                                                      instance.pv1k)
-        instance.result2 = instance.calc_total_result(instance.score2,
-                                                      instance.pv2k)
-        instance.result = instance.calc_result(instance.result1,
-                                               instance.result2)
+    if not hooks.postpone_unsortition(instance):
+        instance.competition.unsortition_team()
 
 
 @admin.register(Team)
-class TeamAdmin(admin.ModelAdmin):
+class TeamAdmin(CompetitorAdmin):
     list_display = ['competition',
                     'name', 'city', 'coach',
                     'number',
                     'rank',
                     ]
+    list_only = ('competition__title', 'name', 'city', 'coach', 'number', 'rank')
     list_display_links = ('name',)
-    list_filter = ['competition', 'number', 'city', ]
+    list_filter = ['competition', ('number', CachedValuesFieldListFilter),
+                   ('city', CachedValuesFieldListFilter), ]
     search_fields = ['name', ]
     fieldsets = [
         (None, {'fields': ['competition', ]}),
@@ -283,41 +524,16 @@ class TeamAdmin(admin.ModelAdmin):
                 'rank',
             )],
         }),
-        ('Результаты', {
-            'fields': [],
-            # 'classes': ('wide', 'extrapretty'),
-             }),
-        ('1 вид', {
-            'classes': ('collapse',),
-            'fields': [
-                ('v1d1', 'v1d2',),
-                ('v1e1', 'v1e2', 'v1e3', 'v1e4', 'v1e5',),
-                ('tv1d', 'tv1e', 'score1',),
-                ('pv1k', 'result1',),
-                ]}),
-        ('2 вид', {
-            'classes': ('collapse',),
-            'fields': [
-                ('v2d1', 'v2d2',),
-                ('v2e1', 'v2e2', 'v2e3', 'v2e4', 'v2e5',),
-                ('tv2d', 'tv2e', 'score2',),
-                ('pv2k', 'result2',),
-                ]}),
     ]
     formfield_overrides = {
-        models.FloatField: {'widget': NumberInput(attrs={'size': '5', 'min': '0', 'max': '10', 'step': '0.1'})},
         models.CharField: {'widget': TextInput(attrs={'size': '15'})},
         # models.TextField: {'widget': Textarea(attrs={'rows': 4, 'cols': 40})},
     }
     readonly_fields = (
-        'tv1d', 'tv1e',
-        'tv2d', 'tv2e',
-        'score1', 'score2',
-        'result1', 'result2',
         'result',
         # 'rank_position',
         'rank',
         'number',
     )
     # ordering = ('rank', )
-    inlines = [TeamGymnastInline, ]
+    inlines = [PerformanceInline, TeamGymnastInline, ]
@@ -0,0 +1,262 @@
+"""Read-only JSON API для табло и мобильного приложения.
+
+Списки отдаются страницами с курсором (keyset pagination): следующая
+страница выбирается условием по полям сортировки, а не OFFSET, поэтому
+стоит одинаково на любой глубине. Параметр fields= выбирает поля, без него
+отдаётся компактный набор без выступлений по видам (поле performances).
+Ответы кэшируются по версии результатов соревнования и отдают ETag для
+условных запросов. Участники архивного соревнования отдаются из Standing
+в том же виде, id -- прежний id гимнастки или команды.
+"""
+import base64
+import hashlib
+import json
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, F, Max, Prefetch, Q
+from django.http import Http404, HttpResponse, JsonResponse
+from django.utils.cache import get_conditional_response
+from django.views.generic import View
+
+from .models import ArchivedPerformance, Competition, Gymnast, Performance, Standing, Team, TeamGymnast
+from .scoring import from_thousandths
+from .views import results_state, results_version
+
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+class ApiError(Exception):
+    pass
+
+
+def model_fields(model):
+    return tuple(field.name for field in model._meta.concrete_fields
+                 if not field.is_relation and not field.primary_key)
+
+
+def encode_cursor(values):
+    data = json.dumps(values, cls=DjangoJSONEncoder, separators=(',', ':'))
+    return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor, size):
+    try:
+        values = json.loads(base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4)).decode())
+    except ValueError:
+        raise ApiError('Неверный курсор')
+    if not isinstance(values, list) or len(values) != size:
+        raise ApiError('Неверный курсор')
+    return values
+
+
+def after(keys, values):
+    """Условие "строго после строки values" для сортировки keys.
+    NULL при любом направлении сортировки идут последними."""
+    condition = Q(pk__in=[])
+    equal = Q()
+    for (name, descending), value in zip(keys, values):
+        if value is not None:
+            lookup = '%s__%s' % (name, 'lt' if descending else 'gt')
+            condition |= equal & (Q(**{lookup: value}) | Q(**{name + '__isnull': True}))
+            equal &= Q(**{name: value})
+        else:
+            equal &= Q(**{name + '__isnull': True})
+    return condition
+
+
+class ApiView(View):
+    model = None
+    default_fields = ()
+    extra_fields = ()
+    orderings = {'id': ()}
+    default_ordering = 'id'
+
+    def get(self, request, *args, **kwargs):
+        try:
+            version = self.get_version(**kwargs)
+            etag = '"api.%s.%s"' % (version, hashlib.md5(request.get_full_path().encode()).hexdigest())
+            response = get_conditional_response(request, etag=etag)
+            if response is None:
+                key = 'competitions:api:%s' % etag.strip('"')
+                content = cache.get(key)
+                if content is None:
+                    content = json.dumps(self.get_data(request, **kwargs), cls=DjangoJSONEncoder,
+                                         ensure_ascii=False)
+                    cache.set(key, content, settings.RESULTS_CACHE_TIMEOUT)
+                response = HttpResponse(content, content_type='application/json')
+        except ApiError as error:
+            return JsonResponse({'error': str(error)}, status=400)
+        except Http404 as error:
+            return JsonResponse({'error': str(error)}, status=404)
+        response['ETag'] = etag
+        return response
+
+    def get_version(self, **kwargs):
+        raise NotImplementedError
+
+    def get_queryset(self, **kwargs):
+        return self.model.objects.all()
+
+    def get_fields(self, request):
+        if 'fields' not in request.GET:
+            return self.default_fields
+        fields = [name for name in request.GET['fields'].split(',') if name]
+        allowed = ('id',) + model_fields(self.model) + self.extra_fields
+        unknown = [name for name in fields if name not in allowed]
+        if unknown:
+            raise ApiError('Неизвестные поля: %s' % ', '.join(unknown))
+        return fields
+
+    def get_ordering(self, request):
+        name = request.GET.get('ordering', self.default_ordering)
+        if name not in self.orderings:
+            raise ApiError('Сортировка возможна по: %s' % ', '.join(self.orderings))
+        keys = [(key.lstrip('-'), key.startswith('-')) for key in self.orderings[name]]
+        return keys + [('pk', False)]
+
+    def get_limit(self, request):
+        try:
+            limit = int(request.GET.get('limit', PAGE_SIZE))
+        except ValueError:
+            raise ApiError('limit должен быть числом')
+        return max(1, min(limit, MAX_PAGE_SIZE))
+
+    def get_data(self, request, **kwargs):
+        fields = self.get_fields(request)
+        keys = self.get_ordering(request)
+        limit = self.get_limit(request)
+        queryset = self.get_queryset(**kwargs)
+        columns = self.get_columns(fields)
+        queryset = (queryset
+                    .only(*(columns + [name for name, descending in keys if name != 'pk']))
+                    .order_by(*(F(name).desc(nulls_last=True) if descending
+                                else F(name).asc(nulls_last=True) for name, descending in keys)))
+        if 'cursor' in request.GET:
+            queryset = queryset.filter(after(keys, decode_cursor(request.GET['cursor'], len(keys))))
+        queryset = self.prepare(queryset, fields)
+
+        rows = list(queryset[:limit + 1])
+        data = {'results': [self.serialize(row, fields) for row in rows[:limit]], 'next': None}
+        if len(rows) > limit:
+            last = rows[limit - 1]
+            query = request.GET.copy()
+            query['cursor'] = encode_cursor([getattr(last, name) for name, descending in keys])
+            data['next'] = request.build_absolute_uri('?' + query.urlencode())
+        return data
+
+    def get_columns(self, fields):
+        return [name for name in fields if name not in ('id',) + self.extra_fields]
+
+    def prepare(self, queryset, fields):
+        return queryset
+
+    def serialize(self, instance, fields):
+        return {name: getattr(instance, 'pk' if name == 'id' else name) for name in fields}
+
+
+class CompetitionListApi(ApiView):
+    model = Competition
+    default_fields = ('id', 'title', 'slug', 'place', 'start', 'end', 'version', 'modified')
+    orderings = {'id': (), 'start': ('-start',), 'title': ('title',)}
+
+    def get_version(self, **kwargs):
+        stats = Competition.objects.aggregate(count=Count('pk'), modified=Max('modified'))
+        modified = stats['modified'].timestamp() if stats['modified'] else 0
+        return '%s.%s' % (stats['count'], int(modified * 1000000))
+
+
+class CompetitionApi(ApiView):
+    model = Competition
+
+    def get_version(self, pk, **kwargs):
+        return results_version(pk)[0]
+
+    def get_data(self, request, pk, **kwargs):
+        fields = self.get_fields(request) if 'fields' in request.GET else ('id',) + model_fields(Competition)
+        return self.serialize(Competition.objects.only(*set(fields) - {'id'}).get(pk=pk), fields)
+
+
+class CompetitorListApi(ApiView):
+    extra_fields = ('performances',)
+    orderings = {
+        'id': (),
+        'rank': ('rank', 'name'),
+        'result': ('-result', 'name'),
+        'number': ('number',),
+        'name': ('name',),
+    }
+
+    def get_version(self, pk, **kwargs):
+        version, modified, self.archived = results_state(pk)
+        return version
+
+    def get_queryset(self, pk, **kwargs):
+        if self.archived:
+            return Standing.objects.filter(competition_id=pk, kind=self.model._meta.model_name)
+        return self.model.objects.filter(competition_id=pk)
+
+    def get_columns(self, fields):
+        columns = super().get_columns(fields)
+        if self.archived:
+            columns += [column for name, column in (('id', 'competitor_id'), ('members', 'members'))
+                        if name in fields]
+        return columns
+
+    def prepare(self, queryset, fields):
+        if 'performances' in fields:
+            if self.archived:
+                model, owner = ArchivedPerformance, 'standing'
+            else:
+                model, owner = Performance, self.model._meta.model_name
+            performances = (model.objects.only(owner, 'apparatus', 'penalty', *Performance.derived_fields)
+                            .order_by('apparatus'))
+            queryset = queryset.prefetch_related(Prefetch('performances', queryset=performances))
+        return queryset
+
+    def serialize(self, instance, fields):
+        data = super().serialize(instance, [name for name in fields if name not in self.extra_fields])
+        if 'id' in data and self.archived:
+            data['id'] = instance.competitor_id
+        if 'performances' in fields:
+            data['performances'] = [
+                dict([('apparatus', performance.apparatus),
+                      ('penalty', from_thousandths(performance.penalty))] +
+                     [(name, getattr(performance, name)) for name in Performance.derived_fields])
+                for performance in instance.performances.all()]
+        return data
+
+
+class GymnastListApi(CompetitorListApi):
+    model = Gymnast
+    default_fields = ('id', 'name', 'year_of_birth', 'category', 'city', 'number', 'result', 'rank',
+                      'category_rank', 'age_rank')
+    # зачёты по разрядам и годам рождения: группа за группой, внутри -- по месту
+    orderings = dict(CompetitorListApi.orderings,
+                     category_rank=('category', 'category_rank', 'name'),
+                     age_rank=('year_of_birth', 'age_rank', 'name'))
+
+
+class TeamListApi(CompetitorListApi):
+    model = Team
+    default_fields = ('id', 'name', 'city', 'number', 'result', 'rank', 'members')
+    extra_fields = CompetitorListApi.extra_fields + ('members',)
+
+    def prepare(self, queryset, fields):
+        queryset = super().prepare(queryset, fields)
+        if 'members' in fields and not self.archived:
+            members = TeamGymnast.objects.only('team_id', 'name').order_by('pk')
+            queryset = queryset.prefetch_related(Prefetch('team_gymnasts', queryset=members))
+        return queryset
+
+    def serialize(self, instance, fields):
+        data = super().serialize(instance, fields)
+        if 'members' in fields and self.archived:
+            # у членов команды в архиве нет своих строк и id
+            data['members'] = [{'id': None, 'name': name} for name in instance.member_names()]
+        elif 'members' in fields:
+            data['members'] = [{'id': member.pk, 'name': member.name}
+                               for member in instance.team_gymnasts.all()]
+        return data
@@ -0,0 +1,69 @@
+"""Архив завершённых соревнований (см. команду archive_competitions).
+
+От участника архивного соревнования остаётся его строка таблицы результатов
+Standing с готовыми местом, итогом и суммами по видам, выступления и оценки
+судей переносятся в ArchivedPerformance и ArchivedMark. Из рабочих таблиц
+(Gymnast, Team, TeamGymnast, Performance, Mark) соревнование удаляется, и в
+них остаются только идущие соревнования. API архивного соревнования читает
+Standing вместо участников (Competition.archived).
+"""
+from django.db import transaction
+
+from . import hooks
+from .models import (ArchivedMark, ArchivedPerformance, Competition, CompetitionArchived, Gymnast,
+                     Performance, Standing, Team)
+
+KINDS = ((Gymnast, 'gymnast'), (Team, 'team'))
+
+
+def archive_before(date):
+    """Соревнования, закончившиеся раньше date и ещё не перенесённые в архив."""
+    return Competition.objects.filter(end__lt=date, archived=False).order_by('end', 'pk')
+
+
+def _archive_chunk(competition, model, kind, pks):
+    competitors = list(model.objects.filter(pk__in=pks).order_by('pk')
+                       .prefetch_related('performances__marks'))
+    standings = dict(Standing.objects.filter(competition=competition, kind=kind, competitor_id__in=pks)
+                     .values_list('competitor_id', 'pk'))
+
+    performances = [(performance, ArchivedPerformance(
+        standing_id=standings[competitor.pk], apparatus=performance.apparatus,
+        penalty=performance.penalty,
+        **{name: getattr(performance, name) for name in Performance.derived_fields}))
+        for competitor in competitors for performance in competitor.performances.all()]
+    ArchivedPerformance.objects.bulk_create([archived for performance, archived in performances])
+    # bulk_create в SQLite не возвращает ключи, строки выбираются заново
+    archived = dict(((standing, apparatus), pk) for pk, standing, apparatus in ArchivedPerformance.objects
+                    .filter(standing_id__in=standings.values())
+                    .values_list('pk', 'standing_id', 'apparatus'))
+    ArchivedMark.objects.bulk_create([
+        ArchivedMark(performance_id=archived[item.standing_id, item.apparatus],
+                     panel=mark.panel, slot=mark.slot, value=mark.value)
+        for performance, item in performances for mark in performance.marks.all()])
+
+    # выступления, оценки и члены команд удаляются каскадом
+    model.objects.filter(pk__in=pks).delete()
+    return len(competitors)
+
+
+def archive_competition(competition, chunk_size=2000):
+    """Переносит участников соревнования в архив; возвращает {модель: число
+    участников}. Участники читаются и удаляются порциями по chunk_size."""
+    counts = {Gymnast: 0, Team: 0}
+    with transaction.atomic(), hooks.suspended():
+        try:
+            competition.lock()
+        except CompetitionArchived:
+            return counts
+        for model, kind in KINDS:
+            # таблица результатов становится архивом, поэтому сверяется целиком
+            competition.update_standings(model, chunk_size=chunk_size)
+            pks = list(model.objects.filter(competition=competition).order_by('pk')
+                       .values_list('pk', flat=True))
+            for start in range(0, len(pks), chunk_size):
+                counts[model] += _archive_chunk(competition, model, kind, pks[start:start + chunk_size])
+        competition.archived = True
+        # post_save соревнования меняет версию результатов, кэш страниц сбрасывается
+        competition.save(update_fields=['archived'])
+    return counts
@@ -0,0 +1,476 @@
+import datetime
+import http.client
+import multiprocessing
+import random
+import shutil
+import statistics
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+from contextlib import ExitStack, contextmanager
+from decimal import Decimal
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.servers.basehttp import ThreadedWSGIServer
+from django.db import DEFAULT_DB_ALIAS, OperationalError, connection, connections
+from django.test import Client
+from django.test.testcases import LiveServerThread, QuietWSGIRequestHandler
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from .choices import CATEGORY
+from .live import broker
+from .models import Competition, Gymnast, Mark, Performance, Team, TeamGymnast
+from .profiling import QueryCounter
+from .scoring import enter_marks, rescore
+from rhythmicgymnastics.databases import SQLITE_OPTIONS
+
+SUITES = OrderedDict()
+
+
+def suite(name):
+    def register(func):
+        SUITES[name] = func
+        return func
+    return register
+
+
+def measure(func, *args, **kwargs):
+    counter = QueryCounter()
+    with connection.execute_wrapper(counter):
+        started = time.perf_counter()
+        func(*args, **kwargs)
+        seconds = time.perf_counter() - started
+    return counter.count, seconds
+
+
+def _normal(rnd, low, high):
+    # 99.7% значений внутри [low, high], остальные прижаты к краям
+    return min(max(rnd.gauss((low + high) / 2, (high - low) / 6), low), high)
+
+
+# Распределения оценок судей: функция (rnd, low, high) -> оценка или None
+DISTRIBUTIONS = OrderedDict([
+    ('uniform', lambda rnd, low, high: rnd.uniform(low, high)),
+    ('normal', _normal),
+    # три возможных значения: много одинаковых итогов и дележа мест
+    ('ties', lambda rnd, low, high: rnd.choice([low, (low + high) / 2, high])),
+    # половина оценок ещё не выставлена
+    ('sparse', lambda rnd, low, high: rnd.uniform(low, high) if rnd.random() < 0.5 else None),
+])
+RANGES = {(Mark.D, 1): (2, 6), (Mark.D, 2): (1, 4)}
+E_RANGE = (0.5, 3)
+
+
+def random_marks(rnd, competition, model, distribution='uniform'):
+    """Выступления во всех видах программы со случайными оценками судей для
+    всех участников model соревнования competition."""
+    owner = model._meta.model_name
+    draw = DISTRIBUTIONS[distribution]
+    apparatus = range(1, len(competition.apparatus(model)) + 1)
+    Performance.objects.bulk_create(
+        Performance(apparatus=a, penalty=rnd.choice([None, None, None, 300]), **{owner + '_id': pk})
+        for pk in model.objects.filter(competition=competition).values_list('pk', flat=True)
+        for a in apparatus)
+    marks = []
+    for performance in (Performance.objects.filter(**{owner + '__competition': competition})
+                        .values_list('pk', flat=True).iterator()):
+        for panel, slot in [(Mark.D, 1), (Mark.D, 2)] + [(Mark.E, i) for i in range(1, 6)]:
+            value = draw(rnd, *RANGES.get((panel, slot), E_RANGE))
+            if value is not None:
+                # судьи ставят оценки с шагом 0.1 балла
+                marks.append(Mark(performance_id=performance, panel=panel, slot=slot,
+                                  value=round(value * 10) * 100))
+    Mark.objects.bulk_create(marks)
+
+
+def make_competition(gymnasts, teams=None, seed=0, marks=None):
+    """Синтетическое соревнование: gymnasts гимнасток и teams команд (по
+    умолчанию пятая часть от gymnasts) по 3-5 человек. При marks -- имени
+    распределения из DISTRIBUTIONS -- у всех выставлены оценки судей, и итоги
+    посчитаны по ним, иначе итоги случайны. Одинаковый seed даёт те же данные."""
+    rnd = random.Random(seed)
+    teams = gymnasts // 5 if teams is None else teams
+    today = datetime.date.today()
+    slug = 'bench-%s-%s-%s' % (gymnasts, seed, Competition.objects.count())
+    competition = Competition.objects.create(title=slug, slug=slug, place='bench',
+                                             start=today, end=today)
+    # Шаг 0.05 даёт заметное число одинаковых итогов, т.е. делёж мест
+    Gymnast.objects.bulk_create(
+        Gymnast(competition=competition,
+                name='Гимнастка %s' % i,
+                year_of_birth=rnd.randint(2005, 2015),
+                category=rnd.choice(CATEGORY)[0],
+                city='Город %s' % rnd.randint(1, 20),
+                result=Decimal(rnd.randint(0, 1200)) / 20)
+        for i in range(gymnasts))
+    Team.objects.bulk_create(
+        Team(competition=competition, name='Команда %s' % i, city='Город %s' % rnd.randint(1, 20),
+             result=Decimal(rnd.randint(0, 600)) / 20)
+        for i in range(teams))
+    TeamGymnast.objects.bulk_create(
+        TeamGymnast(team_id=pk, name='Гимнастка %s-%s' % (pk, i))
+        for pk in competition.teams.values_list('pk', flat=True) for i in range(rnd.randint(3, 5)))
+    if marks:
+        for model in (Gymnast, Team):
+            random_marks(rnd, competition, model, marks)
+            rescore(model.objects.filter(competition=competition))
+    return competition
+
+
+@suite('ranking')
+def bench_ranking(sizes, teams=None, seed=0, **dataset):
+    rows = []
+    for size in sizes:
+        competition = make_competition(size, teams, seed)
+        queries, seconds = measure(competition.make_rank_list, Gymnast())
+        rows.append(OrderedDict([('competitors', size),
+                                 ('queries', queries),
+                                 ('seconds', seconds)]))
+    return rows
+
+
+@suite('sortition')
+def bench_sortition(sizes, teams=None, seed=0, **dataset):
+    rows = []
+    for size in sizes:
+        competition = make_competition(size, teams, seed)
+        queries, seconds = measure(competition.sortition, seed=1)
+        rows.append(OrderedDict([('competitors', size),
+                                 ('queries', queries),
+                                 ('seconds', seconds)]))
+    return rows
+
+
+@suite('scoring')
+def bench_scoring(sizes, teams=None, seed=0, marks='uniform', **dataset):
+    """Пересчёт по одному участнику (update_result, как при сохранении в
+    админке) против пакетного rescore."""
+    rows = []
+    for size in sizes:
+        competition = make_competition(size, 0, seed, marks or 'uniform')
+        gymnasts = list(competition.gymnasts.all())
+        per_row_queries, per_row = measure(lambda: [gymnast.update_result() for gymnast in gymnasts])
+        queries, seconds = measure(rescore, competition.gymnasts.all())
+        rows.append(OrderedDict([('competitors', size),
+                                 ('queries', queries),
+                                 ('seconds', seconds),
+                                 ('per_row_queries', per_row_queries),
+                                 ('per_row_seconds', per_row)]))
+    return rows
+
+
+def _client():
+    client = Client(SERVER_NAME='localhost')
+    user = User.objects.filter(username='bench').first()
+    if user is None:
+        user = User.objects.create_superuser('bench', 'bench@example.com', 'bench')
+    client.force_login(user)
+    return client
+
+
+def _get(client, url):
+    response = client.get(url)
+    if response.status_code != 200:
+        raise AssertionError('%s: HTTP %s' % (url, response.status_code))
+    if response.streaming:
+        b''.join(response.streaming_content)
+
+
+@suite('pages')
+def bench_pages(sizes, teams=None, seed=0, marks='uniform', **dataset):
+    """Публичные страницы соревнования: без кэша (сразу после изменения
+    результатов) и из кэша."""
+    rows = []
+    client = _client()
+    for size in sizes:
+        competition = make_competition(size, teams, seed, marks)
+        competition.make_rank_list(Gymnast())
+        competition.make_rank_list(Team())
+        competition.update_standings(Gymnast)
+        competition.update_standings(Team)
+        for name in ('detail', 'rank', 'protocol'):
+            url = reverse('competitions:%s' % name, args=[competition.pk])
+            competition.touch()
+            cold = measure(_get, client, url)
+            warm = measure(_get, client, url)
+            rows.append(OrderedDict([('competitors', size),
+                                     ('page', name),
+                                     ('queries', cold[0]),
+                                     ('seconds', cold[1]),
+                                     ('cached_queries', warm[0]),
+                                     ('cached_seconds', warm[1])]))
+    return rows
+
+
+@suite('admin')
+def bench_admin(sizes, teams=None, seed=0, **dataset):
+    """Списки гимнасток и команд в админке: все и отфильтрованные по соревнованию."""
+    rows = []
+    client = _client()
+    for size in sizes:
+        competition = make_competition(size, teams, seed)
+        competition.make_rank_list(Gymnast())
+        for model in (Gymnast, Team):
+            url = reverse('admin:competitions_%s_changelist' % model._meta.model_name)
+            for query in ('', '?competition__id__exact=%s' % competition.pk):
+                queries, seconds = measure(_get, client, url + query)
+                rows.append(OrderedDict([('competitors', size),
+                                         ('changelist', model._meta.model_name),
+                                         ('filtered', bool(query)),
+                                         ('queries', queries),
+                                         ('seconds', seconds)]))
+    return rows
+
+
+# Выборки, которым служат составные индексы участников (см. competitor_indexes)
+INDEXED_QUERIES = OrderedDict([
+    ('rank', lambda competition: Gymnast.objects.filter(competition=competition, rank__isnull=False)
+                                                .order_by('rank', 'name')),
+    ('protocol', lambda competition: Gymnast.objects.filter(competition=competition)
+                                                    .order_by('-result', 'name')),
+    ('rank_window', lambda competition: Gymnast.objects.filter(competition=competition,
+                                                               result__gte=20, result__lt=30)),
+    ('changelist', lambda competition: Gymnast.objects.filter(competition=competition, number=1)
+                                                      .order_by('-pk')),
+    ('search', lambda competition: Gymnast.objects.filter(competition=competition,
+                                                          name='Гимнастка 1')),
+])
+
+
+@contextmanager
+def dropped_indexes(model):
+    """Временно удаляет индексы из Meta.indexes модели."""
+    with connection.schema_editor() as editor:
+        for index in model._meta.indexes:
+            editor.remove_index(model, index)
+    try:
+        yield
+    finally:
+        with connection.schema_editor() as editor:
+            for index in model._meta.indexes:
+                editor.add_index(model, index)
+
+
+def _plan(queryset):
+    return ' / '.join(line.strip() for line in queryset.explain().splitlines())
+
+
+@suite('indexes')
+def bench_indexes(sizes, seed=0, competitions=100, repeat=5, **dataset):
+    """sizes -- общее число гимнасток, поровну в competitions соревнованиях
+    (для замера на 100 тыс. участников: --sizes 100000)."""
+    rows = []
+    for size in sizes:
+        field = [make_competition(max(size // competitions, 1), 0, seed + i)
+                 for i in range(competitions)]
+        for competition in field:
+            competition.make_rank_list(Gymnast())
+        competition = field[len(field) // 2]
+        for indexed in (False, True):
+            with (ExitStack() if indexed else dropped_indexes(Gymnast)):
+                for name, query in INDEXED_QUERIES.items():
+                    queryset = query(competition)
+                    timings = []
+                    for i in range(repeat):
+                        started = time.perf_counter()
+                        list(queryset.all())
+                        timings.append(time.perf_counter() - started)
+                    rows.append(OrderedDict([('competitors', size),
+                                             ('indexes', 'on' if indexed else 'off'),
+                                             ('query', name),
+                                             ('seconds', min(timings)),
+                                             ('plan', _plan(queryset))]))
+    return rows
+
+
+class _LiveServer(ThreadedWSGIServer):
+    # все зрители подключаются разом
+    request_queue_size = 1024
+
+
+class _LiveServerThread(LiveServerThread):
+
+    def _create_server(self):
+        return _LiveServer((self.host, self.port), QuietWSGIRequestHandler, allow_reuse_address=False)
+
+
+def _watch(port, path, ready, received, expected):
+    client = http.client.HTTPConnection('localhost', port, timeout=30)
+    client.request('GET', path)
+    response = client.getresponse()
+    seq, event = None, None
+    try:
+        while len(received) < expected:
+            line = response.readline().decode()
+            if not line:
+                break
+            if line.startswith('id: '):
+                seq = int(line[4:])
+            elif line.startswith('event: '):
+                event = line[7:].strip()
+            elif line == '\n' and event:
+                if event == 'standings':
+                    ready.release()
+                else:
+                    received[seq] = time.perf_counter()
+                event = None
+    finally:
+        client.close()
+
+
+@suite('live')
+def bench_live(sizes, seed=0, changes=10, **dataset):
+    """sizes -- число одновременно подключённых зрителей трансляции."""
+    rows = []
+    server = _LiveServerThread('localhost', lambda handler: handler)
+    server.daemon = True
+    server.start()
+    server.is_ready.wait()
+    try:
+        for size in sizes:
+            competition = make_competition(50, 0, seed)
+            competition.make_rank_list(Gymnast())
+            path = reverse('competitions:live', args=[competition.pk])
+            ready = threading.Semaphore(0)
+            received = [{} for i in range(size)]
+            clients = [threading.Thread(target=_watch, daemon=True,
+                                        args=(server.port, path, ready, received[i], changes))
+                       for i in range(size)]
+            for client in clients:
+                client.start()
+            for client in clients:
+                ready.acquire(timeout=30)
+
+            published = {}
+            gymnasts = list(competition.gymnasts.all())
+            with CaptureQueriesContext(connection) as queries:
+                for i in range(changes):
+                    gymnast = gymnasts[i % len(gymnasts)]
+                    gymnast.result += 1
+                    started = time.perf_counter()
+                    gymnast.save()
+                    published[broker.channels[competition.pk].seq] = started
+                    time.sleep(0.05)
+            for client in clients:
+                client.join(timeout=30)
+
+            latencies = [at - published[seq] for events in received for seq, at in events.items()]
+            rows.append(OrderedDict([
+                ('clients', size),
+                ('changes', changes),
+                ('delivered', len(latencies)),
+                ('standings_queries', sum('UNION ALL' in q['sql'] for q in queries)),
+                ('queries_per_change', len(queries) / changes),
+                ('mean_latency', statistics.mean(latencies) if latencies else float('nan')),
+                ('max_latency', max(latencies) if latencies else float('nan')),
+            ]))
+    finally:
+        server.terminate()
+    return rows
+
+
+# Одна и та же файловая БД SQLite с настройками по умолчанию и с настройками
+# settings_production; при запуске с другой БД (PostgreSQL) -- ещё и она сама
+DATABASE_MODES = OrderedDict([
+    ('sqlite', {'ENGINE': 'django.db.backends.sqlite3', 'OPTIONS': {}, 'CONN_MAX_AGE': 0}),
+    ('sqlite-wal', {'ENGINE': 'rhythmicgymnastics.sqlite3', 'OPTIONS': SQLITE_OPTIONS,
+                    'CONN_MAX_AGE': 600}),
+])
+
+
+@contextmanager
+def _database(mode):
+    """Подменяет тестовую БД временным файлом с настройками mode; в общей
+    памяти, как тестовая БД SQLite, одновременная запись ничего не покажет."""
+    if mode not in DATABASE_MODES:
+        yield
+        return
+    original, settings_dict = connections[DEFAULT_DB_ALIAS], connections.databases[DEFAULT_DB_ALIAS]
+    directory = tempfile.mkdtemp()
+    connections.databases[DEFAULT_DB_ALIAS] = dict(settings_dict, NAME=directory + '/bench.sqlite3',
+                                                   **DATABASE_MODES[mode])
+    del connections[DEFAULT_DB_ALIAS]
+    try:
+        call_command('migrate', verbosity=0)
+        yield
+    finally:
+        connections[DEFAULT_DB_ALIAS].close()
+        connections.databases[DEFAULT_DB_ALIAS] = settings_dict
+        connections[DEFAULT_DB_ALIAS] = original
+        shutil.rmtree(directory)
+
+
+def _worker(kind, step, deadline, queue):
+    # Отдельный процесс, как воркер сервера: открывает своё соединение с БД,
+    # а не пользуется унаследованным от родителя
+    del connections[DEFAULT_DB_ALIAS]
+    done, errors, slowest = 0, 0, 0.0
+    try:
+        while time.time() < deadline:
+            started = time.perf_counter()
+            try:
+                step()
+            except OperationalError:
+                errors += 1
+            else:
+                done += 1
+                slowest = max(slowest, time.perf_counter() - started)
+    finally:
+        connections[DEFAULT_DB_ALIAS].close()
+        queue.put((kind, done, errors, slowest))
+
+
+@suite('concurrency')
+def bench_concurrency(sizes, seed=0, marks='uniform', writers=2, readers=4, seconds=3, **dataset):
+    """Одновременные ввод оценок (writers процессов, enter_marks) и чтение
+    сводного протокола (readers процессов, без кэша: каждая запись меняет
+    версию результатов) в течение seconds секунд."""
+    rows = []
+    modes = list(DATABASE_MODES)
+    if connection.vendor != 'sqlite':
+        modes.append(connection.vendor)
+    context = multiprocessing.get_context('fork')
+    for mode in modes:
+        for size in sizes:
+            with _database(mode):
+                competition = make_competition(size, 0, seed, marks or 'uniform')
+                competition.make_rank_list(Gymnast())
+                competition.update_standings(Gymnast)
+                pks = list(competition.gymnasts.values_list('pk', flat=True))
+                url = reverse('competitions:protocol', args=[competition.pk])
+                rnd = random.Random(seed)
+
+                def write():
+                    enter_marks(competition, Gymnast, 1, {rnd.choice(pks): {'d1': rnd.randint(20, 60) / 10}})
+
+                def read():
+                    _get(Client(SERVER_NAME='localhost'), url)
+
+                connection.close()
+                queue, deadline = context.Queue(), time.time() + seconds
+                processes = [context.Process(target=_worker, args=(kind, step, deadline, queue))
+                             for kind, step, count in (('write', write, writers), ('read', read, readers))
+                             for i in range(count)]
+                for process in processes:
+                    process.start()
+                totals = {kind: [0, 0, 0.0] for kind in ('write', 'read')}
+                for process in processes:
+                    kind, done, errors, slowest = queue.get()
+                    totals[kind] = [totals[kind][0] + done, totals[kind][1] + errors,
+                                    max(totals[kind][2], slowest)]
+                for process in processes:
+                    process.join()
+
+            rows.append(OrderedDict([
+                ('database', mode),
+                ('competitors', size),
+                ('writes_per_second', totals['write'][0] / seconds),
+                ('reads_per_second', totals['read'][0] / seconds),
+                ('max_write_seconds', totals['write'][2]),
+                ('max_read_seconds', totals['read'][2]),
+                ('locked_errors', totals['write'][1] + totals['read'][1]),
+            ]))
+    return rows
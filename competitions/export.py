@@ -0,0 +1,217 @@
+"""Выгрузка сводного протокола и таблицы победителей в XLSX и PDF.
+
+Каждая таблица читается одним упорядоченным запросом через iterator() и
+пишется в файл построчно, поэтому память не растёт с числом участников.
+Готовый файл хранится в settings.EXPORT_CACHE_DIR под версией результатов
+соревнования и отдаётся повторно без обращения к участникам.
+"""
+import glob
+import logging
+import os
+import tempfile
+
+from django.conf import settings
+
+from .choices import CATEGORY
+from .models import Gymnast, Standing, Team
+
+CATEGORIES = dict(CATEGORY)
+FORMATS = ('xlsx', 'pdf')
+# Где искать шрифт с кириллицей для PDF, если EXPORT_PDF_FONT не задан
+PDF_FONTS = (
+    '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf',  # Debian, Ubuntu
+    '/usr/share/fonts/dejavu-sans-fonts/DejaVuSans.ttf',  # Fedora
+    '/usr/share/fonts/dejavu/DejaVuSans.ttf',  # CentOS, Alpine
+    '/usr/share/fonts/TTF/DejaVuSans.ttf',  # Arch
+    '/Library/Fonts/Arial Unicode.ttf',  # macOS
+    'C:\\Windows\\Fonts\\arial.ttf',
+)
+
+logger = logging.getLogger(__name__)
+
+
+class ExportUnavailable(Exception):
+    pass
+
+
+def _value(value):
+    return '-' if value is None or value == '' else str(value)
+
+
+class Table:
+
+    def __init__(self, caption, model, columns, ordering, ranked_only=False, members=False,
+                 per_apparatus=False):
+        self.caption = caption
+        self.model = model
+        self.columns = columns
+        self.ordering = ordering
+        self.ranked_only = ranked_only
+        self.members = members
+        # суммы по видам программы соревнования идут перед последним столбцом (итогом)
+        self.per_apparatus = per_apparatus
+
+    def headers(self, competition):
+        headers = [header for header, field in self.columns]
+        if self.per_apparatus:
+            headers[-1:-1] = competition.apparatus(self.model)
+        return headers
+
+    def rows(self, competition):
+        """Строки таблицы; члены команды идут строками после своей команды."""
+        fields = [field for header, field in self.columns]
+        # суммы по видам и члены команды лежат в той же строке таблицы результатов
+        queryset = (Standing.objects.filter(competition=competition, kind=self.model._meta.model_name)
+                    .order_by(*(self.ordering + ('competitor_id',))))
+        if self.ranked_only:
+            queryset = queryset.filter(rank__isnull=False)
+        count = len(competition.apparatus(self.model))
+        for standing in queryset.only(*(fields + ['apparatus_sums', 'members'])).iterator():
+            values = [self.format(field, getattr(standing, field)) for field in fields]
+            if self.per_apparatus:
+                values[-1:-1] = [_value(result) for result in standing.apparatus_results(count)]
+            yield values
+            if self.members:
+                for name in standing.member_names():
+                    yield ['', name] + [''] * (len(values) - 2)
+
+    def format(self, field, value):
+        if field == 'category':
+            return CATEGORIES.get(value, '-')
+        return _value(value)
+
+
+GYMNAST_PROTOCOL = Table('Сводный протокол (личный зачёт)', Gymnast, [
+    ('Место', 'rank'), ('Участник', 'name'), ('г.р.', 'year_of_birth'), ('Разряд', 'category'),
+    ('Город', 'city'), ('Тренер', 'coach'), ('Сумма', 'result'),
+], ('-result', 'name'), per_apparatus=True)
+TEAM_PROTOCOL = Table('Сводный протокол (командный зачёт)', Team, [
+    ('Место', 'rank'), ('Команда', 'name'), ('Город', 'city'), ('Тренер', 'coach'),
+    ('Сумма', 'result'),
+], ('-result', 'name'), members=True, per_apparatus=True)
+GYMNAST_RANK = Table('Таблица победителей в личном зачёте', Gymnast, [
+    ('Место', 'rank'), ('Гимнастка', 'name'), ('г.р.', 'year_of_birth'), ('Разряд', 'category'),
+    ('Город', 'city'), ('Сумма', 'result'), ('Место в разряде', 'category_rank'),
+    ('Место среди ровесниц', 'age_rank'),
+], ('rank', 'name'), ranked_only=True)
+TEAM_RANK = Table('Таблица победителей в командном зачёте', Team, [
+    ('Место', 'rank'), ('Команда', 'name'), ('Город', 'city'), ('Сумма', 'result'),
+], ('rank', 'name'), ranked_only=True)
+
+DOCUMENTS = {
+    'protocol': [GYMNAST_PROTOCOL, TEAM_PROTOCOL],
+    'rank': [GYMNAST_RANK, TEAM_RANK],
+}
+
+
+def title_lines(competition):
+    lines = [competition.title,
+             'Место проведения: %s' % competition.place,
+             'Даты проведения: %s - %s' % (competition.start.strftime('%d.%m.%Y'),
+                                           competition.end.strftime('%d.%m.%Y'))]
+    if competition.organizer:
+        lines.append('Организатор: %s' % competition.organizer)
+    return lines
+
+
+def write_xlsx(competition, tables, file):
+    try:
+        from openpyxl import Workbook
+    except ImportError:
+        raise ExportUnavailable('Для выгрузки в XLSX установите openpyxl')
+    # write_only: строки сбрасываются на диск по мере записи
+    workbook = Workbook(write_only=True)
+    for table in tables:
+        sheet = workbook.create_sheet(table.caption[:31].replace('(', '').replace(')', ''))
+        for line in title_lines(competition):
+            sheet.append([line])
+        sheet.append([])
+        sheet.append([table.caption])
+        sheet.append(table.headers(competition))
+        for row in table.rows(competition):
+            sheet.append(row)
+    workbook.save(file)
+
+
+def _pdf_font():
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFont
+    configured = getattr(settings, 'EXPORT_PDF_FONT', None)
+    # У встроенной Helvetica нет кириллицы, без TrueType-шрифта PDF не строится
+    path = next((path for path in ([configured] if configured else PDF_FONTS)
+                 if os.path.exists(path)), None)
+    if path is None:
+        logger.error('Нет шрифта для выгрузки в PDF: %s', configured or ', '.join(PDF_FONTS))
+        raise ExportUnavailable('Для выгрузки в PDF укажите TrueType-шрифт с кириллицей в EXPORT_PDF_FONT')
+    if 'ExportFont' not in pdfmetrics.getRegisteredFontNames():
+        pdfmetrics.registerFont(TTFont('ExportFont', path))
+    return 'ExportFont'
+
+
+def write_pdf(competition, tables, file):
+    try:
+        from reportlab.lib.pagesizes import A4, landscape
+        from reportlab.pdfgen.canvas import Canvas
+    except ImportError:
+        raise ExportUnavailable('Для выгрузки в PDF установите reportlab')
+    font, size, leading, margin = _pdf_font(), 9, 14, 36
+    width, height = landscape(A4)
+    canvas = Canvas(file, pagesize=(width, height))
+    canvas.setTitle(competition.title)
+    y = height - margin
+
+    def line(cells, positions):
+        nonlocal y
+        if y < margin:
+            canvas.showPage()
+            y = height - margin
+        canvas.setFont(font, size)
+        for x, cell in zip(positions, cells):
+            canvas.drawString(x, y, cell)
+        y -= leading
+
+    for text in title_lines(competition):
+        line([text], [margin])
+    for table in tables:
+        y -= leading
+        # колонки с именем, городом и тренером шире остальных
+        headers = table.headers(competition)
+        weights = [3 if header in ('Участник', 'Гимнастка', 'Команда', 'Город', 'Тренер') else 1
+                   for header in headers]
+        step = (width - 2 * margin) / sum(weights)
+        positions = [margin + step * sum(weights[:i]) for i in range(len(weights))]
+        line([table.caption], [margin])
+        line(headers, positions)
+        for row in table.rows(competition):
+            line(row, positions)
+    canvas.save()
+
+
+WRITERS = {'xlsx': write_xlsx, 'pdf': write_pdf}
+
+
+def export_path(competition_id, version, document, fmt):
+    """Файл выгрузки для версии результатов version; создаётся при первом
+    запросе, устаревшие версии того же документа удаляются."""
+    directory = settings.EXPORT_CACHE_DIR
+    path = os.path.join(directory, '%s.%s.%s' % (version, document, fmt))
+    if os.path.exists(path):
+        return path
+    from .models import Competition
+    competition = Competition.objects.get(pk=competition_id)
+    os.makedirs(directory, exist_ok=True)
+    handle, temporary = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    try:
+        with os.fdopen(handle, 'wb') as file:
+            WRITERS[fmt](competition, DOCUMENTS[document], file)
+        os.replace(temporary, path)
+    except BaseException:
+        os.remove(temporary)
+        raise
+    for stale in glob.glob(os.path.join(directory, '%s.*.%s.%s' % (competition_id, document, fmt))):
+        if stale != path:
+            try:
+                os.remove(stale)
+            except OSError:
+                pass
+    return path
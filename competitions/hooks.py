@@ -0,0 +1,135 @@
+"""Управление post_save/post_delete-обработчиками участников.
+
+Каждое сохранение гимнастки или команды пересчитывает места и сбрасывает
+жеребьёвку соревнования. Внутри deferred() эта работа копится и выполняется
+один раз на соревнование при выходе из блока (внутри транзакции -- после её
+фиксации; если блок завершился исключением, накопленное отбрасывается);
+middleware.DeferredHooksMiddleware оборачивает так каждый запрос. Внутри
+suspended() обработчики не делают ничего: места и жеребьёвку пересчитывает
+тот, кто их приостановил (например, импорт).
+"""
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+
+from django.db import connection, transaction
+
+_state = threading.local()
+
+
+class _Pending:
+
+    def __init__(self, competition):
+        self.competition = competition
+        self.changed = OrderedDict()
+        self.created = False
+        self.full = False
+        self.unsort = False
+
+
+def _pending_for(model, competition, competition_id=None):
+    key = (model, competition_id or competition.pk)
+    if key not in _state.pending:
+        _state.pending[key] = _Pending(competition)
+    return _state.pending[key]
+
+
+def is_suspended():
+    return getattr(_state, 'suspended', 0) > 0
+
+
+def is_deferred():
+    return getattr(_state, 'pending', None) is not None
+
+
+def postpone_rank(instance, created):
+    """Возвращает True, если пересчёт мест отложен (или приостановлен)."""
+    if is_suspended():
+        return True
+    if not is_deferred():
+        return False
+    pending = _pending_for(type(instance), instance.competition)
+    pending.changed[instance.pk] = instance
+    pending.created = pending.created or created
+    competition_id = getattr(instance, '_saved_standing', (None, None))[0]
+    if competition_id is not None and competition_id != instance.competition_id:
+        _pending_for(type(instance), None, competition_id).full = True
+    return True
+
+
+def postpone_full_rank(instance):
+    if is_suspended():
+        return True
+    if not is_deferred():
+        return False
+    _pending_for(type(instance), instance.competition).full = True
+    return True
+
+
+def postpone_unsortition(instance):
+    if is_suspended():
+        return True
+    if not is_deferred():
+        return False
+    _pending_for(type(instance), instance.competition).unsort = True
+    return True
+
+
+@contextmanager
+def deferred():
+    if is_deferred():
+        yield
+        return
+    _state.pending = OrderedDict()
+    try:
+        yield
+    except BaseException:
+        # сохранения откатились вместе с транзакцией, пересчитывать нечего
+        _state.pending = None
+        raise
+    pending, _state.pending = _state.pending, None
+    if is_suspended() or not pending:
+        return
+    if connection.in_atomic_block:
+        # места пересчитываются, только если сохранения действительно записаны
+        transaction.on_commit(lambda: _flush(pending))
+    else:
+        _flush(pending)
+
+
+@contextmanager
+def suspended():
+    _state.suspended = getattr(_state, 'suspended', 0) + 1
+    try:
+        yield
+    finally:
+        _state.suspended -= 1
+
+
+def _flush(pending):
+    from .models import Competition, Team
+    touched = OrderedDict()
+    for (model, competition_id), item in pending.items():
+        competition = item.competition or Competition.objects.get(pk=competition_id)
+        touched[competition_id] = competition
+        with transaction.atomic():
+            competition.lock()
+            if item.unsort:
+                # сохранение соревнования само обновляет его версию
+                touched[competition_id] = None
+                if model is Team:
+                    competition.unsortition_team()
+                else:
+                    competition.unsortition_gymnast()
+            if len(item.changed) == 1 and not item.full:
+                instance, = item.changed.values()
+                instance.update_rank(item.created)
+            elif item.changed or item.full:
+                competition.make_rank_list(model())
+                competition.update_standings(model, None if item.full else list(item.changed))
+                for instance in item.changed.values():
+                    instance.remember_standing()
+    for competition in touched.values():
+        if competition is not None:
+            competition.touch()
+
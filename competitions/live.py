@@ -0,0 +1,107 @@
+"""Трансляция изменений результатов (Server-Sent Events).
+
+После каждого изменения соревнования (Competition.touch) итоги и места
+читаются одним запросом из таблицы результатов Standing, сравниваются с
+предыдущим снимком, и подписчикам рассылаются только изменившиеся строки.
+Сколько бы зрителей ни было подключено, на одно изменение приходится один
+запрос к БД; страница результатов применяет строки сама, без перезагрузки.
+
+Рассылка идёт внутри процесса: подписчики получают изменения, сделанные
+в том же процессе сервера.
+"""
+import json
+import threading
+from collections import deque
+
+from django.db import transaction
+
+from .choices import CATEGORY
+
+HISTORY = 100
+CATEGORIES = dict(CATEGORY)
+FIELDS = ('name', 'year_of_birth', 'category', 'city', 'number', 'result', 'rank', 'category_rank',
+          'age_rank')
+
+
+def load_standings(competition_id):
+    from .models import Standing
+    standings = {}
+    for row in (Standing.objects.filter(competition_id=competition_id)
+                .values('kind', 'competitor_id', *FIELDS)):
+        row['id'] = row.pop('competitor_id')
+        row['category_name'] = CATEGORIES.get(row['category'], '')
+        row['result'] = None if row['result'] is None else str(row['result'])
+        standings['%s-%s' % (row['kind'], row['id'])] = row
+    return standings
+
+
+class Channel:
+
+    def __init__(self, standings):
+        self.condition = threading.Condition()
+        self.standings = standings
+        self.events = deque(maxlen=HISTORY)
+        self.seq = 0
+        self.listeners = 0
+
+
+class Broker:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.channels = {}
+
+    def subscribe(self, competition_id):
+        with self.lock:
+            channel = self.channels.get(competition_id)
+        if channel is None:
+            standings = load_standings(competition_id)
+            with self.lock:
+                channel = self.channels.setdefault(competition_id, Channel(standings))
+        with channel.condition:
+            channel.listeners += 1
+            return channel, channel.seq, dict(channel.standings)
+
+    def unsubscribe(self, competition_id, channel):
+        with self.lock, channel.condition:
+            channel.listeners -= 1
+            if not channel.listeners and self.channels.get(competition_id) is channel:
+                del self.channels[competition_id]
+
+    def publish(self, competition_id):
+        with self.lock:
+            channel = self.channels.get(competition_id)
+        if channel is None:
+            return
+        standings = load_standings(competition_id)
+        with channel.condition:
+            changed = [row for key, row in standings.items() if channel.standings.get(key) != row]
+            removed = [key for key in channel.standings if key not in standings]
+            channel.standings = standings
+            if changed or removed:
+                channel.seq += 1
+                channel.events.append((channel.seq, {'changed': changed, 'removed': removed}))
+                channel.condition.notify_all()
+
+    def wait(self, channel, seq, timeout):
+        with channel.condition:
+            if channel.seq == seq:
+                channel.condition.wait(timeout)
+            return [event for event in channel.events if event[0] > seq]
+
+
+broker = Broker()
+
+
+def competition_changed(competition_id):
+    # Читаем итоги после фиксации транзакции, чтобы не разослать откаченное
+    transaction.on_commit(lambda: broker.publish(competition_id))
+
+
+def format_event(name, data, seq=None):
+    lines = []
+    if seq is not None:
+        lines.append('id: %s' % seq)
+    lines.append('event: %s' % name)
+    lines.append('data: %s' % json.dumps(data, ensure_ascii=False))
+    return '\n'.join(lines) + '\n\n'
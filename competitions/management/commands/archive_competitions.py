@@ -0,0 +1,39 @@
+import datetime
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from competitions.archive import archive_before, archive_competition
+from competitions.models import Gymnast, Team
+
+
+class Command(BaseCommand):
+    help = ('Переносит завершённые соревнования в архив: итоговые места и суммы '
+            'сохраняются, гимнастки, команды, выступления и оценки судей удаляются '
+            'из рабочих таблиц')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--before', required=True, metavar='DATE',
+                            help='соревнования, закончившиеся раньше этой даты (ГГГГ-ММ-ДД)')
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='сколько участников переносить за раз')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='только показать, какие соревнования будут перенесены')
+
+    def handle(self, *args, **options):
+        try:
+            before = datetime.datetime.strptime(options['before'], '%Y-%m-%d').date()
+        except ValueError:
+            raise CommandError('--before: дата в формате ГГГГ-ММ-ДД, а не "%s"' % options['before'])
+        competitions = list(archive_before(before))
+        for i, competition in enumerate(competitions, 1):
+            if options['dry_run']:
+                self.stdout.write('[%s/%s] %s (%s)' % (i, len(competitions), competition, competition.end))
+                continue
+            started = time.perf_counter()
+            counts = archive_competition(competition, options['chunk_size'])
+            self.stdout.write('[%s/%s] %s: гимнасток %s, команд %s, %.2f с' % (
+                i, len(competitions), competition, counts[Gymnast], counts[Team],
+                time.perf_counter() - started))
+        if not competitions:
+            self.stdout.write('Нет соревнований для переноса в архив')
@@ -0,0 +1,60 @@
+import datetime
+import json
+import subprocess
+
+from django.core.management.base import BaseCommand, CommandError
+from django.test.utils import setup_databases, teardown_databases
+
+from competitions.benchmarks import DISTRIBUTIONS, SUITES
+
+
+def git_revision():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'],
+                                       stderr=subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = 'Замеры производительности на синтетических данных во временной тестовой БД'
+
+    def add_arguments(self, parser):
+        parser.add_argument('suites', nargs='*', metavar='suite',
+                            help='наборы замеров: %s (по умолчанию все)' % ', '.join(SUITES))
+        parser.add_argument('--sizes', nargs='+', type=int, default=[100, 300, 1000],
+                            help='число гимнасток в синтетическом соревновании')
+        parser.add_argument('--teams', type=int, default=None,
+                            help='число команд (по умолчанию пятая часть числа гимнасток)')
+        parser.add_argument('--marks', choices=list(DISTRIBUTIONS), default='uniform',
+                            help='распределение оценок судей')
+        parser.add_argument('--seed', type=int, default=0,
+                            help='начальное значение генератора данных')
+        parser.add_argument('--json', metavar='PATH',
+                            help='записать результаты в JSON-файл для сравнения между коммитами')
+
+    def handle(self, *args, **options):
+        names = options['suites'] or list(SUITES)
+        unknown = set(names) - set(SUITES)
+        if unknown:
+            raise CommandError('Неизвестные наборы замеров: %s' % ', '.join(sorted(unknown)))
+        dataset = {'teams': options['teams'], 'seed': options['seed'], 'marks': options['marks']}
+        report = {'revision': git_revision(),
+                  'created': datetime.datetime.now().isoformat(timespec='seconds'),
+                  'sizes': options['sizes'],
+                  'dataset': dataset,
+                  'suites': {}}
+        old_config = setup_databases(verbosity=0, interactive=False)
+        try:
+            for name in names:
+                self.stdout.write(self.style.MIGRATE_HEADING(name))
+                rows = report['suites'][name] = SUITES[name](options['sizes'], **dataset)
+                for row in rows:
+                    self.stdout.write('  ' + '  '.join(
+                        '%s=%s' % (key, '%.4f' % value if isinstance(value, float) else value)
+                        for key, value in row.items()))
+        finally:
+            teardown_databases(old_config, verbosity=0)
+        if options['json']:
+            with open(options['json'], 'w') as file:
+                json.dump(report, file, ensure_ascii=False, indent=2)
@@ -0,0 +1,35 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from competitions.models import Competition, Gymnast, Team, TeamGymnast
+from competitions.startlist import CHUNK_SIZE, StartListError, import_start_list
+
+
+class Command(BaseCommand):
+    help = 'Загружает стартовый лист (CSV или XLSX) в соревнование'
+
+    def add_arguments(self, parser):
+        parser.add_argument('competition', help='id или slug соревнования')
+        parser.add_argument('file', help='файл .csv или .xlsx')
+        parser.add_argument('--chunk-size', type=int, default=CHUNK_SIZE,
+                            help='сколько участников вставлять за один запрос')
+
+    def handle(self, *args, **options):
+        ident = options['competition']
+        lookup = {'pk': ident} if ident.isdigit() else {'slug': ident}
+        try:
+            competition = Competition.objects.get(**lookup)
+        except Competition.DoesNotExist:
+            raise CommandError('Соревнование "%s" не найдено' % ident)
+        started = time.perf_counter()
+        try:
+            with open(options['file'], 'rb') as file:
+                counts = import_start_list(competition, file, options['file'], options['chunk_size'])
+        except OSError as error:
+            raise CommandError(error)
+        except StartListError as error:
+            raise CommandError('Файл не загружен:\n%s' % error)
+        self.stdout.write('%s: гимнасток %s, команд %s, членов команд %s, %.2f с' % (
+            competition, counts[Gymnast], counts[Team], counts[TeamGymnast],
+            time.perf_counter() - started))
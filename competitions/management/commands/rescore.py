@@ -0,0 +1,71 @@
+import multiprocessing
+import time
+from functools import partial
+
+import django
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, connections
+
+from competitions.models import Competition, Gymnast, Team
+
+
+def _init_worker():
+    # Соединения родителя не переживают fork, каждому процессу нужно своё
+    django.setup()
+    connections.close_all()
+
+
+def _rescore(pk, chunk_size):
+    competition = Competition.objects.get(pk=pk)
+    started = time.perf_counter()
+    counts = competition.rescore(chunk_size)
+    return competition, counts[Gymnast], counts[Team], time.perf_counter() - started
+
+
+class Command(BaseCommand):
+    help = ('Пересчитывает оценки, итоги и места участников соревнований '
+            '(без открытия каждой гимнастки в админке)')
+
+    def add_arguments(self, parser):
+        parser.add_argument('competitions', nargs='*', metavar='competition',
+                            help='id или slug соревнования')
+        parser.add_argument('--all', action='store_true', help='все соревнования')
+        parser.add_argument('--chunk-size', type=int, default=2000,
+                            help='сколько участников читать из БД за раз')
+        parser.add_argument('--workers', type=int, default=1,
+                            help='число процессов, пересчитывающих соревнования параллельно')
+
+    def handle(self, *args, **options):
+        pks = self.competition_pks(options)
+        workers = options['workers']
+        if workers > 1 and connection.vendor == 'sqlite':
+            # SQLite допускает одного писателя: параллельные транзакции пересчёта
+            # упираются в "database is locked", а не ускоряются
+            self.stderr.write('SQLite не поддерживает параллельную запись, --workers игнорируется')
+            workers = 1
+        if workers > 1 and len(pks) > 1:
+            connections.close_all()
+            with multiprocessing.Pool(workers, initializer=_init_worker) as pool:
+                rescore = partial(_rescore, chunk_size=options['chunk_size'])
+                self.report(pool.imap_unordered(rescore, pks), len(pks))
+        else:
+            self.report((_rescore(pk, options['chunk_size']) for pk in pks), len(pks))
+
+    def competition_pks(self, options):
+        if options['all']:
+            return list(Competition.objects.order_by('pk').values_list('pk', flat=True))
+        if not options['competitions']:
+            raise CommandError('Укажите соревнования или --all')
+        pks = []
+        for ident in options['competitions']:
+            lookup = {'pk': ident} if ident.isdigit() else {'slug': ident}
+            try:
+                pks.append(Competition.objects.values_list('pk', flat=True).get(**lookup))
+            except Competition.DoesNotExist:
+                raise CommandError('Соревнование "%s" не найдено' % ident)
+        return pks
+
+    def report(self, results, total):
+        for i, (competition, gymnasts, teams, seconds) in enumerate(results, 1):
+            self.stdout.write('[%s/%s] %s: гимнасток %s, команд %s, %.2f с' % (
+                i, total, competition, gymnasts, teams, seconds))
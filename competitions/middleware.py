@@ -0,0 +1,30 @@
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+
+from . import hooks, profiling
+
+
+class DeferredHooksMiddleware:
+    """Один пересчёт мест на соревнование за запрос, сколько бы строк ни сохранялось."""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        with hooks.deferred():
+            return self.get_response(request)
+
+
+class ProfilingMiddleware:
+    """Время, SQL-запросы и отрисовка шаблонов каждого запроса (см. profiling).
+    Работает только при settings.PROFILING; ставится первым в MIDDLEWARE."""
+
+    def __init__(self, get_response):
+        if not getattr(settings, 'PROFILING', False):
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        self.log = getattr(settings, 'PROFILING_LOG', None)
+        profiling.install_template_timer()
+
+    def __call__(self, request):
+        return profiling.profile(request, self.get_response, self.log)
@@ -0,0 +1,18 @@
+# Generated by Django 2.2.28 on 2026-10-18 15:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('competitions', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='competition',
+            name='draw_seed',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='ключ жеребьёвки'),
+        ),
+    ]
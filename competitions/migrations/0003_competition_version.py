@@ -0,0 +1,24 @@
+# Generated by Django 2.2.28 on 2026-10-18 15:45
+
+from django.db import migrations, models
+import django.utils.timezone
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('competitions', '0002_competition_draw_seed'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='competition',
+            name='modified',
+            field=models.DateTimeField(default=django.utils.timezone.now, editable=False, verbose_name='результаты изменены'),
+        ),
+        migrations.AddField(
+            model_name='competition',
+            name='version',
+            field=models.PositiveIntegerField(default=0, editable=False, verbose_name='версия результатов'),
+        ),
+    ]
@@ -0,0 +1,69 @@
+# Generated by Django 2.2.28 on 2026-10-18 15:58
+
+import django.core.validators
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('competitions', '0003_competition_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='competition',
+            name='gymnast_apparatus',
+            field=models.CharField(default='Обруч, Мяч, Булава, Лента', help_text='через запятую, в порядке выступления', max_length=256, verbose_name='виды программы гимнасток'),
+        ),
+        migrations.AddField(
+            model_name='competition',
+            name='team_apparatus',
+            field=models.CharField(default='1 вид, 2 вид', help_text='через запятую, в порядке выступления', max_length=256, verbose_name='виды программы команд'),
+        ),
+        migrations.CreateModel(
+            name='Performance',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('apparatus', models.PositiveSmallIntegerField(validators=[django.core.validators.MinValueValidator(1)], verbose_name='вид программы')),
+                ('penalty', models.FloatField(blank=True, null=True, verbose_name='сбавка')),
+                ('tv_d', models.DecimalField(blank=True, decimal_places=3, max_digits=5, null=True, verbose_name='окончательная оценка D')),
+                ('tv_e', models.DecimalField(blank=True, decimal_places=3, max_digits=5, null=True, verbose_name='окончательная оценка E')),
+                ('score', models.DecimalField(blank=True, decimal_places=3, max_digits=5, null=True, verbose_name='оценка')),
+                ('result', models.DecimalField(blank=True, decimal_places=3, max_digits=5, null=True, verbose_name='сумма')),
+                ('gymnast', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='performances', to='competitions.Gymnast', verbose_name='гимнастка')),
+                ('team', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='performances', to='competitions.Team', verbose_name='команда')),
+            ],
+            options={
+                'verbose_name': 'выступление',
+                'verbose_name_plural': 'выступления',
+            },
+        ),
+        migrations.CreateModel(
+            name='Mark',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('panel', models.CharField(choices=[('D', 'D (трудность)'), ('E', 'E (исполнение)')], max_length=1, verbose_name='бригада')),
+                ('slot', models.PositiveSmallIntegerField(verbose_name='судья')),
+                ('value', models.FloatField(verbose_name='оценка')),
+                ('performance', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='marks', to='competitions.Performance', verbose_name='выступление')),
+            ],
+            options={
+                'verbose_name': 'оценка судьи',
+                'verbose_name_plural': 'оценки судей',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='performance',
+            constraint=models.CheckConstraint(check=models.Q(models.Q(('gymnast__isnull', False), ('team__isnull', True)), models.Q(('gymnast__isnull', True), ('team__isnull', False)), _connector='OR'), name='performance_has_one_competitor'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='performance',
+            unique_together={('team', 'apparatus'), ('gymnast', 'apparatus')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='mark',
+            unique_together={('performance', 'panel', 'slot')},
+        ),
+    ]
@@ -0,0 +1,81 @@
+from itertools import islice
+
+from django.db import migrations
+
+# Число видов, под которые были заведены широкие столбцы v1..v4
+APPARATUS = (('gymnast', 4), ('team', 2))
+D_SLOTS = (1, 2)
+E_SLOTS = (1, 2, 3, 4, 5)
+CHUNK_SIZE = 500
+
+
+def columns(apparatus):
+    return (['v%sd%s' % (apparatus, slot) for slot in D_SLOTS] +
+            ['v%se%s' % (apparatus, slot) for slot in E_SLOTS] +
+            ['pv%sk' % apparatus, 'tv%sd' % apparatus, 'tv%se' % apparatus,
+             'score%s' % apparatus, 'result%s' % apparatus])
+
+
+def copy_marks(apps, schema_editor):
+    Performance = apps.get_model('competitions', 'Performance')
+    Mark = apps.get_model('competitions', 'Mark')
+    for owner, count in APPARATUS:
+        model = apps.get_model('competitions', owner)
+        fields = [column for apparatus in range(1, count + 1) for column in columns(apparatus)]
+        rows = model.objects.order_by('pk').values_list('pk', *fields).iterator(chunk_size=CHUNK_SIZE)
+        for chunk in iter(lambda: list(islice(rows, CHUNK_SIZE)), []):
+            performances, marks = [], {}
+            for row in chunk:
+                for apparatus in range(1, count + 1):
+                    values = dict(zip(columns(apparatus), row[1 + (apparatus - 1) * 12:]))
+                    if all(value is None for value in values.values()):
+                        continue
+                    performances.append(Performance(
+                        apparatus=apparatus,
+                        penalty=values['pv%sk' % apparatus],
+                        tv_d=values['tv%sd' % apparatus],
+                        tv_e=values['tv%se' % apparatus],
+                        score=values['score%s' % apparatus],
+                        result=values['result%s' % apparatus],
+                        **{owner + '_id': row[0]}))
+                    marks[row[0], apparatus] = (
+                        [('D', slot, values['v%sd%s' % (apparatus, slot)]) for slot in D_SLOTS] +
+                        [('E', slot, values['v%se%s' % (apparatus, slot)]) for slot in E_SLOTS])
+            Performance.objects.bulk_create(performances)
+            created = (Performance.objects
+                       .filter(**{owner + '_id__in': [row[0] for row in chunk]})
+                       .values_list('pk', owner + '_id', 'apparatus'))
+            Mark.objects.bulk_create(
+                Mark(performance_id=pk, panel=panel, slot=slot, value=value)
+                for pk, competitor, apparatus in created
+                for panel, slot, value in marks[competitor, apparatus]
+                if value is not None)
+
+
+def copy_marks_back(apps, schema_editor):
+    Performance = apps.get_model('competitions', 'Performance')
+    for owner, count in APPARATUS:
+        model = apps.get_model('competitions', owner)
+        performances = (Performance.objects.filter(**{owner + '__isnull': False, 'apparatus__lte': count})
+                        .order_by(owner + '_id').prefetch_related('marks'))
+        for performance in performances:
+            apparatus = performance.apparatus
+            values = {'pv%sk' % apparatus: performance.penalty,
+                      'tv%sd' % apparatus: performance.tv_d,
+                      'tv%se' % apparatus: performance.tv_e,
+                      'score%s' % apparatus: performance.score,
+                      'result%s' % apparatus: performance.result}
+            for mark in performance.marks.all():
+                values['v%s%s%s' % (apparatus, mark.panel.lower(), mark.slot)] = mark.value
+            model.objects.filter(pk=getattr(performance, owner + '_id')).update(**values)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('competitions', '0004_performances'),
+    ]
+
+    operations = [
+        migrations.RunPython(copy_marks, copy_marks_back),
+    ]
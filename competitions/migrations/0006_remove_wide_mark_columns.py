@@ -0,0 +1,461 @@
+# Generated by Django 2.2.28 on 2026-10-18 15:58
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('competitions', '0005_copy_marks_to_performances'),
+    ]
+
+    operations = [
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='pv1k',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='pv2k',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='pv3k',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='pv4k',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='result1',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='result2',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='result3',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='result4',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='score1',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='score2',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='score3',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='score4',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='tv1d',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='tv1e',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='tv2d',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='tv2e',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='tv3d',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='tv3e',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='tv4d',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='tv4e',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='v1d1',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='v1d2',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='v1d3',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='v1d4',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='v1e1',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='v1e2',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='v1e3',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='v1e4',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='v1e5',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='v2d1',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='v2d2',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='v2d3',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='v2d4',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='v2e1',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='v2e2',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='v2e3',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='v2e4',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='v2e5',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='v3d1',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='v3d2',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='v3d3',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='v3d4',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='v3e1',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='v3e2',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='v3e3',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='v3e4',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='v3e5',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='v4d1',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='v4d2',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='v4d3',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='v4d4',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='v4e1',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='v4e2',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='v4e3',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='v4e4',
+        ),
+        migrations.RemoveField(
+            model_name='gymnast',
+            name='v4e5',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='pv1k',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='pv2k',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='pv3k',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='pv4k',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='result1',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='result2',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='result3',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='result4',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='score1',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='score2',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='score3',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='score4',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='tv1d',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='tv1e',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='tv2d',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='tv2e',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='tv3d',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='tv3e',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='tv4d',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='tv4e',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='v1d1',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='v1d2',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='v1d3',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='v1d4',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='v1e1',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='v1e2',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='v1e3',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='v1e4',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='v1e5',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='v2d1',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='v2d2',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='v2d3',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='v2d4',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='v2e1',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='v2e2',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='v2e3',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='v2e4',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='v2e5',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='v3d1',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='v3d2',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='v3d3',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='v3d4',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='v3e1',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='v3e2',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='v3e3',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='v3e4',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='v3e5',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='v4d1',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='v4d2',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='v4d3',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='v4d4',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='v4e1',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='v4e2',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='v4e3',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='v4e4',
+        ),
+        migrations.RemoveField(
+            model_name='team',
+            name='v4e5',
+        ),
+    ]
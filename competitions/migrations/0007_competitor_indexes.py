@@ -0,0 +1,45 @@
+# Generated by Django 2.2.28 on 2026-10-18 16:02
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('competitions', '0006_remove_wide_mark_columns'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='gymnast',
+            index=models.Index(fields=['competition', '-result'], name='gymnast_comp_result_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='gymnast',
+            index=models.Index(fields=['competition', 'rank'], name='gymnast_comp_rank_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='gymnast',
+            index=models.Index(fields=['competition', 'number'], name='gymnast_comp_number_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='gymnast',
+            index=models.Index(fields=['competition', 'name'], name='gymnast_comp_name_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='team',
+            index=models.Index(fields=['competition', '-result'], name='team_comp_result_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='team',
+            index=models.Index(fields=['competition', 'rank'], name='team_comp_rank_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='team',
+            index=models.Index(fields=['competition', 'number'], name='team_comp_number_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='team',
+            index=models.Index(fields=['competition', 'name'], name='team_comp_name_idx'),
+        ),
+    ]
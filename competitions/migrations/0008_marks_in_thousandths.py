@@ -0,0 +1,37 @@
+# Generated by Django 2.2.28 on 2026-10-18 16:07
+
+from django.db import migrations, models
+from django.db.models import F
+from django.db.models.functions import Round
+
+
+def to_thousandths(apps, schema_editor):
+    # Пока столбцы ещё float: 4.5 -> 4500.0, затем AlterField делает их целыми
+    apps.get_model('competitions', 'Mark').objects.update(value=Round(F('value') * 1000))
+    apps.get_model('competitions', 'Performance').objects.update(penalty=Round(F('penalty') * 1000))
+
+
+def to_points(apps, schema_editor):
+    apps.get_model('competitions', 'Mark').objects.update(value=F('value') / 1000.0)
+    apps.get_model('competitions', 'Performance').objects.update(penalty=F('penalty') / 1000.0)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('competitions', '0007_competitor_indexes'),
+    ]
+
+    operations = [
+        migrations.RunPython(to_thousandths, to_points),
+        migrations.AlterField(
+            model_name='mark',
+            name='value',
+            field=models.PositiveIntegerField(verbose_name='оценка, тысячные балла'),
+        ),
+        migrations.AlterField(
+            model_name='performance',
+            name='penalty',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='сбавка, тысячные балла'),
+        ),
+    ]
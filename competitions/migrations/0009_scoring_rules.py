@@ -0,0 +1,23 @@
+# Generated by Django 2.2.28 on 2026-10-18 16:10
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('competitions', '0008_marks_in_thousandths'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='competition',
+            name='gymnast_rules',
+            field=models.CharField(choices=[('fig', 'FIG: две оценки D; E1/E2 и среднее E3-E6 без крайних'), ('reduced', 'Малая бригада: две оценки D; E1/E2 и среднее двух E'), ('simple', 'Упрощённые: одна оценка D; среднее трёх E')], default='fig', max_length=32, verbose_name='правила подсчёта у гимнасток'),
+        ),
+        migrations.AddField(
+            model_name='competition',
+            name='team_rules',
+            field=models.CharField(choices=[('fig', 'FIG: две оценки D; E1/E2 и среднее E3-E6 без крайних'), ('reduced', 'Малая бригада: две оценки D; E1/E2 и среднее двух E'), ('simple', 'Упрощённые: одна оценка D; среднее трёх E')], default='fig', max_length=32, verbose_name='правила подсчёта у команд'),
+        ),
+    ]
@@ -0,0 +1,89 @@
+# Generated by Django 2.2.28 on 2026-10-18 16:25
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('competitions', '0009_scoring_rules'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='competition',
+            name='archived',
+            field=models.BooleanField(default=False, editable=False, verbose_name='в архиве'),
+        ),
+        migrations.CreateModel(
+            name='Standing',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('kind', models.CharField(choices=[('gymnast', 'гимнастка'), ('team', 'команда')], max_length=8, verbose_name='участник')),
+                ('competitor_id', models.PositiveIntegerField(verbose_name='id гимнастки или команды')),
+                ('name', models.CharField(max_length=256, verbose_name='имя')),
+                ('year_of_birth', models.PositiveIntegerField(blank=True, null=True, verbose_name='год рождения')),
+                ('category', models.CharField(blank=True, choices=[('IIIjr', '3-й юн.'), ('IIjr', '2-й юн.'), ('Ijr', '1-й юн.'), ('III', '3-й.'), ('II', '2-й.'), ('I', '1-й.'), ('KMS', 'КМС'), ('MS', 'МС'), ('MSMK', 'МСМК')], max_length=5, verbose_name='разряд')),
+                ('city', models.CharField(blank=True, max_length=32, verbose_name='город')),
+                ('coach', models.CharField(blank=True, max_length=128, verbose_name='тренер')),
+                ('number', models.PositiveIntegerField(blank=True, null=True, verbose_name='порядковый номер выступления')),
+                ('rank', models.PositiveIntegerField(blank=True, null=True, verbose_name='место в зачёте')),
+                ('result', models.DecimalField(decimal_places=3, default=0, max_digits=5, verbose_name='итог')),
+                ('apparatus_sums', models.TextField(blank=True, help_text='через ";" по порядку видов, пусто -- суммы нет', verbose_name='суммы по видам')),
+                ('members', models.TextField(blank=True, help_text='по одной гимнастке в строке', verbose_name='члены команды')),
+                ('competition', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='standings', to='competitions.Competition', verbose_name='соревнование')),
+            ],
+            options={
+                'verbose_name': 'итоговая строка',
+                'verbose_name_plural': 'итоговые строки',
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedPerformance',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('apparatus', models.PositiveSmallIntegerField(verbose_name='вид программы')),
+                ('penalty', models.PositiveIntegerField(blank=True, null=True, verbose_name='сбавка, тысячные балла')),
+                ('tv_d', models.DecimalField(blank=True, decimal_places=3, max_digits=5, null=True, verbose_name='окончательная оценка D')),
+                ('tv_e', models.DecimalField(blank=True, decimal_places=3, max_digits=5, null=True, verbose_name='окончательная оценка E')),
+                ('score', models.DecimalField(blank=True, decimal_places=3, max_digits=5, null=True, verbose_name='оценка')),
+                ('result', models.DecimalField(blank=True, decimal_places=3, max_digits=5, null=True, verbose_name='сумма')),
+                ('standing', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='performances', to='competitions.Standing', verbose_name='участник')),
+            ],
+            options={
+                'verbose_name': 'архивное выступление',
+                'verbose_name_plural': 'архивные выступления',
+            },
+        ),
+        migrations.CreateModel(
+            name='ArchivedMark',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('panel', models.CharField(choices=[('D', 'D (трудность)'), ('E', 'E (исполнение)')], max_length=1, verbose_name='бригада')),
+                ('slot', models.PositiveSmallIntegerField(verbose_name='судья')),
+                ('value', models.PositiveIntegerField(verbose_name='оценка, тысячные балла')),
+                ('performance', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='marks', to='competitions.ArchivedPerformance', verbose_name='выступление')),
+            ],
+            options={
+                'verbose_name': 'архивная оценка судьи',
+                'verbose_name_plural': 'архивные оценки судей',
+            },
+        ),
+        migrations.AddIndex(
+            model_name='standing',
+            index=models.Index(fields=['competition', 'kind', 'rank'], name='standing_comp_rank_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='standing',
+            index=models.Index(fields=['competition', 'kind', '-result'], name='standing_comp_result_idx'),
+        ),
+        migrations.AlterUniqueTogether(
+            name='archivedperformance',
+            unique_together={('standing', 'apparatus')},
+        ),
+        migrations.AlterUniqueTogether(
+            name='archivedmark',
+            unique_together={('performance', 'panel', 'slot')},
+        ),
+    ]
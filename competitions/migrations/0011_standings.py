@@ -0,0 +1,62 @@
+# Generated by Django 2.2.28 on 2026-10-18 16:30
+
+from collections import defaultdict
+
+from django.db import migrations, models
+
+
+def fill_standings(apps, schema_editor):
+    # Таблица результатов для уже идущих соревнований, как в standings.update_standings
+    Competition = apps.get_model('competitions', 'Competition')
+    Performance = apps.get_model('competitions', 'Performance')
+    Standing = apps.get_model('competitions', 'Standing')
+    TeamGymnast = apps.get_model('competitions', 'TeamGymnast')
+    for competition in Competition.objects.filter(archived=False):
+        for kind, extra in (('gymnast', ('year_of_birth', 'category')), ('team', ())):
+            model = apps.get_model('competitions', kind)
+            fields = ('name', 'city', 'coach', 'number', 'rank', 'result') + extra
+            competitors = model.objects.filter(competition=competition)
+            results = defaultdict(dict)
+            for owner, apparatus, result in (Performance.objects.filter(**{kind + '__in': competitors})
+                                             .values_list(kind, 'apparatus', 'result')):
+                results[owner][apparatus] = result
+            members = defaultdict(list)
+            if kind == 'team':
+                for team, name in (TeamGymnast.objects.filter(team__in=competitors)
+                                   .order_by('pk').values_list('team', 'name')):
+                    members[team].append(name)
+            apparatus = getattr(competition, kind + '_apparatus')
+            count = len([name for name in apparatus.split(',') if name.strip()])
+            Standing.objects.bulk_create(
+                Standing(competition=competition, kind=kind, competitor_id=pk,
+                         apparatus_sums=';'.join('' if results[pk].get(i) is None else str(results[pk][i])
+                                                 for i in range(1, count + 1)),
+                         members='\n'.join(members[pk]), **dict(zip(fields, values)))
+                for pk, *values in competitors.order_by('pk').values_list('pk', *fields).iterator())
+
+
+def clear_standings(apps, schema_editor):
+    apps.get_model('competitions', 'Standing').objects.filter(competition__archived=False).delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('competitions', '0010_archive'),
+    ]
+
+    operations = [
+        migrations.AlterModelOptions(
+            name='standing',
+            options={'verbose_name': 'строка таблицы результатов', 'verbose_name_plural': 'строки таблицы результатов'},
+        ),
+        migrations.AlterUniqueTogether(
+            name='standing',
+            unique_together={('competition', 'kind', 'competitor_id')},
+        ),
+        migrations.AddIndex(
+            model_name='standing',
+            index=models.Index(fields=['competition', 'kind', 'number'], name='standing_comp_number_idx'),
+        ),
+        migrations.RunPython(fill_standings, clear_standings),
+    ]
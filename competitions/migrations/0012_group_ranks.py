@@ -0,0 +1,63 @@
+# Generated by Django 2.2.28 on 2026-10-18 16:34
+
+from django.db import migrations, models
+
+
+def fill_group_ranks(apps, schema_editor):
+    # Места в разряде и среди ровесниц тем же UPDATE с RANK() OVER, что и
+    # Competition.make_rank_list: по одному запросу на соревнование
+    Gymnast = apps.get_model('competitions', 'Gymnast')
+    Standing = apps.get_model('competitions', 'Standing')
+    qn = schema_editor.quote_name
+    gymnasts, standings = qn(Gymnast._meta.db_table), qn(Standing._meta.db_table)
+    ranks = (
+        'UPDATE {gymnasts} SET ("category_rank", "age_rank") = ('
+        ' SELECT ranked."category_rank", ranked."age_rank" FROM ('
+        '  SELECT "id",'
+        '   RANK() OVER (PARTITION BY "category" ORDER BY "result" DESC) AS "category_rank",'
+        '   RANK() OVER (PARTITION BY "year_of_birth" ORDER BY "result" DESC) AS "age_rank"'
+        '  FROM {gymnasts} WHERE "competition_id" = %s AND "result" > 0'
+        ' ) ranked WHERE ranked."id" = {gymnasts}."id"'
+        ') WHERE "competition_id" = %s'
+    ).format(gymnasts=gymnasts)
+    copy = (
+        'UPDATE {standings} SET ("category_rank", "age_rank") = ('
+        ' SELECT "category_rank", "age_rank" FROM {gymnasts}'
+        ' WHERE {gymnasts}."id" = {standings}."competitor_id"'
+        ') WHERE "competition_id" = %s AND "kind" = %s'
+    ).format(gymnasts=gymnasts, standings=standings)
+    with schema_editor.connection.cursor() as cursor:
+        for competition_id in Gymnast.objects.order_by().values_list('competition_id', flat=True).distinct():
+            cursor.execute(ranks, [competition_id, competition_id])
+            cursor.execute(copy, [competition_id, 'gymnast'])
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('competitions', '0011_standings'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gymnast',
+            name='age_rank',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='место среди ровесниц'),
+        ),
+        migrations.AddField(
+            model_name='gymnast',
+            name='category_rank',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='место в разряде'),
+        ),
+        migrations.AddField(
+            model_name='standing',
+            name='age_rank',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='место среди ровесниц'),
+        ),
+        migrations.AddField(
+            model_name='standing',
+            name='category_rank',
+            field=models.PositiveIntegerField(blank=True, null=True, verbose_name='место в разряде'),
+        ),
+        migrations.RunPython(fill_group_ranks, migrations.RunPython.noop),
+    ]
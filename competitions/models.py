@@ -1,7 +1,28 @@
-from django.db import models
+import random
+from decimal import Decimal
+
+from django.db import connection, models, transaction
+from django.db.models import Count, F, Max, Q
+from django.utils import timezone
 from django.core.validators import MaxValueValidator, MinValueValidator
 
+from . import live
 from .choices import CATEGORY
+from .rules import DEFAULT_RULES, RULE_CHOICES, scorer
+from .scoring import from_thousandths, to_thousandths
+
+RANK_SQL = (
+    'UPDATE {table} SET {columns} = ('
+    ' SELECT {places} FROM ('
+    '  SELECT "id", {windows}'
+    '  FROM {table} WHERE "competition_id" = %s AND "result" > 0'
+    ' ) ranked WHERE ranked."id" = {table}."id"'
+    ') WHERE "competition_id" = %s{within}'
+)
+
+
+class CompetitionArchived(Exception):
+    """Запись в соревнование, перенесённое в архив (см. archive)."""
 
 
 class Competition(models.Model):
@@ -20,6 +41,23 @@ class Competition(models.Model):
                                               default=False)
     teams_are_sorted = models.BooleanField(verbose_name='жеребьёвка команд проведена',
                                            default=False)
+    draw_seed = models.PositiveIntegerField(verbose_name='ключ жеребьёвки',
+                                            blank=True, null=True)
+    version = models.PositiveIntegerField(verbose_name='версия результатов',
+                                          default=0, editable=False)
+    modified = models.DateTimeField(verbose_name='результаты изменены',
+                                    default=timezone.now, editable=False)
+    gymnast_apparatus = models.CharField(verbose_name='виды программы гимнасток',
+                                         max_length=256, default='Обруч, Мяч, Булава, Лента',
+                                         help_text='через запятую, в порядке выступления')
+    team_apparatus = models.CharField(verbose_name='виды программы команд',
+                                      max_length=256, default='1 вид, 2 вид',
+                                      help_text='через запятую, в порядке выступления')
+    gymnast_rules = models.CharField(verbose_name='правила подсчёта у гимнасток', max_length=32,
+                                     choices=RULE_CHOICES, default=DEFAULT_RULES)
+    team_rules = models.CharField(verbose_name='правила подсчёта у команд', max_length=32,
+                                  choices=RULE_CHOICES, default=DEFAULT_RULES)
+    archived = models.BooleanField(verbose_name='в архиве', default=False, editable=False)
 
     class Meta:
         ordering = ('start',)
@@ -29,51 +67,214 @@ class Competition(models.Model):
     def __str__(self):
         return self.title
 
+    def save(self, *args, **kwargs):
+        # Версию результатов меняет только touch(): сохранение экземпляра,
+        # загруженного до чужих изменений, не должно откатывать её назад
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in ('version', 'modified')]
+        super().save(*args, **kwargs)
+
+    def lock(self):
+        """Блокирует соревнование до конца текущей транзакции. Всё, что
+        пишет оценки, итоги или места участников, сначала берёт эту
+        блокировку: параллельные сохранения одного соревнования идут по
+        очереди и не блокируют друг друга на строках участников. Архивное
+        соревнование только читается: для него -- CompetitionArchived."""
+        if not connection.in_atomic_block:
+            raise transaction.TransactionManagementError('Блокировка соревнования вне транзакции')
+        if connection.features.has_select_for_update:
+            archived = any(Competition.objects.select_for_update().filter(pk=self.pk)
+                           .values_list('archived', flat=True))
+        else:
+            # В SQLite нет FOR UPDATE: пустое обновление берёт блокировку записи
+            archived = (not Competition.objects.filter(pk=self.pk, archived=False).update(version=F('version'))
+                        and Competition.objects.filter(pk=self.pk, archived=True).exists())
+        if archived:
+            raise CompetitionArchived('Соревнование перенесено в архив, изменять его нельзя')
+
     def make_fullname(self):
         return "%s %s" % (self.start, self.title)
 
     make_fullname.short_description = "Полное название соревнования"
     full_name = property(make_fullname)
 
-    def make_rank_list(self, instance):
+    def apparatus(self, model):
+        """Названия видов программы гимнасток или команд; вид N -- N-е название."""
+        value = self.team_apparatus if model is Team else self.gymnast_apparatus
+        return [name.strip() for name in value.split(',') if name.strip()]
+
+    def scoring_rules(self, model):
+        """Имя правил подсчёта (см. rules.RULE_SETS) гимнасток или команд."""
+        return self.team_rules if model is Team else self.gymnast_rules
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        instance.remember_rules()
+        return instance
+
+    def remember_rules(self):
+        # Сохранённые правила: при их смене участники пересчитываются (см. rules_changed)
+        self._saved_rules = {Gymnast: self.__dict__.get('gymnast_rules'),
+                             Team: self.__dict__.get('team_rules')}
+
+    def rules_changed(self):
+        """Модели участников, у которых правила подсчёта изменились с загрузки из БД."""
+        saved = getattr(self, '_saved_rules', {})
+        return [model for model in (Gymnast, Team)
+                if saved.get(model) is not None and saved[model] != self.scoring_rules(model)]
+
+    def make_rank_list(self, instance, columns=None, within=None):
         if type(instance) is Team:
-            all_items = self.teams.all()
+            model = Team
         else:
-            all_items = self.gymnasts.all()
-        dct = {item.id: item.result for item in all_items if item.result}
-        import operator
-        sorted_dct = sorted(dct.items(), key=operator.itemgetter(1), reverse=True)
-        # if sorted_dct:
-        for i, item in enumerate(sorted_dct):
-            all_items.filter(id=item[0]).update(rank=i+1)
-
-    def sortition(self):
+            model = Gymnast
+        # RANK() даёт общее место при равных итогах (1-2-2-4); участники без
+        # итога остаются без места. Общее место и места внутри групп (разряда,
+        # года рождения, см. rankings) считаются одним UPDATE за один проход.
+        # columns ограничивает пересчитываемые места, within -- строки:
+        # {поле: значения}, достаточно совпадения любого поля.
+        qn = connection.ops.quote_name
+        rankings = [(column, field) for column, field in model.rankings if columns is None or column in columns]
+        names = [qn(column) for column, field in rankings]
+        windows = ['RANK() OVER (%sORDER BY "result" DESC) AS %s' % (
+            'PARTITION BY %s ' % qn(field) if field else '', name) for name, (column, field) in zip(names, rankings)]
+        params, conditions = [], []
+        for field, values in (within or {}).items():
+            values = [value for value in values if value is not None]
+            conditions.append('%s IN (%s)' % (qn(field), ', '.join(['%s'] * len(values))) if values else '0 = 1')
+            params += values
+        sql = RANK_SQL.format(table=qn(model._meta.db_table),
+                              columns=names[0] if len(names) == 1 else '(%s)' % ', '.join(names),
+                              places=', '.join('ranked.%s' % name for name in names),
+                              windows=', '.join(windows),
+                              within=' AND (%s)' % ' OR '.join(conditions) if conditions else '')
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [self.pk, self.pk] + params)
+
+    def update_group_ranks(self, instance, old_result):
+        # Места внутри групп пересчитываются только в группах участника до и
+        # после изменения и только если сменились итог или сама группа.
+        # Возвращает, как и update_rank_list, условие на участников с
+        # пересчитанными местами (None -- все).
+        groups = [(column, field) for column, field in type(instance).rankings if field]
+        if not groups:
+            return Q(pk__in=[])
+        columns = [column for column, field in groups]
+        saved = getattr(instance, '_saved_groups', {})
+        if not all(field in saved for column, field in groups):
+            self.make_rank_list(instance, columns=columns)
+            return None
+        if ((old_result or 0) == (instance.stored_result() or 0) and
+                all(saved[field] == getattr(instance, field) for column, field in groups)):
+            return Q(pk__in=[])
+        within = {field: {saved[field], getattr(instance, field)} for column, field in groups}
+        self.make_rank_list(instance, columns=columns, within=within)
+        moved = Q(pk__in=[])
+        for field, values in within.items():
+            moved |= Q(**{field + '__in': list(values)})
+        return moved
+
+    def update_rank_list(self, instance, old_result):
+        # Место участника X = 1 + число участников с большим итогом. Когда итог X
+        # меняется с old на new, места остальных сдвигаются только у тех, чей
+        # итог лежит в [min(old, new), max(old, new)). Возвращает условие на
+        # участников, чьи места сдвинулись (None -- пересчитаны все).
+        model = type(instance)
+        items = model.objects.filter(competition=self)
+        others = ~Q(pk=instance.pk)
+        old = old_result if old_result and old_result > 0 else 0
+        new = instance.stored_result()
+        new = new if new and new > 0 else 0
+        if old == new:
+            return Q(pk__in=[])
+        with transaction.atomic():
+            state = items.aggregate(
+                own_rank=Max('rank', filter=Q(pk=instance.pk)),
+                above_old=Count('pk', filter=others & Q(result__gt=old)),
+                above_new=Count('pk', filter=others & Q(result__gt=new)),
+                unranked=Count('pk', filter=others & Q(result__gt=0, rank__isnull=True)))
+            expected = state['above_old'] + 1 if old else None
+            if state['own_rank'] != expected or state['unranked']:
+                self.make_rank_list(instance)
+                return None
+            moved = others & Q(result__gt=0, result__gte=min(old, new), result__lt=max(old, new))
+            items.filter(moved).update(rank=F('rank') + 1 if new > old else F('rank') - 1)
+            items.filter(pk=instance.pk).update(rank=state['above_new'] + 1 if new else None)
+        return moved
+
+    def touch(self):
+        # Новая версия делает недействительными закэшированные страницы результатов
+        self.modified = timezone.now()
+        Competition.objects.filter(pk=self.pk).update(version=F('version') + 1,
+                                                      modified=self.modified)
+        live.competition_changed(self.pk)
+
+    def rescore(self, chunk_size=2000, models=None):
+        from .scoring import rescore
+        counts = {}
+        with transaction.atomic():
+            self.lock()
+            for model in models or (Gymnast, Team):
+                counts[model] = rescore(model.objects.filter(competition=self), chunk_size)
+                self.make_rank_list(model())
+                self.update_standings(model, chunk_size=chunk_size)
+            self.touch()
+        self.remember_rules()
+        return counts
+
+    def sortition(self, seed=None):
+        # Номера раздаются по первичному ключу, а ключ жеребьёвки сохраняется:
+        # sortition(seed=competition.draw_seed) повторяет ту же жеребьёвку.
+        # Если одна сторона уже разыграна, вторая разыгрывается её ключом,
+        # иначе сохранённый ключ перестал бы повторять уже выданные номера.
+        if (self.gymnasts_are_sorted or self.teams_are_sorted) and self.draw_seed is not None:
+            seed = self.draw_seed
+        elif seed is None:
+            seed = random.SystemRandom().randrange(2 ** 31)
+        self.draw_seed = seed
         if not self.gymnasts_are_sorted:
-            gymnast_list = list(self.gymnasts.all())
-            import random
-            random.shuffle(gymnast_list, random.random)
-            for i, g in enumerate(gymnast_list):
-                gymnast = self.gymnasts.all().filter(name=g.name)
-                gymnast.update(number=i+1)
+            self._draw(Gymnast, seed)
             self.gymnasts_are_sorted = True
         if not self.teams_are_sorted:
-            team_list = list(self.teams.all())
-            import random
-            random.shuffle(team_list, random.random)
-            for i, item in enumerate(team_list):
-                team = self.teams.all().filter(name=item.name)
-                team.update(number=i+1)
+            self._draw(Team, seed)
             self.teams_are_sorted = True
 
+    def _draw(self, model, seed):
+        items = list(model.objects.filter(competition=self).order_by('pk').only('pk'))
+        random.Random('%s-%s' % (seed, model._meta.model_name)).shuffle(items)
+        for i, item in enumerate(items):
+            item.number = i + 1
+        model.objects.bulk_update(items, ['number'])
+        self.update_standings(model, [])
+
+    @classmethod
+    def sortition_many(cls, competitions, seed=None):
+        with transaction.atomic():
+            for competition in competitions:
+                competition.lock()
+                competition.sortition(seed)
+                competition.save(update_fields=['draw_seed',
+                                                 'gymnasts_are_sorted',
+                                                 'teams_are_sorted'])
+
     def unsortition_gymnast(self):
         self.gymnasts.all().update(number=None)
+        self.update_standings(Gymnast, [])
         self.gymnasts_are_sorted = False
-        self.save()
+        self.save(update_fields=['gymnasts_are_sorted'])
 
     def unsortition_team(self):
         self.teams.all().update(number=None)
+        self.update_standings(Team, [])
         self.teams_are_sorted = False
-        self.save()
+        self.save(update_fields=['teams_are_sorted'])
+
+    def update_standings(self, model, pks=None, moved=None, chunk_size=2000):
+        # Таблица результатов для публичных страниц, см. standings
+        from .standings import update_standings
+        update_standings(self, model, pks, moved, chunk_size)
 
 
 class CommonInfo(models.Model):
@@ -88,96 +289,10 @@ class CommonInfo(models.Model):
                                          blank=True, null=True)
     rank = models.PositiveIntegerField(verbose_name='место в зачёте',
                                        blank=True, null=True)
-    # Оценка D
-    tv1d = models.DecimalField(verbose_name='окончательная оценка D',
-                               max_digits=5, decimal_places=3, blank=True, null=True)
-    tv2d = models.DecimalField(verbose_name='окончательная оценка D',
-                               max_digits=5, decimal_places=3, blank=True, null=True)
-    tv3d = models.DecimalField(verbose_name='окончательная оценка D',
-                               max_digits=5, decimal_places=3, blank=True, null=True)
-    tv4d = models.DecimalField(verbose_name='окончательная оценка D',
-                               max_digits=5, decimal_places=3, blank=True, null=True)
 
-    # Оценка E
-    tv1e = models.DecimalField(verbose_name='окончательная оценка E',
-                               max_digits=5, decimal_places=3, blank=True, null=True)
-    tv2e = models.DecimalField(verbose_name='окончательная оценка E',
-                               max_digits=5, decimal_places=3, blank=True, null=True)
-    tv3e = models.DecimalField(verbose_name='окончательная оценка E',
-                               max_digits=5, decimal_places=3, blank=True, null=True)
-    tv4e = models.DecimalField(verbose_name='окончательная оценка E',
-                               max_digits=5, decimal_places=3, blank=True, null=True)
-
-    score1 = models.DecimalField(verbose_name='оценка',
-                                 max_digits=5, decimal_places=3, blank=True, null=True)
-    score2 = models.DecimalField(verbose_name='оценка',
-                                 max_digits=5, decimal_places=3, blank=True, null=True)
-    score3 = models.DecimalField(verbose_name='оценка',
-                                 max_digits=5, decimal_places=3, blank=True, null=True)
-    score4 = models.DecimalField(verbose_name='оценка',
-                                 max_digits=5, decimal_places=3, blank=True, null=True)
-
-    result1 = models.DecimalField(verbose_name='сумма',
-                                  max_digits=5, decimal_places=3, blank=True, null=True)
-    result2 = models.DecimalField(verbose_name='сумма',
-                                  max_digits=5, decimal_places=3, blank=True, null=True)
-    result3 = models.DecimalField(verbose_name='сумма',
-                                  max_digits=5, decimal_places=3, blank=True, null=True)
-    result4 = models.DecimalField(verbose_name='сумма',
-                                  max_digits=5, decimal_places=3, blank=True, null=True)
-
-    pv1k = models.FloatField(verbose_name='сбавка', blank=True, null=True)
-    pv2k = models.FloatField(verbose_name='сбавка', blank=True, null=True)
-    pv3k = models.FloatField(verbose_name='сбавка', blank=True, null=True)
-    pv4k = models.FloatField(verbose_name='сбавка', blank=True, null=True)
-
-    # Обруч
-    v1d1 = models.FloatField(verbose_name='D1/D2', blank=True, null=True)
-    v1d2 = models.FloatField(verbose_name='D3/D4', blank=True, null=True)
-    v1d3 = models.FloatField(blank=True, null=True)
-    v1d4 = models.FloatField(blank=True, null=True)
-
-    v1e1 = models.FloatField(verbose_name='E1/E2', blank=True, null=True)
-    v1e2 = models.FloatField(verbose_name='E3', blank=True, null=True)
-    v1e3 = models.FloatField(verbose_name='E4', blank=True, null=True)
-    v1e4 = models.FloatField(verbose_name='E5', blank=True, null=True)
-    v1e5 = models.FloatField(verbose_name='E6', blank=True, null=True)
-
-    # Мяч
-    v2d1 = models.FloatField(verbose_name='D1/D2', blank=True, null=True)
-    v2d2 = models.FloatField(verbose_name='D3/D4', blank=True, null=True)
-    v2d3 = models.FloatField(blank=True, null=True)
-    v2d4 = models.FloatField(blank=True, null=True)
-
-    v2e1 = models.FloatField(verbose_name='E1/E2', blank=True, null=True)
-    v2e2 = models.FloatField(verbose_name='E3', blank=True, null=True)
-    v2e3 = models.FloatField(verbose_name='E4', blank=True, null=True)
-    v2e4 = models.FloatField(verbose_name='E5', blank=True, null=True)
-    v2e5 = models.FloatField(verbose_name='E6', blank=True, null=True)
-
-    # Булава
-    v3d1 = models.FloatField(verbose_name='D1/D2', blank=True, null=True)
-    v3d2 = models.FloatField(verbose_name='D3/D4', blank=True, null=True)
-    v3d3 = models.FloatField(blank=True, null=True)
-    v3d4 = models.FloatField(blank=True, null=True)
-
-    v3e1 = models.FloatField(verbose_name='E1/E2', blank=True, null=True)
-    v3e2 = models.FloatField(verbose_name='E3', blank=True, null=True)
-    v3e3 = models.FloatField(verbose_name='E4', blank=True, null=True)
-    v3e4 = models.FloatField(verbose_name='E5', blank=True, null=True)
-    v3e5 = models.FloatField(verbose_name='E6', blank=True, null=True)
-
-    # Лента
-    v4d1 = models.FloatField(verbose_name='D1/D2', blank=True, null=True)
-    v4d2 = models.FloatField(verbose_name='D3/D4', blank=True, null=True)
-    v4d3 = models.FloatField(blank=True, null=True)
-    v4d4 = models.FloatField(blank=True, null=True)
-
-    v4e1 = models.FloatField(verbose_name='E1/E2', blank=True, null=True)
-    v4e2 = models.FloatField(verbose_name='E3', blank=True, null=True)
-    v4e3 = models.FloatField(verbose_name='E4', blank=True, null=True)
-    v4e4 = models.FloatField(verbose_name='E5', blank=True, null=True)
-    v4e5 = models.FloatField(verbose_name='E6', blank=True, null=True)
+    # (столбец места, поле группы): места считаются внутри групп участников
+    # с одинаковым значением поля, None -- общее место в соревновании
+    rankings = (('rank', None),)
 
     class Meta:
         abstract = True
@@ -185,6 +300,80 @@ class CommonInfo(models.Model):
     def __str__(self):
         return self.name
 
+    def save(self, *args, **kwargs):
+        # Места и номер меняют только их пересчёт и жеребьёвка: сохранение
+        # экземпляра, загруженного до чужих изменений, не должно откатывать их
+        if not self._state.adding and not kwargs.get('force_insert') and kwargs.get('update_fields') is None:
+            positions = ['number'] + [column for column, field in self.rankings]
+            kwargs['update_fields'] = [field.name for field in self._meta.concrete_fields
+                                       if not field.primary_key and field.name not in positions]
+        # Места пересчитываются в post_save, под той же блокировкой
+        with transaction.atomic():
+            self.lock_competitions()
+            super().save(*args, **kwargs)
+
+    def delete(self, *args, **kwargs):
+        with transaction.atomic():
+            self.lock_competitions()
+            return super().delete(*args, **kwargs)
+
+    def lock_competitions(self):
+        # При переносе в другое соревнование блокируются оба, по порядку ключей
+        saved = getattr(self, '_saved_standing', (None, None))[0]
+        for pk in sorted({saved, self.competition_id} - {None}):
+            Competition(pk=pk).lock()
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        instance = super().from_db(db, field_names, values)
+        # Сохранённые соревнование, итог и группы: по ним пересчитываются
+        # только сдвинувшиеся места (см. update_rank)
+        instance._saved_standing = (instance.__dict__.get('competition_id'),
+                                    instance.__dict__.get('result'))
+        instance._saved_groups = instance.loaded_groups()
+        return instance
+
+    def update_rank(self, created):
+        if created:
+            competition_id, old_result = self.competition_id, 0
+            # новый участник меняет места только в своих группах
+            self._saved_groups = self.loaded_groups()
+        else:
+            competition_id, old_result = getattr(self, '_saved_standing', (None, None))
+        moved = None
+        if competition_id == self.competition_id and old_result is not None:
+            window = self.competition.update_rank_list(self, old_result)
+            groups = self.competition.update_group_ranks(self, old_result)
+            if window is not None and groups is not None:
+                moved = window | groups
+        else:
+            if competition_id is not None:
+                Competition(pk=competition_id).make_rank_list(self)
+                Competition(pk=competition_id).update_standings(type(self), [self.pk])
+            self.competition.make_rank_list(self)
+        # в таблице результатов места обновляются только у сдвинувшихся
+        self.competition.update_standings(type(self), [self.pk], moved)
+        self.remember_standing()
+
+    def remember_standing(self):
+        # Соревнование, итог и группы, по которым посчитаны места
+        self._saved_standing = (self.competition_id, self.stored_result())
+        self._saved_groups = self.loaded_groups()
+
+    def loaded_groups(self):
+        # отложенные (не выбранные из БД) поля групп не читаются
+        return {field: self.__dict__[field] for column, field in self.rankings
+                if field and field in self.__dict__}
+
+    def stored_result(self):
+        # update_result считает итог во float; сравнивать с другими итогами нужно
+        # уже округлённое значение, как оно записано в БД
+        field = self._meta.get_field('result')
+        value = field.to_python(self.result)
+        if value is None:
+            return None
+        return value.quantize(Decimal(1).scaleb(-field.decimal_places), context=field.context)
+
     # def calc_position(self):
     #     sorted_dct = self.competition.make_rank_list(self)
     #     if sorted_dct:
@@ -202,53 +391,42 @@ class CommonInfo(models.Model):
         lst = [item for item in args if item]
         return sum(lst) if lst else None
 
-    def make_tv_d(self, *args):
-        lst = [item for item in args if item]
-        return sum(lst) if lst else None
-
-    # result_e = {
-    #     0: lambda x: None,
-    #     1: lambda x: sum(x),
-    #     2: lambda x: sum(x) / 2,
-    #     3: lambda x: sum(x) - (min(x) + max(x)),
-    #     4: lambda x: (sum(x) - (min(x) + max(x))) / 2,
-    #     5: lambda x: (sum(x) - (min(x) + max(x))) / 3
-    # }
-    #
-    # def make_tv_e(self, *args):
-    #     lst1 = []
-    #     i = 0
-    #     for item in args:
-    #         if item:
-    #             i = i + 1
-    #             lst1.append(item)
-    #     return self.result_e[i](lst1)
-
-    def make_tv_e(self, *args):
-        if list(filter(lambda x: x is not None, args)):
-            lst = []
-            for item in args:
-                if item:
-                    lst.append(item)
-                else:
-                    lst.append(0)
-                    print(item)
-            return 10 - (lst[0] + (sum(lst[1:]) - (min(lst[1:]) + max(lst[1:])))/2)
-        else:
-            return None
-
-    def calc_total_score(self, *args):
-        lst = [item for item in args if item]
-        return sum(lst) if lst else None
-
-    def calc_total_result(self, score, penalty):
-        if score and penalty:
-            res = score - penalty
-        elif score and not penalty:
-            res = score
-        else:
-            res = None
-        return res
+    def update_result(self):
+        """Пересчитывает выступления и итог участника по оценкам судей и
+        сохраняет их. Участник без единой оценки не пересчитывается."""
+        rules = self.competition.scoring_rules(type(self))
+        with transaction.atomic():
+            self.competition.lock()
+            performances = list(self.performances.order_by('apparatus').prefetch_related('marks'))
+            if not any(performance.has_marks(rules) for performance in performances):
+                return
+            for performance in performances:
+                performance.calculate(rules)
+            Performance.objects.bulk_update(performances, Performance.derived_fields)
+            self.result = self.calc_result(*[performance.result for performance in performances]) or 0
+            self.save(update_fields=['result'])
+
+    def apparatus_results(self, count):
+        """Суммы по видам 1..count; выступления должны быть выбраны заранее
+        (prefetch_related('performances'))."""
+        results = {performance.apparatus: performance.result
+                   for performance in self.performances.all()}
+        return [results.get(apparatus) for apparatus in range(1, count + 1)]
+
+    def member_names(self):
+        return []
+
+
+def competitor_indexes(prefix):
+    # Все выборки участников идут внутри одного соревнования: протокол
+    # (по итогу), таблица победителей и пересчёт мест (по месту и итогу),
+    # стартовый лист и фильтры админки (по номеру и имени)
+    return [
+        models.Index(fields=['competition', '-result'], name='%s_comp_result_idx' % prefix),
+        models.Index(fields=['competition', 'rank'], name='%s_comp_rank_idx' % prefix),
+        models.Index(fields=['competition', 'number'], name='%s_comp_number_idx' % prefix),
+        models.Index(fields=['competition', 'name'], name='%s_comp_name_idx' % prefix),
+    ]
 
 
 class Team(CommonInfo):
@@ -256,6 +434,11 @@ class Team(CommonInfo):
     class Meta:
         verbose_name = 'команда'
         verbose_name_plural = 'команды'
+        indexes = competitor_indexes('team')
+
+    def member_names(self):
+        # члены команды должны быть выбраны заранее (prefetch_related('team_gymnasts'))
+        return [member.name for member in self.team_gymnasts.all()]
 
 
 class TeamGymnast(models.Model):
@@ -272,6 +455,7 @@ class TeamGymnast(models.Model):
 
 
 class Gymnast(CommonInfo):
+
     year_of_birth = models.PositiveIntegerField(verbose_name='год рождения',
                                                 validators=[MinValueValidator(2000),
                                                             MaxValueValidator(2018)])
@@ -279,10 +463,17 @@ class Gymnast(CommonInfo):
                                 verbose_name='разряд',
                                 choices=CATEGORY,
                                 blank=True)
+    category_rank = models.PositiveIntegerField(verbose_name='место в разряде',
+                                                blank=True, null=True)
+    age_rank = models.PositiveIntegerField(verbose_name='место среди ровесниц',
+                                           blank=True, null=True)
+
+    rankings = CommonInfo.rankings + (('category_rank', 'category'), ('age_rank', 'year_of_birth'))
 
     class Meta:
         verbose_name = 'гимнастка'
         verbose_name_plural = 'гимнастки'
+        indexes = competitor_indexes('gymnast')
 
     # def was_ranked(self):
     #     return self.rank_position is not None
@@ -295,3 +486,183 @@ class Gymnast(CommonInfo):
     #     for cat in CATEGORY:
     #         if cat[0] == self.category:
     #             return cat[1]
+
+
+class Performance(models.Model):
+    """Выступление гимнастки или команды в одном виде программы."""
+    gymnast = models.ForeignKey(Gymnast, verbose_name='гимнастка', related_name='performances',
+                                blank=True, null=True, on_delete=models.CASCADE)
+    team = models.ForeignKey(Team, verbose_name='команда', related_name='performances',
+                             blank=True, null=True, on_delete=models.CASCADE)
+    apparatus = models.PositiveSmallIntegerField(verbose_name='вид программы',
+                                                 validators=[MinValueValidator(1)])
+    penalty = models.PositiveIntegerField(verbose_name='сбавка, тысячные балла', blank=True, null=True)
+    tv_d = models.DecimalField(verbose_name='окончательная оценка D',
+                               max_digits=5, decimal_places=3, blank=True, null=True)
+    tv_e = models.DecimalField(verbose_name='окончательная оценка E',
+                               max_digits=5, decimal_places=3, blank=True, null=True)
+    score = models.DecimalField(verbose_name='оценка',
+                                max_digits=5, decimal_places=3, blank=True, null=True)
+    result = models.DecimalField(verbose_name='сумма',
+                                 max_digits=5, decimal_places=3, blank=True, null=True)
+
+    derived_fields = ['tv_d', 'tv_e', 'score', 'result']
+
+    class Meta:
+        verbose_name = 'выступление'
+        verbose_name_plural = 'выступления'
+        unique_together = (('gymnast', 'apparatus'), ('team', 'apparatus'))
+        constraints = [
+            models.CheckConstraint(check=Q(gymnast__isnull=False, team__isnull=True) |
+                                         Q(gymnast__isnull=True, team__isnull=False),
+                                   name='performance_has_one_competitor'),
+        ]
+
+    def __str__(self):
+        return '%s, %s вид' % (self.competitor, self.apparatus)
+
+    @property
+    def competitor(self):
+        return self.gymnast if self.gymnast_id else self.team
+
+    def panel_marks(self, panel, slots):
+        # Оценки панели в тысячных по порядку судей, None -- оценки нет
+        values = {mark.slot: mark.value for mark in self.marks.all() if mark.panel == panel}
+        return [values.get(slot) for slot in slots]
+
+    def has_marks(self, rules=DEFAULT_RULES):
+        # Оценки судей, которых нет в бригаде по правилам, не учитываются
+        slots = {Mark.D: scorer(rules).d_slots, Mark.E: scorer(rules).e_slots}
+        return any(mark.value for mark in self.marks.all() if mark.slot in slots[mark.panel])
+
+    def set_marks(self, d=(), e=()):
+        """Заменяет оценки судей: d и e -- оценки панелей D и E в баллах по
+        порядку судей, None -- оценки нет. Итог участника пересчитывает
+        update_result()."""
+        with transaction.atomic():
+            Competition(pk=self.competitor.competition_id).lock()
+            self.save()
+            self.marks.all().delete()
+            Mark.objects.bulk_create(
+                [Mark(performance=self, panel=panel, slot=slot, value=to_thousandths(value))
+                 for panel, values in ((Mark.D, d), (Mark.E, e))
+                 for slot, value in enumerate(values, 1) if value is not None])
+        if hasattr(self, '_prefetched_objects_cache'):
+            self._prefetched_objects_cache.pop('marks', None)
+
+    def calculate(self, rules=DEFAULT_RULES):
+        # Считается в тысячных, в баллы переводятся только сохраняемые значения
+        rules = scorer(rules)
+        values = rules.performance(self.panel_marks(Mark.D, rules.d_slots),
+                                   self.panel_marks(Mark.E, rules.e_slots), self.penalty)
+        self.tv_d, self.tv_e, self.score, self.result = map(from_thousandths, values)
+
+
+class Mark(models.Model):
+    D = 'D'
+    E = 'E'
+    PANELS = (
+        (D, 'D (трудность)'),
+        (E, 'E (исполнение)'),
+    )
+
+    performance = models.ForeignKey(Performance, verbose_name='выступление',
+                                    related_name='marks', on_delete=models.CASCADE)
+    panel = models.CharField(verbose_name='бригада', max_length=1, choices=PANELS)
+    slot = models.PositiveSmallIntegerField(verbose_name='судья')
+    value = models.PositiveIntegerField(verbose_name='оценка, тысячные балла')
+
+    class Meta:
+        verbose_name = 'оценка судьи'
+        verbose_name_plural = 'оценки судей'
+        unique_together = ('performance', 'panel', 'slot')
+
+    def __str__(self):
+        return '%s%s: %s' % (self.panel, self.slot, self.value)
+
+
+class Standing(models.Model):
+    """Строка таблицы результатов (см. standings): место, итог и суммы по
+    видам участника, посчитанные заранее. У архивного соревнования (см.
+    archive) остаются только эти строки. Поля и методы для страниц -- те же,
+    что у гимнастки и команды."""
+    KINDS = (
+        ('gymnast', 'гимнастка'),
+        ('team', 'команда'),
+    )
+
+    competition = models.ForeignKey(Competition, verbose_name='соревнование',
+                                    related_name='standings', on_delete=models.CASCADE)
+    kind = models.CharField(verbose_name='участник', max_length=8, choices=KINDS)
+    competitor_id = models.PositiveIntegerField(verbose_name='id гимнастки или команды')
+    name = models.CharField(verbose_name='имя', max_length=256)
+    year_of_birth = models.PositiveIntegerField(verbose_name='год рождения', blank=True, null=True)
+    category = models.CharField(verbose_name='разряд', max_length=5, choices=CATEGORY, blank=True)
+    city = models.CharField(verbose_name='город', max_length=32, blank=True)
+    coach = models.CharField(verbose_name='тренер', max_length=128, blank=True)
+    number = models.PositiveIntegerField(verbose_name='порядковый номер выступления',
+                                         blank=True, null=True)
+    rank = models.PositiveIntegerField(verbose_name='место в зачёте', blank=True, null=True)
+    category_rank = models.PositiveIntegerField(verbose_name='место в разряде', blank=True, null=True)
+    age_rank = models.PositiveIntegerField(verbose_name='место среди ровесниц', blank=True, null=True)
+    result = models.DecimalField(verbose_name='итог', max_digits=5, decimal_places=3, default=0)
+    apparatus_sums = models.TextField(verbose_name='суммы по видам', blank=True,
+                                      help_text='через ";" по порядку видов, пусто -- суммы нет')
+    members = models.TextField(verbose_name='члены команды', blank=True,
+                               help_text='по одной гимнастке в строке')
+
+    class Meta:
+        verbose_name = 'строка таблицы результатов'
+        verbose_name_plural = 'строки таблицы результатов'
+        unique_together = ('competition', 'kind', 'competitor_id')
+        indexes = [
+            models.Index(fields=['competition', 'kind', 'rank'], name='standing_comp_rank_idx'),
+            models.Index(fields=['competition', 'kind', '-result'], name='standing_comp_result_idx'),
+            models.Index(fields=['competition', 'kind', 'number'], name='standing_comp_number_idx'),
+        ]
+
+    def __str__(self):
+        return self.name
+
+    def apparatus_results(self, count):
+        sums = self.apparatus_sums.split(';') if self.apparatus_sums else []
+        sums += [''] * (count - len(sums))
+        return [Decimal(value) if value else None for value in sums[:count]]
+
+    def member_names(self):
+        return self.members.splitlines()
+
+
+class ArchivedPerformance(models.Model):
+    """Выступление из архивного соревнования, как Performance."""
+    standing = models.ForeignKey(Standing, verbose_name='участник', related_name='performances',
+                                 on_delete=models.CASCADE)
+    apparatus = models.PositiveSmallIntegerField(verbose_name='вид программы')
+    penalty = models.PositiveIntegerField(verbose_name='сбавка, тысячные балла', blank=True, null=True)
+    tv_d = models.DecimalField(verbose_name='окончательная оценка D',
+                               max_digits=5, decimal_places=3, blank=True, null=True)
+    tv_e = models.DecimalField(verbose_name='окончательная оценка E',
+                               max_digits=5, decimal_places=3, blank=True, null=True)
+    score = models.DecimalField(verbose_name='оценка',
+                                max_digits=5, decimal_places=3, blank=True, null=True)
+    result = models.DecimalField(verbose_name='сумма',
+                                 max_digits=5, decimal_places=3, blank=True, null=True)
+
+    class Meta:
+        verbose_name = 'архивное выступление'
+        verbose_name_plural = 'архивные выступления'
+        unique_together = ('standing', 'apparatus')
+
+
+class ArchivedMark(models.Model):
+    """Оценка судьи из архивного соревнования, как Mark."""
+    performance = models.ForeignKey(ArchivedPerformance, verbose_name='выступление',
+                                    related_name='marks', on_delete=models.CASCADE)
+    panel = models.CharField(verbose_name='бригада', max_length=1, choices=Mark.PANELS)
+    slot = models.PositiveSmallIntegerField(verbose_name='судья')
+    value = models.PositiveIntegerField(verbose_name='оценка, тысячные балла')
+
+    class Meta:
+        verbose_name = 'архивная оценка судьи'
+        verbose_name_plural = 'архивные оценки судей'
+        unique_together = ('performance', 'panel', 'slot')
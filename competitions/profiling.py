@@ -0,0 +1,129 @@
+"""Профилирование запросов без внешнего APM.
+
+ProfilingMiddleware (включается settings.PROFILING) замеряет каждый запрос:
+общее время, число и время SQL-запросов, время отрисовки шаблонов. Замеры
+копятся в памяти процесса по имени URL-шаблона и методу ("GET competitions:
+protocol", "POST admin:competitions_gymnast_change") и отдаются персоналу
+по адресу competitions/profile; при settings.PROFILING_LOG каждый запрос
+дописывается строкой JSON в этот файл.
+"""
+import json
+import threading
+import time
+from contextlib import ExitStack
+
+from django.db import connections
+from django.template.base import Template
+from django.utils import timezone
+
+_local = threading.local()
+_render = Template.render
+
+
+class QueryCounter:
+    """Считает запросы и их время через connection.execute_wrapper; в отличие
+    от CaptureQueriesContext не сбрасывается в начале запроса тестового клиента."""
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.seconds += time.perf_counter() - started
+
+
+def _timed_render(self, context):
+    # Вложенные шаблоны ({% include %}, {% extends %}) входят во время внешнего
+    sample = getattr(_local, 'sample', None)
+    if sample is None or sample.rendering:
+        return _render(self, context)
+    sample.rendering = True
+    started = time.perf_counter()
+    try:
+        return _render(self, context)
+    finally:
+        sample.rendering = False
+        sample.template_seconds += time.perf_counter() - started
+
+
+def install_template_timer():
+    Template.render = _timed_render
+
+
+class Sample:
+
+    def __init__(self):
+        self.queries = QueryCounter()
+        self.template_seconds = 0.0
+        self.rendering = False
+
+
+class Stats:
+    FIELDS = ('seconds', 'queries', 'sql_seconds', 'template_seconds')
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.views = {}
+
+    def add(self, key, values):
+        with self.lock:
+            row = self.views.get(key)
+            if row is None:
+                row = self.views[key] = dict({name: 0 for name in self.FIELDS},
+                                             requests=0, max_seconds=0.0)
+            row['requests'] += 1
+            row['max_seconds'] = max(row['max_seconds'], values['seconds'])
+            for name in self.FIELDS:
+                row[name] += values[name]
+
+    def report(self):
+        """Сводка по видам запросов, самые затратные (по общему времени) первыми."""
+        with self.lock:
+            rows = [dict(row, view=key) for key, row in self.views.items()]
+        for row in rows:
+            for name in self.FIELDS:
+                row['mean_' + name] = row[name] / row['requests']
+        return sorted(rows, key=lambda row: row['seconds'], reverse=True)
+
+    def reset(self):
+        with self.lock:
+            self.views = {}
+
+
+stats = Stats()
+_log_lock = threading.Lock()
+
+
+def view_key(request):
+    match = getattr(request, 'resolver_match', None)
+    name = match.view_name if match else 'unresolved'
+    return '%s %s' % (request.method, name)
+
+
+def profile(request, get_response, log=None):
+    sample = _local.sample = Sample()
+    started = time.perf_counter()
+    try:
+        with ExitStack() as stack:
+            for connection in connections.all():
+                stack.enter_context(connection.execute_wrapper(sample.queries))
+            response = get_response(request)
+    finally:
+        _local.sample = None
+    values = {'seconds': time.perf_counter() - started,
+              'queries': sample.queries.count,
+              'sql_seconds': sample.queries.seconds,
+              'template_seconds': sample.template_seconds}
+    key = view_key(request)
+    stats.add(key, values)
+    if log:
+        line = dict(values, time=timezone.now().isoformat(), view=key,
+                    path=request.path, status=response.status_code)
+        with _log_lock, open(log, 'a', encoding='utf-8') as file:
+            file.write(json.dumps(line, ensure_ascii=False) + '\n')
+    return response
@@ -0,0 +1,130 @@
+"""Правила подсчёта оценок: состав бригад и формула оценки E.
+
+Правила выбираются в соревновании отдельно для гимнасток и для команд
+(Competition.gymnast_rules, team_rules) из RULE_SETS. scorer() один раз
+собирает по правилам функции подсчёта -- поштучную для Performance.calculate
+и пакетную на numpy для scoring.rescore -- и кэширует их по имени правил.
+
+Все значения -- целые тысячные балла (см. scoring.to_thousandths). Нулевая
+оценка считается отсутствующей.
+"""
+from collections import OrderedDict
+from functools import lru_cache
+
+import numpy as np
+
+# Больше оценок не хранится и не вводится: D1/D2, D3/D4 и E1/E2, E3..E6
+D_SLOTS = (1, 2)
+E_SLOTS = (1, 2, 3, 4, 5)
+SCALE = 1000
+MAX_SCORE = 10 * SCALE
+
+
+class RuleSet:
+    """d_judges оценок D складываются; оценка E -- 10 минус сбавка за
+    исполнение: первая оценка E (если e_first_apart) плюс среднее остальных
+    e_judges оценок без trim наименьших и trim наибольших. Среднее
+    округляется до тысячной половиной вверх."""
+
+    def __init__(self, name, label, d_judges, e_judges, e_first_apart, trim):
+        if not 1 <= d_judges <= len(D_SLOTS) or not 1 <= e_judges <= len(E_SLOTS):
+            raise ValueError('Не больше %s оценок D и %s оценок E' % (len(D_SLOTS), len(E_SLOTS)))
+        if e_judges - e_first_apart - 2 * trim < 1:
+            raise ValueError('После отбрасывания крайних не остаётся оценок E')
+        self.name = name
+        self.label = label
+        self.d_judges = d_judges
+        self.e_judges = e_judges
+        self.e_first_apart = e_first_apart
+        self.trim = trim
+
+    def __str__(self):
+        return self.label
+
+
+RULE_SETS = OrderedDict((rules.name, rules) for rules in [
+    RuleSet('fig', 'FIG: две оценки D; E1/E2 и среднее E3-E6 без крайних', 2, 5, True, 1),
+    RuleSet('reduced', 'Малая бригада: две оценки D; E1/E2 и среднее двух E', 2, 3, True, 0),
+    RuleSet('simple', 'Упрощённые: одна оценка D; среднее трёх E', 1, 3, False, 0),
+])
+DEFAULT_RULES = 'fig'
+RULE_CHOICES = [(rules.name, rules.label) for rules in RULE_SETS.values()]
+
+
+def present(values):
+    return ~np.isnan(values) & (values != 0)
+
+
+def _sum_present(values, mask):
+    total = np.where(mask, values, 0).sum(axis=-1)
+    return np.where(mask.any(axis=-1), total, np.nan)
+
+
+class Scorer:
+    """Функции подсчёта по правилам rules; создаётся через scorer()."""
+
+    def __init__(self, rules):
+        self.rules = rules
+        self.d_slots = D_SLOTS[:rules.d_judges]
+        self.e_slots = E_SLOTS[:rules.e_judges]
+        self.first = 1 if rules.e_first_apart else 0
+        self.kept = slice(rules.trim, rules.e_judges - self.first - rules.trim)
+        self.count = rules.e_judges - self.first - 2 * rules.trim
+
+    def mark_names(self):
+        """Ключи оценок по правилам, как в scoring.mark_names()."""
+        return (['d%s' % slot for slot in self.d_slots] + ['e%s' % slot for slot in self.e_slots] +
+                ['penalty'])
+
+    def mean(self, total):
+        # total / count с округлением половины вверх, total >= 0
+        return (2 * total + self.count) // (2 * self.count)
+
+    def performance(self, d, e, penalty):
+        """(tv_d, tv_e, score, result) одного выступления; d и e -- оценки
+        панелей по порядку судей (None -- нет оценки)."""
+        given = [value for value in d[:len(self.d_slots)] if value]
+        tv_d = sum(given) if given else None
+        e = list(e[:len(self.e_slots)])
+        tv_e = None
+        if any(value is not None for value in e):
+            marks = [value or 0 for value in e] + [0] * (len(self.e_slots) - len(e))
+            first = marks[0] if self.first else 0
+            rest = sorted(marks[self.first:])[self.kept]
+            tv_e = MAX_SCORE - (first + self.mean(sum(rest)))
+        parts = [value for value in (tv_d, tv_e) if value]
+        score = sum(parts) if parts else None
+        if score and penalty:
+            result = score - penalty
+        else:
+            result = score or None
+        return tv_d, tv_e, score, result
+
+    def batch(self, d, e, penalty):
+        """Оценки по видам для n участников и a видов программы.
+
+        d -- (n, a, d_judges) оценки D, e -- (n, a, e_judges) оценки E,
+        penalty -- (n, a) сбавки. Возвращает словарь массивов tv_d, tv_e, score,
+        result формы (n, a) и total формы (n,); NaN означает NULL. Целые
+        тысячные (до 2**53) во float64 складываются точно.
+        """
+        tv_d = _sum_present(d, present(d))
+
+        marks = np.nan_to_num(e, nan=0.0)
+        first = marks[..., 0] if self.first else 0
+        rest = np.sort(marks[..., self.first:], axis=-1)[..., self.kept].sum(axis=-1)
+        deduction = first + np.floor_divide(2 * rest + self.count, 2 * self.count)
+        tv_e = np.where((~np.isnan(e)).any(axis=-1), MAX_SCORE - deduction, np.nan)
+
+        tv = np.stack([tv_d, tv_e], axis=-1)
+        score = _sum_present(tv, present(tv))
+
+        result = np.where(present(penalty), score - penalty, score)
+        result = np.where(present(score), result, np.nan)
+        total = _sum_present(result, present(result))
+        return {'tv_d': tv_d, 'tv_e': tv_e, 'score': score, 'result': result, 'total': total}
+
+
+@lru_cache(maxsize=None)
+def scorer(name=DEFAULT_RULES):
+    return Scorer(RULE_SETS[name])
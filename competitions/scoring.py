@@ -0,0 +1,184 @@
+"""Подсчёт оценок в целых тысячных долях балла.
+
+Оценки судей и сбавки хранятся целыми числами тысячных (4.5 балла -- 4500);
+в баллы (Decimal) они переводятся только на вводе и выводе, см.
+to_thousandths и from_thousandths. Вся арифметика поэтому точная, а
+единственное деление -- среднее оценок E -- округляется до тысячной
+половиной вверх. Формулы задаются правилами соревнования, см. rules.
+
+Пакетный пересчёт: те же формулы, что и в Performance.calculate и
+CommonInfo.update_result, но сразу для многих участников. Отсутствующая
+оценка передаётся как NaN.
+"""
+from collections import defaultdict
+from decimal import ROUND_HALF_UP, Decimal
+from itertools import islice
+
+import numpy as np
+from django.db import connections, transaction
+from django.db.models import Q
+
+from .rules import D_SLOTS, DEFAULT_RULES, E_SLOTS, present, scorer
+
+
+def to_thousandths(value):
+    """Баллы (Decimal, строка, число) -> целые тысячные; None и '' -> None."""
+    if value is None or value == '':
+        return None
+    return int(Decimal(str(value)).scaleb(3).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def from_thousandths(value):
+    """Целые тысячные -> баллы (Decimal с тремя знаками); None -> None."""
+    if value is None:
+        return None
+    return Decimal(int(value)).scaleb(-3)
+
+
+def compute(d, e, penalty, rules=DEFAULT_RULES):
+    """Пакетный подсчёт по правилам rules, см. rules.Scorer.batch."""
+    return scorer(rules).batch(d, e, penalty)
+
+
+def bulk_update_rows(model, fields, rows, using='default'):
+    """Записывает строки (pk, значения полей) одним подготовленным UPDATE.
+
+    QuerySet.bulk_update строит CASE WHEN на каждое значение, и на тысяче
+    участников это секунды чистого Python; executemany делает то же самое за
+    миллисекунды. Значения приводятся к БД так же, как при save().
+    """
+    connection = connections[using]
+    qn = connection.ops.quote_name
+    opts = model._meta
+    fields = [opts.get_field(name) for name in fields]
+    sql = 'UPDATE %s SET %s WHERE %s = %%s' % (
+        qn(opts.db_table),
+        ', '.join('%s = %%s' % qn(field.column) for field in fields),
+        qn(opts.pk.column))
+    params = [[field.get_db_prep_save(value, connection) for field, value in zip(fields, values)]
+              + [pk] for pk, values in rows]
+    with transaction.atomic(using=using), connection.cursor() as cursor:
+        cursor.executemany(sql, params)
+
+
+def rescore(queryset, chunk_size=2000):
+    """Пересчитывает выступления и итоги участников из queryset и сохраняет их
+    по правилам их соревнований. Участники читаются через iterator() порциями
+    по chunk_size. Возвращает число пересчитанных участников."""
+    rules_field = 'competition__%s_rules' % queryset.model._meta.model_name
+    rows = queryset.order_by('pk').values_list('pk', rules_field).iterator(chunk_size=chunk_size)
+    total = 0
+    for chunk in iter(lambda: list(islice(rows, chunk_size)), []):
+        groups = defaultdict(list)
+        for pk, rules in chunk:
+            groups[rules].append(pk)
+        for rules, pks in groups.items():
+            total += rescore_competitors(queryset.model, pks, queryset.db, rules)
+    return total
+
+
+def rescore_competitors(model, pks, using='default', rules=DEFAULT_RULES):
+    """Пересчитывает участников pks по правилам rules: оценки всех их
+    выступлений читаются двумя запросами, раскладываются в массивы (участник,
+    вид, судья) и считаются разом. Возвращает число пересчитанных участников."""
+    from .models import Mark, Performance
+    rules = scorer(rules)
+    owner = model._meta.model_name
+    performances = list(Performance.objects.using(using)
+                        .filter(**{owner + '__in': pks})
+                        .values_list('pk', owner + '_id', 'apparatus', 'penalty'))
+    if not performances:
+        return 0
+    marks = (Mark.objects.using(using)
+             .filter(**{'performance__%s__in' % owner: pks})
+             .values_list('performance_id', 'panel', 'slot', 'value'))
+
+    index = {pk: i for i, pk in enumerate(pks)}
+    n, a = len(pks), max(apparatus for pk, competitor, apparatus, penalty in performances)
+    d = np.full((n, a, len(rules.d_slots)), np.nan)
+    e = np.full((n, a, len(rules.e_slots)), np.nan)
+    penalty = np.full((n, a), np.nan)
+    cells = {}
+    for pk, competitor, apparatus, value in performances:
+        cells[pk] = index[competitor], apparatus - 1
+        if value is not None:
+            penalty[cells[pk]] = value
+    slots = {Mark.D: (d, rules.d_slots), Mark.E: (e, rules.e_slots)}
+    for performance, panel, slot, value in marks:
+        values, panel_slots = slots[panel]
+        if slot in panel_slots:
+            values[cells[performance] + (panel_slots.index(slot),)] = value
+
+    # Участники без единой оценки не пересчитываются, как и в update_result
+    touched = present(d).any(axis=(1, 2)) | present(e).any(axis=(1, 2))
+    scores = rules.batch(d, e, penalty)
+    derived = np.stack([scores[name] for name in Performance.derived_fields], axis=-1)
+
+    bulk_update_rows(Performance, Performance.derived_fields,
+                     [(pk, [None if np.isnan(value) else from_thousandths(value) for value in derived[cell]])
+                      for pk, cell in cells.items() if touched[cell[0]]],
+                     using=using)
+    totals = np.nan_to_num(scores['total'], nan=0.0)
+    bulk_update_rows(model, ['result'],
+                     [(pk, [from_thousandths(totals[i])]) for i, pk in enumerate(pks) if touched[i]],
+                     using=using)
+    return int(touched.sum())
+
+
+def mark_names():
+    """Ключи оценок одного выступления для enter_marks: d1, d2, e1..e5, penalty."""
+    return (['d%s' % slot for slot in D_SLOTS] + ['e%s' % slot for slot in E_SLOTS] +
+            ['penalty'])
+
+
+def enter_marks(competition, model, apparatus, marks):
+    """Записывает оценки судей за вид apparatus (1, 2, ...) сразу для многих
+    участников: marks -- словарь pk -> {ключ оценки: значение в баллах},
+    например {12: {'d1': 4.5, 'e1': '1.2', 'penalty': Decimal('0.3')}}, см.
+    mark_names(); оценки с ключами, которых нет ни у одного участника, не
+    меняются. Выступления и итоги считаются пакетно по правилам соревнования,
+    места пересчитываются один раз."""
+    from .models import Mark, Performance
+    if not marks:
+        return 0
+    marks = {pk: {name: to_thousandths(value) for name, value in values.items()}
+             for pk, values in marks.items()}
+    names = set().union(*marks.values())
+    slots = [(panel, slot) for panel, panel_slots in ((Mark.D, D_SLOTS), (Mark.E, E_SLOTS))
+             for slot in panel_slots if '%s%s' % (panel.lower(), slot) in names]
+    owner = model._meta.model_name
+    with transaction.atomic():
+        competition.lock()
+        pks = list(model.objects.select_for_update()
+                   .filter(competition=competition, pk__in=list(marks))
+                   .order_by('pk').values_list('pk', flat=True))
+        if len(pks) != len(marks):
+            raise model.DoesNotExist('Участники не из этого соревнования')
+
+        performances = Performance.objects.filter(**{owner + '__in': pks, 'apparatus': apparatus})
+        existing = dict(performances.values_list(owner + '_id', 'pk'))
+        missing = [pk for pk in pks if pk not in existing]
+        if missing:
+            Performance.objects.bulk_create(Performance(**{owner + '_id': pk, 'apparatus': apparatus})
+                                            for pk in missing)
+            existing = dict(performances.values_list(owner + '_id', 'pk'))
+        if 'penalty' in names:
+            bulk_update_rows(Performance, ['penalty'],
+                             [(existing[pk], [marks[pk].get('penalty')]) for pk in pks])
+
+        if slots:
+            replaced = Q(pk__in=[])
+            for panel, slot in slots:
+                replaced |= Q(panel=panel, slot=slot)
+            Mark.objects.filter(replaced, performance__in=list(existing.values())).delete()
+            Mark.objects.bulk_create(
+                Mark(performance_id=existing[pk], panel=panel, slot=slot, value=value)
+                for pk in pks
+                for panel, slot in slots
+                for value in [marks[pk].get('%s%s' % (panel.lower(), slot))] if value is not None)
+
+        rescore_competitors(model, pks, rules=competition.scoring_rules(model))
+        competition.make_rank_list(model())
+        competition.update_standings(model, pks)
+        competition.touch()
+    return len(pks)
@@ -0,0 +1,82 @@
+"""Таблица результатов Standing: одна узкая строка на участника соревнования.
+
+Страницы результатов и выгрузка читают только её -- одним запросом по
+индексу (соревнование, вид участника, место или итог), без выступлений и
+членов команд. Строки обновляются в той же транзакции, что и оценки, итоги и
+места: update_standings вызывают все, кто их меняет (сохранение и удаление
+участника, пакетный ввод оценок, пересчёт, импорт, жеребьёвка).
+"""
+from collections import defaultdict
+
+from django.db import transaction
+from django.db.models import OuterRef, Subquery
+
+from .scoring import bulk_update_rows
+
+COPIED_FIELDS = ('name', 'city', 'coach', 'number', 'rank', 'result')
+GYMNAST_FIELDS = ('year_of_birth', 'category', 'category_rank', 'age_rank')
+
+
+def _rows(competition, model, pks):
+    from .models import Performance, Standing, Team, TeamGymnast
+    kind = model._meta.model_name
+    fields = COPIED_FIELDS + (GYMNAST_FIELDS if model is not Team else ())
+    competitors = (model.objects.filter(competition=competition, pk__in=pks)
+                   .order_by('pk').values_list('pk', *fields))
+    results = defaultdict(dict)
+    for owner, apparatus, result in (Performance.objects.filter(**{kind + '__in': pks})
+                                     .values_list(kind, 'apparatus', 'result')):
+        results[owner][apparatus] = result
+    members = defaultdict(list)
+    if model is Team:
+        for team, name in (TeamGymnast.objects.filter(team__in=pks)
+                           .order_by('pk').values_list('team', 'name')):
+            members[team].append(name)
+    count = len(competition.apparatus(model))
+    for pk, *values in competitors:
+        sums = [results[pk].get(apparatus) for apparatus in range(1, count + 1)]
+        yield Standing(competition_id=competition.pk, kind=kind, competitor_id=pk,
+                       apparatus_sums=';'.join('' if value is None else str(value) for value in sums),
+                       members='\n'.join(members[pk]), **dict(zip(fields, values)))
+
+
+def update_standings(competition, model, pks=None, moved=None, chunk_size=2000):
+    """Пересобирает строки участников pks (None -- всех участников model) из
+    рабочих таблиц; строки удалённых участников удаляются. Если pks заданы,
+    места и номера остальных строк копируются из участников одним UPDATE:
+    только у участников, подходящих под условие moved (Q, например окно
+    сдвинувшихся мест из Competition.update_rank_list), или у всех при None."""
+    from .models import Standing, Team
+    if competition.archived:
+        return
+    kind = model._meta.model_name
+    fields = (COPIED_FIELDS + (GYMNAST_FIELDS if model is not Team else ()) +
+              ('apparatus_sums', 'members'))
+    standings = Standing.objects.filter(competition=competition, kind=kind)
+    competitors = model.objects.filter(competition=competition)
+    with transaction.atomic():
+        if pks is None:
+            standings.exclude(competitor_id__in=competitors.values('pk')).delete()
+            pks = list(competitors.order_by('pk').values_list('pk', flat=True))
+            positions = False
+        else:
+            pks, positions = sorted(pks), True
+        for start in range(0, len(pks), chunk_size):
+            chunk = pks[start:start + chunk_size]
+            existing = dict(standings.filter(competitor_id__in=chunk).values_list('competitor_id', 'pk'))
+            rows = list(_rows(competition, model, chunk))
+            gone = set(existing) - {row.competitor_id for row in rows}
+            if gone:
+                standings.filter(competitor_id__in=list(gone)).delete()
+            if existing:
+                bulk_update_rows(Standing, fields, [
+                    (existing[row.competitor_id], [getattr(row, name) for name in fields])
+                    for row in rows if row.competitor_id in existing])
+            Standing.objects.bulk_create([row for row in rows if row.competitor_id not in existing])
+        if positions:
+            # места и номера остальных участников меняются без их сохранения
+            current = model.objects.filter(pk=OuterRef('competitor_id'))
+            if moved is not None:
+                standings = standings.filter(competitor_id__in=competitors.filter(moved).values('pk'))
+            standings.update(**{name: Subquery(current.values(name)[:1])
+                                for name in ['number'] + [column for column, field in model.rankings]})
@@ -0,0 +1,179 @@
+"""Импорт стартового листа из CSV или XLSX.
+
+Первая строка файла -- заголовки: имена полей (name, year_of_birth, category,
+city, coach) или их русские названия ("имя", "год рождения", "разряд", ...).
+Столбец "type" ("участник": гимнастка или команда) необязателен, по умолчанию
+строка -- гимнастка. Члены команды перечисляются в столбце "members" через ";".
+
+Строки читаются по одной и вставляются пачками через bulk_create, пока
+post_save-обработчики приостановлены; после вставки жеребьёвка сбрасывается
+и места пересчитываются один раз на соревнование. Если хоть одна строка
+неверна, не импортируется ничего.
+"""
+import codecs
+import csv
+import zipfile
+from collections import OrderedDict
+from itertools import chain
+
+from django.core.exceptions import ValidationError
+from django.db import connection, transaction
+
+from . import hooks
+from .choices import CATEGORY
+from .models import Gymnast, Team, TeamGymnast
+
+CHUNK_SIZE = 500
+
+KINDS = {'': Gymnast, 'gymnast': Gymnast, 'гимнастка': Gymnast,
+         'team': Team, 'команда': Team}
+CATEGORIES = dict([(code.lower(), code) for code, label in CATEGORY] +
+                  [(label.lower().rstrip('.'), code) for code, label in CATEGORY])
+
+
+class StartListError(Exception):
+
+    def __init__(self, errors):
+        super().__init__('\n'.join(errors))
+        self.errors = errors
+
+
+def _headers():
+    headers = {'type': 'type', 'участник': 'type', 'members': 'members', 'члены команды': 'members'}
+    for name in ('name', 'year_of_birth', 'category', 'city', 'coach'):
+        headers[name] = name
+        headers[str(Gymnast._meta.get_field(name).verbose_name)] = name
+    return headers
+
+
+HEADERS = _headers()
+
+
+def read_csv(file):
+    text = codecs.getreader('utf-8-sig')(file)
+    try:
+        header = text.readline()
+        try:
+            dialect = csv.Sniffer().sniff(header, delimiters=',;\t')
+        except csv.Error:
+            dialect = csv.excel
+        yield from csv.reader(chain([header], text), dialect)
+    except UnicodeDecodeError:
+        # Excel по умолчанию сохраняет CSV в cp1251
+        raise StartListError(['Файл CSV не в кодировке UTF-8: сохраните его как "CSV UTF-8"'])
+
+
+def read_xlsx(file):
+    try:
+        from openpyxl import load_workbook
+        from openpyxl.utils.exceptions import InvalidFileException
+    except ImportError:
+        raise StartListError(['Для импорта XLSX установите openpyxl'])
+    try:
+        sheet = load_workbook(file, read_only=True, data_only=True).active
+    except (zipfile.BadZipFile, InvalidFileException, KeyError):
+        raise StartListError(['Файл повреждён или не является книгой XLSX'])
+    for row in sheet.iter_rows(values_only=True):
+        yield ['' if value is None else str(value) for value in row]
+
+
+def read_rows(file, name):
+    """Строки файла в виде словарей поле -> строка, начиная со второй."""
+    rows = read_xlsx(file) if name.lower().endswith('.xlsx') else read_csv(file)
+    header = next(rows, None)
+    if header is None:
+        raise StartListError(['Файл пуст'])
+    columns = [HEADERS.get(title.strip().lower()) for title in header]
+    if 'name' not in columns:
+        raise StartListError(['Нет столбца с именем участника (name)'])
+    for line, row in enumerate(rows, 2):
+        values = {column: value.strip() for column, value in zip(columns, row) if column}
+        if any(values.values()):
+            yield line, values
+
+
+def parse_row(values):
+    kind = KINDS.get(values.get('type', '').lower())
+    if kind is None:
+        raise ValidationError('неизвестный тип участника "%s"' % values['type'])
+    if not values.get('name'):
+        raise ValidationError('не указано имя')
+    fields = {'name': values['name'], 'city': values.get('city', ''),
+              'coach': values.get('coach', '')}
+    for name in ('name', 'city', 'coach'):
+        kind._meta.get_field(name).run_validators(fields[name])
+    if kind is Gymnast:
+        year = Gymnast._meta.get_field('year_of_birth')
+        fields['year_of_birth'] = year.clean(values.get('year_of_birth', '').split('.')[0], None)
+        category = values.get('category', '')
+        if category and category.lower().rstrip('.') not in CATEGORIES:
+            raise ValidationError('неизвестный разряд "%s"' % category)
+        fields['category'] = CATEGORIES.get(category.lower().rstrip('.'), '')
+        return kind(**fields), []
+    members = [member.strip() for member in values.get('members', '').split(';') if member.strip()]
+    return kind(**fields), members
+
+
+class _Batch:
+
+    def __init__(self, chunk_size):
+        self.chunk_size = chunk_size
+        self.gymnasts = []
+        self.teams = []
+        self.counts = OrderedDict([(Gymnast, 0), (Team, 0), (TeamGymnast, 0)])
+
+    def add(self, instance, members):
+        if isinstance(instance, Team):
+            self.teams.append((instance, members))
+        else:
+            self.gymnasts.append(instance)
+        if len(self.gymnasts) + len(self.teams) >= self.chunk_size:
+            self.flush()
+
+    def flush(self):
+        Gymnast.objects.bulk_create(self.gymnasts)
+        teams = [team for team, members in self.teams]
+        if connection.features.can_return_ids_from_bulk_insert:
+            Team.objects.bulk_create(teams)
+        else:
+            # без RETURNING первичные ключи команд нужны для членов команды
+            for team in teams:
+                team.save(force_insert=True)
+        TeamGymnast.objects.bulk_create(TeamGymnast(team=team, name=name)
+                                        for team, members in self.teams for name in members)
+        self.counts[Gymnast] += len(self.gymnasts)
+        self.counts[Team] += len(teams)
+        self.counts[TeamGymnast] += sum(len(members) for team, members in self.teams)
+        self.gymnasts, self.teams = [], []
+
+
+def import_start_list(competition, file, name, chunk_size=CHUNK_SIZE):
+    """Импортирует участников из file (name -- имя файла, по расширению
+    выбирается формат) в соревнование competition.
+    Возвращает словарь модель -> число добавленных записей."""
+    errors = []
+    batch = _Batch(chunk_size)
+    with transaction.atomic():
+        competition.lock()
+        with hooks.suspended():
+            for line, values in read_rows(file, name):
+                try:
+                    instance, members = parse_row(values)
+                except ValidationError as error:
+                    errors.append('Строка %s: %s' % (line, '; '.join(error.messages)))
+                    continue
+                if not errors:
+                    instance.competition = competition
+                    batch.add(instance, members)
+            if errors:
+                raise StartListError(errors)
+            batch.flush()
+        if batch.counts[Gymnast]:
+            competition.unsortition_gymnast()
+            competition.make_rank_list(Gymnast())
+            competition.update_standings(Gymnast)
+        if batch.counts[Team]:
+            competition.unsortition_team()
+            competition.make_rank_list(Team())
+            competition.update_standings(Team)
+    return batch.counts
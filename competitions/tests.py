@@ -1,3 +1,1364 @@
-from django.test import TestCase
+import datetime
+import io
+import json
+import os
+import tempfile
+import random
+import shutil
+import sqlite3
+import threading
+import time
+from decimal import Decimal
+from fractions import Fraction
+from io import StringIO
 
-# Create your tests here.
+import numpy as np
+
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import IntegrityError, OperationalError, connection, transaction
+from django.db.utils import ConnectionHandler
+from django.http import HttpResponse
+from django.contrib.auth.models import User
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import reverse
+
+from . import benchmarks, export, hooks, live, profiling
+from .admin import EstimatedCountPaginator, estimated_count
+from .archive import archive_competition
+from .middleware import DeferredHooksMiddleware
+from .models import (ArchivedMark, Competition, CompetitionArchived, Gymnast, Mark, Performance, Standing,
+                     Team, TeamGymnast)
+from .scoring import (D_SLOTS, E_SLOTS, compute, enter_marks, from_thousandths, rescore,
+                      to_thousandths)
+from .rules import scorer
+from .startlist import StartListError, import_start_list
+from rhythmicgymnastics.databases import database
+
+
+def make_competition(slug='test'):
+    today = datetime.date.today()
+    return Competition.objects.create(title=slug, slug=slug, place='place',
+                                      start=today, end=today)
+
+
+def add_performance(competitor, apparatus, d=(), e=(), penalty=None):
+    performance = Performance(apparatus=apparatus, penalty=to_thousandths(penalty),
+                              **{competitor._meta.model_name: competitor})
+    performance.set_marks(d, e)
+    return performance
+
+
+def performance_values(model):
+    owner = model._meta.model_name
+    return list(Performance.objects.filter(**{owner + '__isnull': False})
+                .order_by(owner, 'apparatus').values_list(owner, *Performance.derived_fields))
+
+
+class RankListTests(TestCase):
+
+    def setUp(self):
+        self.competition = make_competition()
+
+    def add_gymnasts(self, *results):
+        Gymnast.objects.bulk_create(
+            Gymnast(competition=self.competition, name='g%s' % i,
+                    year_of_birth=2010, result=Decimal(result))
+            for i, result in enumerate(results))
+        return list(self.competition.gymnasts.order_by('name'))
+
+    def ranks(self):
+        return list(self.competition.gymnasts.order_by('name').values_list('rank', flat=True))
+
+    def test_shared_places(self):
+        gymnasts = self.add_gymnasts('15.5', '17.2', '15.5', '12', '17.2', '15.5')
+        self.competition.make_rank_list(gymnasts[0])
+        self.assertEqual(self.ranks(), [3, 1, 3, 6, 1, 3])
+
+    def test_competitor_without_result_loses_rank(self):
+        gymnasts = self.add_gymnasts('15.5', '17.2')
+        self.competition.make_rank_list(gymnasts[0])
+        Gymnast.objects.filter(pk=gymnasts[1].pk).update(result=0)
+        self.competition.make_rank_list(gymnasts[0])
+        self.assertEqual(self.ranks(), [1, None])
+
+    def test_teams_ranked_separately(self):
+        gymnasts = self.add_gymnasts('15.5', '12')
+        Team.objects.bulk_create([Team(competition=self.competition, name='team', result=20)])
+        self.competition.make_rank_list(gymnasts[0])
+        self.assertEqual(self.ranks(), [1, 2])
+        self.assertIsNone(self.competition.teams.get().rank)
+        self.competition.make_rank_list(Team())
+        self.assertEqual(self.competition.teams.get().rank, 1)
+
+    def test_query_count_does_not_grow(self):
+        gymnasts = self.add_gymnasts(*(Decimal(i) / 10 for i in range(1, 301)))
+        with self.assertNumQueries(1):
+            self.competition.make_rank_list(gymnasts[0])
+
+
+class IncrementalRankTests(TestCase):
+
+    def setUp(self):
+        self.competition = make_competition()
+
+    def standings(self):
+        return dict(self.competition.gymnasts.values_list('pk', 'rank'))
+
+    def assert_matches_full_recompute(self):
+        incremental = self.standings()
+        self.competition.make_rank_list(Gymnast())
+        self.assertEqual(incremental, self.standings())
+
+    def test_saves_keep_ranks_consistent(self):
+        rnd = random.Random(1)
+        for i in range(12):
+            Gymnast.objects.create(competition=self.competition, name='g%s' % i,
+                                   year_of_birth=2010, result=Decimal(rnd.randint(0, 8)))
+        self.assert_matches_full_recompute()
+        for step in range(40):
+            gymnast = Gymnast.objects.get(pk=rnd.choice(list(self.standings())))
+            gymnast.result = Decimal(rnd.randint(0, 8))
+            gymnast.save()
+            self.assert_matches_full_recompute()
+
+    def test_stale_instance_keeps_places(self):
+        first = Gymnast.objects.create(competition=self.competition, name='a', year_of_birth=2010,
+                                       category='KMS', result=10)
+        second = Gymnast.objects.create(competition=self.competition, name='b', year_of_birth=2010,
+                                        category='KMS', result=20)
+        stale = Gymnast.objects.get(pk=first.pk)
+        second.result = 5
+        second.save()
+        stale.city = 'city'
+        stale.save()
+        self.assertEqual(self.standings(), {first.pk: 1, second.pk: 2})
+        self.assertEqual(Gymnast.objects.get(pk=first.pk).category_rank, 1)
+        self.assertEqual(Standing.objects.get(competitor_id=first.pk).rank, 1)
+        self.assert_matches_full_recompute()
+
+    def test_only_window_is_updated(self):
+        for i, result in enumerate([10, 20, 30, 40, 50]):
+            Gymnast.objects.create(competition=self.competition, name='g%s' % i,
+                                   year_of_birth=2010, result=result)
+        gymnast = Gymnast.objects.get(name='g0')
+        gymnast.result = 35
+        with CaptureQueriesContext(connection) as queries:
+            gymnast.save()
+        shifts = [q['sql'] for q in queries if '"rank" = ("competitions_gymnast"."rank"' in q['sql']]
+        self.assertEqual(len(shifts), 1)
+        self.assertEqual(self.competition.gymnasts.filter(rank__isnull=False).count(), 5)
+        self.assertEqual(Gymnast.objects.get(name='g0').rank, 3)
+        self.assertEqual(Gymnast.objects.get(name='g2').rank, 4)
+
+    def test_inconsistent_ranks_fall_back_to_full_recompute(self):
+        for i, result in enumerate([10, 20, 30]):
+            Gymnast.objects.create(competition=self.competition, name='g%s' % i,
+                                   year_of_birth=2010, result=result)
+        self.competition.gymnasts.update(rank=None)
+        gymnast = Gymnast.objects.get(name='g0')
+        gymnast.result = 25
+        gymnast.save()
+        self.assertEqual(self.standings(), {
+            Gymnast.objects.get(name=name).pk: rank
+            for name, rank in [('g0', 2), ('g1', 3), ('g2', 1)]})
+
+
+class GroupRankTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.competition = make_competition()
+        for name, category, year, result in [('a', 'KMS', 2010, 9), ('b', 'KMS', 2011, 7),
+                                             ('c', '', 2010, 7), ('d', 'KMS', 2010, 7),
+                                             ('e', '', 2011, 0)]:
+            Gymnast.objects.create(competition=self.competition, name=name, category=category,
+                                   year_of_birth=year, result=result)
+
+    def places(self):
+        return list(self.competition.gymnasts.order_by('name')
+                    .values_list('name', 'rank', 'category_rank', 'age_rank'))
+
+    def test_ranks_within_category_and_year(self):
+        self.competition.gymnasts.update(rank=None, category_rank=None, age_rank=None)
+        with CaptureQueriesContext(connection) as queries:
+            self.competition.make_rank_list(Gymnast())
+        self.assertEqual(len(queries), 1)
+        self.assertEqual(self.places(), [('a', 1, 1, 1), ('b', 2, 2, 1), ('c', 2, 1, 2),
+                                         ('d', 2, 2, 2), ('e', None, None, None)])
+
+    def test_saves_keep_group_ranks_consistent(self):
+        rnd = random.Random(2)
+        for step in range(30):
+            gymnast = Gymnast.objects.get(name=rnd.choice('abcde'))
+            gymnast.result = Decimal(rnd.randint(0, 4))
+            gymnast.category = rnd.choice(['', 'KMS', 'I'])
+            gymnast.year_of_birth = rnd.choice([2010, 2011])
+            gymnast.save()
+            incremental = self.places()
+            self.competition.make_rank_list(Gymnast())
+            self.assertEqual(self.places(), incremental)
+
+    def test_rank_page_and_api_show_group_ranks(self):
+        response = self.client.get(reverse('competitions:rank', args=[self.competition.pk]))
+        self.assertEqual([(g.name, g.category_rank, g.age_rank) for g in response.context['gymnasts']],
+                         [('a', 1, 1), ('b', 2, 1), ('c', 1, 2), ('d', 2, 2)])
+        url = reverse('competitions:api-gymnasts', args=[self.competition.pk])
+        with self.assertNumQueries(2):
+            data = self.client.get(url + '?ordering=category_rank&fields=name,category_rank').json()
+        self.assertEqual([(row['name'], row['category_rank']) for row in data['results']],
+                         [('c', 1), ('e', None), ('a', 1), ('b', 2), ('d', 2)])
+
+
+class SortitionTests(TestCase):
+
+    def setUp(self):
+        self.competition = make_competition()
+        Gymnast.objects.bulk_create(
+            Gymnast(competition=self.competition, name='same name', year_of_birth=2010)
+            for i in range(20))
+        Team.objects.bulk_create(Team(competition=self.competition, name='team %s' % i)
+                                 for i in range(5))
+
+    def numbers(self):
+        return list(self.competition.gymnasts.order_by('pk').values_list('number', flat=True))
+
+    def test_numbers_assigned_by_primary_key(self):
+        self.competition.sortition()
+        self.assertEqual(sorted(self.numbers()), list(range(1, 21)))
+        self.assertEqual(sorted(self.competition.teams.values_list('number', flat=True)),
+                         list(range(1, 6)))
+        self.assertTrue(self.competition.gymnasts_are_sorted)
+        self.assertIsNotNone(self.competition.draw_seed)
+
+    def test_draw_is_replayed_from_seed(self):
+        self.competition.sortition(seed=42)
+        first = self.numbers()
+        self.competition.unsortition_gymnast()
+        self.competition.sortition(seed=self.competition.draw_seed)
+        self.assertEqual(self.numbers(), first)
+
+    def test_partial_draw_keeps_seed(self):
+        self.competition.sortition(seed=42)
+        gymnasts = self.numbers()
+        self.competition.unsortition_team()
+        self.competition.sortition(seed=7)
+        self.assertEqual(self.competition.draw_seed, 42)
+        self.assertEqual(self.numbers(), gymnasts)
+        teams = list(self.competition.teams.order_by('pk').values_list('number', flat=True))
+        self.competition.unsortition_gymnast()
+        self.competition.unsortition_team()
+        self.competition.sortition(seed=self.competition.draw_seed)
+        self.assertEqual(self.numbers(), gymnasts)
+        self.assertEqual(list(self.competition.teams.order_by('pk').values_list('number', flat=True)), teams)
+
+    def test_sortition_many_saves_every_competition(self):
+        other = make_competition('other')
+        Competition.sortition_many(Competition.objects.all(), seed=7)
+        self.assertEqual(Competition.objects.filter(draw_seed=7, gymnasts_are_sorted=True,
+                                                    teams_are_sorted=True).count(), 2)
+        self.assertEqual(other.gymnasts.count(), 0)
+
+
+class BatchScoringTests(TestCase):
+
+    def random_marks(self, rnd, slots):
+        return [rnd.choice([None, 0, round(rnd.uniform(0, 10), 1), round(rnd.uniform(0, 10), 2)])
+                for slot in slots]
+
+    def test_matches_update_result(self):
+        competition = make_competition()
+        rnd = random.Random(3)
+        for model, extra in ((Gymnast, {'year_of_birth': 2010}), (Team, {})):
+            with hooks.suspended():
+                competitors = [model.objects.create(competition=competition, name='c%s' % i, **extra)
+                               for i in range(60)]
+            for competitor in competitors:
+                for apparatus in range(1, len(competition.apparatus(model)) + 1):
+                    if rnd.random() < 0.8:
+                        add_performance(competitor, apparatus, self.random_marks(rnd, D_SLOTS),
+                                        self.random_marks(rnd, E_SLOTS),
+                                        rnd.choice([None, 0, 0.3, round(rnd.uniform(0, 1), 2)]))
+            with hooks.suspended():
+                for competitor in competitors:
+                    competitor.update_result()
+            expected = (performance_values(model),
+                        list(model.objects.order_by('pk').values_list('result')))
+            self.assertGreater(len(expected[0]), 80)
+            Performance.objects.update(**{name: None for name in Performance.derived_fields})
+            model.objects.update(result=0)
+            rescore(model.objects.all())
+            actual = (performance_values(model),
+                      list(model.objects.order_by('pk').values_list('result')))
+            self.assertEqual(actual, expected)
+
+
+def reference_scores(d, e, penalty):
+    """Формулы FIG в точных дробях: D -- сумма оценок D, E -- 10 минус оценка
+    E1/E2 и среднее двух средних из остальных оценок E (округляется до тысячной
+    половиной вверх), сумма -- D + E минус сбавка. Нулевая оценка -- нет оценки."""
+    def thousandth(value):
+        return Fraction((value * 1000 + Fraction(1, 2)).__floor__(), 1000)
+
+    given_d = [Fraction(value) for value in d if value]
+    tv_d = sum(given_d) if given_d else None
+    tv_e = None
+    if any(value is not None for value in e):
+        marks = [Fraction(value or 0) for value in e]
+        rest = sorted(marks[1:])
+        tv_e = 10 - (marks[0] + thousandth(sum(rest[1:-1]) / 2))
+    parts = [value for value in (tv_d, tv_e) if value]
+    score = sum(parts) if parts else None
+    result = score - Fraction(penalty) if score and penalty else score or None
+    return tv_d, tv_e, score, result
+
+
+class ScoringPropertyTests(SimpleTestCase):
+    """Пакетный и поштучный подсчёт в тысячных совпадают с формулами в точных
+    дробях на случайных оценках (с шагом 0.001, 0.05 и 0.1, нулевых и пропущенных)."""
+    cases = 500
+
+    def random_mark(self, rnd):
+        step = rnd.choice([Decimal('0.001'), Decimal('0.05'), Decimal('0.1')])
+        return rnd.choice([None, Decimal(0), step * rnd.randint(0, int(10 / step))])
+
+    def random_performance(self, rnd):
+        return ([self.random_mark(rnd) for slot in D_SLOTS], [self.random_mark(rnd) for slot in E_SLOTS],
+                rnd.choice([None, Decimal(0), Decimal('0.3'), Decimal('0.05') * rnd.randint(1, 20)]))
+
+    def expected(self, d, e, penalty):
+        return [None if value is None else Decimal(value.numerator) / value.denominator
+                for value in reference_scores(d, e, penalty)]
+
+    def test_thousandths_round_trip(self):
+        rnd = random.Random(1)
+        for i in range(self.cases):
+            value = Decimal(rnd.randint(0, 10000)).scaleb(-3)
+            self.assertEqual(from_thousandths(to_thousandths(value)), value)
+            self.assertEqual(to_thousandths(float(value)), to_thousandths(str(value)))
+        self.assertEqual(to_thousandths(0.1 + 0.2), 300)
+        self.assertIsNone(to_thousandths(''))
+
+    def calculate(self, d, e, penalty):
+        performance = Performance(penalty=to_thousandths(penalty))
+        marks = {Mark.D: d, Mark.E: e}
+        performance.panel_marks = lambda panel, slots: [to_thousandths(value) for value in marks[panel]]
+        performance.calculate()
+        return [getattr(performance, name) for name in Performance.derived_fields]
+
+    def test_performance_matches_reference(self):
+        rnd = random.Random(2)
+        for i in range(self.cases):
+            d, e, penalty = self.random_performance(rnd)
+            self.assertEqual(self.calculate(d, e, penalty), self.expected(d, e, penalty), (d, e, penalty))
+
+    def test_batch_matches_reference(self):
+        rnd = random.Random(3)
+        cases = [self.random_performance(rnd) for i in range(self.cases)]
+
+        def grid(rows):
+            return np.array([[np.nan if value is None else to_thousandths(value) for value in row]
+                             for row in rows])
+        scores = compute(grid([d for d, e, penalty in cases])[:, None, :],
+                         grid([e for d, e, penalty in cases])[:, None, :],
+                         grid([[penalty] for d, e, penalty in cases]))
+        for i, (d, e, penalty) in enumerate(cases):
+            actual = [None if np.isnan(scores[name][i, 0]) else from_thousandths(scores[name][i, 0])
+                      for name in Performance.derived_fields]
+            self.assertEqual(actual, self.expected(d, e, penalty), (d, e, penalty))
+
+    def test_order_of_e_judges_after_first_does_not_matter(self):
+        rnd = random.Random(4)
+        for i in range(self.cases):
+            d, e, penalty = self.random_performance(rnd)
+            shuffled = e[:1] + rnd.sample(e[1:], len(e) - 1)
+            self.assertEqual(self.calculate(d, shuffled, penalty), self.calculate(d, e, penalty))
+
+
+class RuleSetTests(TestCase):
+
+    def setUp(self):
+        self.competition = make_competition()
+        with hooks.suspended():
+            self.gymnast = Gymnast.objects.create(competition=self.competition, name='g',
+                                                  year_of_birth=2010)
+        add_performance(self.gymnast, 1, d=[4, 2], e=[1, 0.4, 0.5, 0.6, 0.9], penalty=0.3)
+
+    def results(self):
+        return list(self.gymnast.performances.values_list('tv_d', 'tv_e', 'result'))
+
+    def test_rules_formulas(self):
+        self.assertEqual(scorer('fig').performance([4000, 2000], [1000, 400, 500, 600, 900], 300),
+                         (6000, 8450, 14450, 14150))
+        # малая бригада: E1 и среднее E2, E3; упрощённые: одна D и среднее трёх E
+        self.assertEqual(scorer('reduced').performance([4000, 2000], [1000, 400, 500], 300)[:2],
+                         (6000, 8550))
+        self.assertEqual(scorer('simple').performance([4000, 2000], [1000, 400, 500], 300)[:2],
+                         (4000, 9367))
+
+    def test_changing_rules_rescores_competitors(self):
+        self.gymnast.update_result()
+        self.assertEqual(self.results(), [(Decimal('6'), Decimal('8.45'), Decimal('14.15'))])
+        self.competition.gymnast_rules = 'simple'
+        with CaptureQueriesContext(connection) as queries:
+            self.competition.save()
+        self.assertEqual(self.results(), [(Decimal('4'), Decimal('9.367'), Decimal('13.067'))])
+        self.gymnast.refresh_from_db()
+        self.assertEqual((self.gymnast.result, self.gymnast.rank), (Decimal('13.067'), 1))
+        # пересчитываются только гимнастки, одним пакетом
+        self.assertFalse([q for q in queries if 'competitions_team' in q['sql']])
+        # поштучный и пакетный подсчёт по новым правилам совпадают
+        entered = self.results()
+        self.gymnast.update_result()
+        self.assertEqual(self.results(), entered)
+
+    def test_admin_hides_judges_not_in_rules(self):
+        self.competition.gymnast_rules = 'simple'
+        self.competition.save()
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        url = reverse('admin:competitions_competition_marks', args=[self.competition.pk, 'gymnast', 1])
+        response = self.client.get(url)
+        self.assertContains(response, 'form-0-e3')
+        self.assertNotContains(response, 'form-0-e4')
+        self.assertNotContains(response, 'form-0-d2')
+        data = {'form-TOTAL_FORMS': 1, 'form-INITIAL_FORMS': 1, 'form-0-id': self.gymnast.pk,
+                'form-0-d1': 5, 'form-0-e1': 1, 'form-0-e2': 1, 'form-0-e3': 1,
+                'form-0-penalty': 0.3}
+        self.assertRedirects(self.client.post(url, data), url)
+        performance = self.gymnast.performances.get()
+        # оценки судей вне бригады не стираются: вернутся при смене правил
+        self.assertEqual(performance.panel_marks(Mark.D, D_SLOTS), [5000, 2000])
+        self.assertEqual(performance.panel_marks(Mark.E, E_SLOTS), [1000, 1000, 1000, 600, 900])
+        self.assertEqual(performance.result, Decimal('13.7'))
+
+
+class ConcurrentScoringTests(TransactionTestCase):
+    """Судьи параллельно сохраняют оценки разных гимнасток одного соревнования:
+    итоги не теряются, места согласованы с итогами."""
+    threads = 4
+    rounds = 15
+
+    def retry(self, func):
+        # Тестовая БД SQLite в общей памяти не ждёт блокировку таблицы, а сразу
+        # отвечает "table is locked"; каждый шаг -- своя транзакция, его можно повторить
+        for attempt in range(200):
+            try:
+                return func()
+            except OperationalError as error:
+                if 'locked' not in str(error):
+                    raise
+                time.sleep(0.005)
+        return func()
+
+    def judge(self, gymnasts, seed, errors):
+        rnd = random.Random(seed)
+        try:
+            for i in range(self.rounds):
+                gymnast = rnd.choice(gymnasts)
+                marks = {'d': [rnd.randint(1, 9)], 'e': [rnd.randint(0, 9) / 10]}
+                self.retry(lambda: gymnast.performances.get().set_marks(**marks))
+                self.retry(gymnast.update_result)
+        except Exception as error:
+            errors.append(error)
+        finally:
+            connection.close()
+
+    def test_parallel_saves_keep_ranks_consistent(self):
+        competition = make_competition()
+        gymnasts = [Gymnast.objects.create(competition=competition, name='g%s' % i, year_of_birth=2010)
+                    for i in range(self.threads * 3)]
+        for gymnast in gymnasts:
+            Performance.objects.create(gymnast=gymnast, apparatus=1)
+        version = Competition.objects.get().version
+        errors = []
+        threads = [threading.Thread(target=self.judge, args=(gymnasts[i::self.threads], i, errors))
+                   for i in range(self.threads)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+        for gymnast in Gymnast.objects.all():
+            performance = gymnast.performances.get()
+            self.assertEqual(gymnast.result, performance.result)
+            above = Gymnast.objects.filter(competition=competition, result__gt=gymnast.result).count()
+            self.assertEqual(gymnast.rank, above + 1 if gymnast.result else None)
+        # каждое сохранение итога подняло версию результатов
+        self.assertEqual(Competition.objects.get().version, version + self.threads * self.rounds)
+
+    def test_stale_competition_save_keeps_results_version(self):
+        stale = make_competition()
+        Competition.objects.get().touch()
+        stale.title = 'renamed'
+        stale.save()
+        stale.unsortition_gymnast()
+        competition = Competition.objects.get()
+        # создание, touch() и два сохранения -- каждое подняло версию, ни одно не откатило
+        self.assertEqual((competition.title, competition.version), ('renamed', 4))
+
+
+class DatabaseSettingsTests(SimpleTestCase):
+
+    def test_database_from_environment(self):
+        sqlite = database({}, '/srv/app')
+        self.assertEqual((sqlite['ENGINE'], sqlite['NAME'], sqlite['CONN_MAX_AGE']),
+                         ('rhythmicgymnastics.sqlite3', '/srv/app/db.sqlite3', 600))
+        postgres = database({'DB_ENGINE': 'postgresql', 'DB_NAME': 'rg', 'DB_HOST': 'db',
+                             'DB_CONN_MAX_AGE': '60', 'DB_POOLER': 'pgbouncer'}, '/srv/app')
+        self.assertEqual((postgres['NAME'], postgres['HOST'], postgres['CONN_MAX_AGE'],
+                          postgres['DISABLE_SERVER_SIDE_CURSORS']), ('rg', 'db', 60, True))
+        with self.assertRaises(ValueError):
+            database({'DB_ENGINE': 'mysql'}, '/srv/app')
+
+    def test_tuned_sqlite_backend(self):
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        path = os.path.join(directory, 'db.sqlite3')
+        wrapper = ConnectionHandler({'default': database({'DB_NAME': path}, directory)})['default']
+        self.addCleanup(wrapper.close)
+        with wrapper.cursor() as cursor:
+            cursor.execute('PRAGMA journal_mode')
+            self.assertEqual(cursor.fetchone(), ('wal',))
+            cursor.execute('PRAGMA synchronous')
+            self.assertEqual(cursor.fetchone(), (1,))
+        # транзакция сразу держит блокировку записи: второй пишущий ждёт в начале
+        wrapper._start_transaction_under_autocommit()
+        other = sqlite3.connect(path, timeout=0)
+        self.addCleanup(other.close)
+        with self.assertRaises(sqlite3.OperationalError):
+            other.execute('BEGIN IMMEDIATE')
+        wrapper.connection.rollback()
+
+
+class RescoreCommandTests(TestCase):
+
+    def test_rescores_and_ranks_selected_competitions(self):
+        competition = make_competition()
+        with hooks.suspended():
+            for name, d in (('a', 5), ('b', 6)):
+                gymnast = Gymnast.objects.create(competition=competition, name=name, year_of_birth=2010)
+                add_performance(gymnast, 1, d=[d], e=[1])
+        out = StringIO()
+        call_command('rescore', competition.slug, chunk_size=1, stdout=out)
+        self.assertEqual(list(competition.gymnasts.order_by('name').values_list('result', 'rank')),
+                         [(Decimal('14'), 2), (Decimal('15'), 1)])
+        self.assertIn('гимнасток 2', out.getvalue())
+
+    def test_requires_competitions(self):
+        with self.assertRaises(CommandError):
+            call_command('rescore')
+
+
+class StandingTests(TransactionTestCase):
+
+    def setUp(self):
+        self.competition = make_competition()
+        self.other = make_competition('other')
+        for i in range(4):
+            Gymnast.objects.create(competition=self.competition, name='g%s' % i, year_of_birth=2010,
+                                   category='KMS', city='city', result=i)
+
+    def standings(self, competition):
+        return list(competition.standings.order_by('kind', 'competitor_id')
+                    .values_list('kind', 'competitor_id', 'name', 'city', 'category', 'number', 'rank',
+                                 'category_rank', 'age_rank', 'result', 'apparatus_sums', 'members'))
+
+    def assertStandingsFresh(self):
+        # то, что поддерживается по ходу изменений, совпадает с пересборкой с нуля
+        for competition in (self.competition, self.other):
+            maintained = self.standings(competition)
+            competition.standings.all().delete()
+            competition.update_standings(Gymnast)
+            competition.update_standings(Team)
+            self.assertEqual(self.standings(competition), maintained)
+
+    def test_follows_saves_marks_and_deletes(self):
+        gymnast = Gymnast.objects.get(name='g1')
+        gymnast.result = 10
+        gymnast.city = 'other city'
+        gymnast.save()
+        enter_marks(self.competition, Gymnast, 2, {gymnast.pk: {'d1': 4, 'e1': 1}})
+        Gymnast.objects.get(name='g3').delete()
+        with hooks.deferred():
+            for name in ('g0', 'g2'):
+                gymnast = Gymnast.objects.get(name=name)
+                gymnast.result = 5
+                gymnast.save()
+        self.assertEqual(self.competition.standings.get(name='g1').apparatus_results(2),
+                         [None, Decimal('13.000')])
+        self.assertEqual(self.competition.standings.get(name='g2').rank, 2)
+        self.assertStandingsFresh()
+
+    def test_follows_sortition_moves_and_teams(self):
+        Competition.sortition_many([self.competition])
+        self.assertFalse(self.competition.standings.filter(number__isnull=True).exists())
+        team = Team.objects.create(competition=self.competition, name='t', result=3)
+        TeamGymnast.objects.create(team=team, name='member')
+        # члены команды сохраняются отдельно, как в CompetitorAdmin.save_related
+        team.competition.update_standings(Team, [team.pk])
+        gymnast = Gymnast.objects.get(name='g0')
+        gymnast.competition = self.other
+        gymnast.save()
+        self.assertEqual(self.other.standings.get().name, 'g0')
+        self.assertEqual(self.competition.standings.get(kind='team').member_names(), ['member'])
+        self.assertStandingsFresh()
+
+    def test_save_copies_only_moved_positions(self):
+        leader = Gymnast.objects.get(name='g3')
+        leader.category = 'MS'
+        leader.year_of_birth = 2011
+        leader.save()
+        # строка вне окна сдвинувшихся мест не переписывается
+        self.competition.standings.filter(name='g3').update(rank=99)
+        gymnast = Gymnast.objects.get(name='g1')
+        gymnast.result = Decimal('2.5')
+        gymnast.save()
+        self.assertEqual(self.competition.standings.get(name='g3').rank, 99)
+        self.assertEqual(self.competition.standings.get(name='g2').rank, 3)
+        self.competition.standings.filter(name='g3').update(rank=1)
+        self.assertStandingsFresh()
+
+    def test_pages_read_one_range_per_table(self):
+        with CaptureQueriesContext(connection) as queries:
+            self.client.get(reverse('competitions:rank', args=[self.competition.pk]))
+        tables = [q['sql'] for q in queries if 'competitions_standing' in q['sql']]
+        self.assertEqual(len(tables), 2)
+        self.assertFalse([q for q in queries if 'competitions_gymnast' in q['sql']])
+
+
+class ArchiveTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.competition = make_competition()
+        self.competition.end = datetime.date(2019, 5, 1)
+        self.competition.save()
+        self.later = make_competition('later')
+        with hooks.suspended():
+            for name, d, category in (('a', 5, 'KMS'), ('b', 6, ''), ('c', None, '')):
+                gymnast = Gymnast.objects.create(competition=self.competition, name=name,
+                                                 year_of_birth=2010, category=category, city='city')
+                if d:
+                    add_performance(gymnast, 1, d=[d], e=[1, 1, 2])
+                    add_performance(gymnast, 3, d=[1], e=[2], penalty=Decimal('0.3'))
+            team = Team.objects.create(competition=self.competition, name='t', coach='coach')
+            TeamGymnast.objects.create(team=team, name='member 1')
+            TeamGymnast.objects.create(team=team, name='member 2')
+            add_performance(team, 2, d=[4], e=[1])
+            Gymnast.objects.create(competition=self.later, name='x', year_of_birth=2010)
+        self.competition.rescore()
+
+    def snapshot(self):
+        pages = [self.client.get(reverse(name, args=[self.competition.pk])).content
+                 for name in ('competitions:detail', 'competitions:rank', 'competitions:protocol')]
+        competition = Competition.objects.get(pk=self.competition.pk)
+        rows = [list(table.rows(competition)) for tables in export.DOCUMENTS.values() for table in tables]
+        gymnasts = self.client.get(reverse('competitions:api-gymnasts', args=[self.competition.pk]) +
+                                   '?ordering=rank&fields=id,name,rank,result,performances').json()
+        teams = self.client.get(reverse('competitions:api-teams', args=[self.competition.pk]) +
+                                '?fields=name,result,members').json()
+        return pages, rows, gymnasts, [dict(team, members=[member['name'] for member in team['members']])
+                                       for team in teams['results']]
+
+    def test_archived_results_unchanged(self):
+        before = self.snapshot()
+        self.assertIn('member 2', before[0][2].decode())
+        self.assertEqual([row['rank'] for row in before[2]['results']], [1, 2, None])
+        marks = Mark.objects.count()
+        out = StringIO()
+        call_command('archive_competitions', before='2019-06-01', chunk_size=2, stdout=out)
+        self.assertIn('гимнасток 3, команд 1', out.getvalue())
+
+        self.assertEqual(self.snapshot(), before)
+        self.assertTrue(Competition.objects.get(pk=self.competition.pk).archived)
+        self.assertFalse(Gymnast.objects.filter(competition=self.competition).exists())
+        self.assertFalse(Team.objects.filter(competition=self.competition).exists())
+        self.assertFalse(TeamGymnast.objects.exists())
+        self.assertEqual(Mark.objects.count(), 0)
+        self.assertEqual(ArchivedMark.objects.count(), marks)
+        self.assertEqual(Standing.objects.get(name='t').member_names(), ['member 1', 'member 2'])
+        self.assertEqual(list(self.later.gymnasts.values_list('name', flat=True)), ['x'])
+
+    def test_archives_once(self):
+        call_command('archive_competitions', before='2019-06-01', stdout=StringIO())
+        out = StringIO()
+        call_command('archive_competitions', before='2019-06-01', stdout=out)
+        self.assertIn('Нет соревнований', out.getvalue())
+        self.assertEqual(Standing.objects.count(), 4)
+
+    def test_archived_is_read_only(self):
+        call_command('archive_competitions', before='2019-06-01', stdout=StringIO())
+        competition = Competition.objects.get(pk=self.competition.pk)
+        with self.assertRaises(CompetitionArchived):
+            Gymnast.objects.create(competition=competition, name='late', year_of_birth=2010)
+        with self.assertRaises(CompetitionArchived):
+            Competition.sortition_many([competition])
+        with self.assertRaises(CompetitionArchived):
+            competition.rescore()
+        self.assertEqual(competition.standings.count(), 4)
+
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        url = reverse('admin:competitions_competition_marks', args=[competition.pk, 'gymnast', 1])
+        self.assertEqual(self.client.get(url).status_code, 403)
+        url = reverse('admin:competitions_competition_change', args=[competition.pk])
+        self.assertEqual(self.client.post(url, {'title': 'changed'}).status_code, 403)
+        response = self.client.get(reverse('admin:competitions_gymnast_add'))
+        self.assertNotIn(competition.title, [choice[1] for choice in
+                                             response.context['adminform'].form.fields['competition'].choices])
+
+    def test_dry_run_and_bad_date(self):
+        out = StringIO()
+        call_command('archive_competitions', before='2019-06-01', dry_run=True, stdout=out)
+        self.assertIn('test', out.getvalue())
+        self.assertFalse(Competition.objects.get(pk=self.competition.pk).archived)
+        self.assertEqual(ArchivedMark.objects.count(), 0)
+        with self.assertRaises(CommandError):
+            call_command('archive_competitions', before='01.06.2019')
+
+
+class PerformanceTests(TestCase):
+
+    def setUp(self):
+        self.competition = make_competition()
+        with hooks.suspended():
+            self.gymnast = Gymnast.objects.create(competition=self.competition, name='g',
+                                                  year_of_birth=2010)
+
+    def test_update_result_sums_apparatus(self):
+        add_performance(self.gymnast, 1, d=[4, 2], e=[1, 0.5, 0.5, 0.5, 0.5])
+        add_performance(self.gymnast, 3, d=[5], e=[2], penalty=0.3)
+        self.gymnast.update_result()
+        self.assertEqual(
+            list(self.gymnast.performances.order_by('apparatus').values_list('tv_d', 'tv_e', 'result')),
+            [(Decimal('6'), Decimal('8.5'), Decimal('14.5')),
+             (Decimal('5'), Decimal('8'), Decimal('12.7'))])
+        self.gymnast.refresh_from_db()
+        self.assertEqual((self.gymnast.result, self.gymnast.rank), (Decimal('27.2'), 1))
+        gymnast = Gymnast.objects.prefetch_related('performances').get(pk=self.gymnast.pk)
+        self.assertEqual(gymnast.apparatus_results(4), [Decimal('14.5'), None, Decimal('12.7'), None])
+
+    def test_apparatus_configured_per_competition(self):
+        self.assertEqual(self.competition.apparatus(Gymnast), ['Обруч', 'Мяч', 'Булава', 'Лента'])
+        self.competition.team_apparatus = '5 лент, 3 мяча + 2 скакалки, '
+        self.assertEqual(self.competition.apparatus(Team), ['5 лент', '3 мяча + 2 скакалки'])
+
+    def test_one_competitor_per_performance(self):
+        team = Team.objects.create(competition=self.competition, name='t')
+        with self.assertRaises(IntegrityError):
+            Performance.objects.create(gymnast=self.gymnast, team=team, apparatus=1)
+
+    def test_admin_inline_saves_marks(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        url = reverse('admin:competitions_gymnast_change', args=[self.gymnast.pk])
+        data = {'competition': self.competition.pk, 'name': 'g', 'year_of_birth': 2010,
+                'category': '', 'city': '', 'coach': '',
+                'performances-TOTAL_FORMS': 1, 'performances-INITIAL_FORMS': 0,
+                'performances-0-apparatus': 2, 'performances-0-d1': 4, 'performances-0-e1': 1,
+                'performances-0-penalty': 0.5}
+        self.assertRedirects(self.client.post(url, data), reverse('admin:competitions_gymnast_changelist'))
+        performance = self.gymnast.performances.get()
+        self.assertEqual(sorted(performance.marks.values_list('panel', 'slot', 'value')),
+                         [(Mark.D, 1, 4000), (Mark.E, 1, 1000)])
+        self.gymnast.refresh_from_db()
+        self.assertEqual(self.gymnast.result, Decimal('12.5'))
+        self.assertContains(self.client.get(url), 'Мяч')
+
+
+class HookBatchingTests(TransactionTestCase):
+
+    def setUp(self):
+        self.competition = make_competition()
+
+    def create_gymnasts(self, count):
+        for i in range(count):
+            Gymnast.objects.create(competition=self.competition, name='g%s' % i,
+                                   year_of_birth=2010, result=i + 1)
+
+    def statements(self, queries, fragment):
+        return [q['sql'] for q in queries if fragment in q['sql']]
+
+    def test_deferred_ranks_and_unsorts_once(self):
+        with CaptureQueriesContext(connection) as queries, hooks.deferred():
+            self.create_gymnasts(20)
+        self.assertEqual(len(self.statements(queries, 'RANK() OVER')), 1)
+        self.assertEqual(len(self.statements(queries, '"gymnasts_are_sorted" = 0')), 1)
+        self.assertEqual(list(self.competition.gymnasts.order_by('-result')
+                              .values_list('rank', flat=True)), list(range(1, 21)))
+
+    def test_single_change_in_batch_stays_incremental(self):
+        self.create_gymnasts(5)
+        gymnast = Gymnast.objects.get(name='g0')
+        gymnast.result = Decimal('3.5')
+        with CaptureQueriesContext(connection) as queries, hooks.deferred():
+            gymnast.save()
+        # общее место сдвигается без RANK(); места в разряде и среди ровесниц
+        # пересчитываются только в группах гимнастки
+        ranks = self.statements(queries, 'RANK() OVER')
+        self.assertEqual(len(ranks), 1)
+        self.assertNotIn('"rank"', ranks[0].split('SELECT')[0])
+        self.assertIn('"category" IN', ranks[0])
+        self.assertEqual(Gymnast.objects.get(name='g0').rank, 3)
+
+    def test_suspended_hooks_leave_ranks_to_caller(self):
+        with hooks.suspended():
+            self.create_gymnasts(3)
+        self.assertFalse(self.competition.gymnasts.filter(rank__isnull=False).exists())
+        self.competition.make_rank_list(Gymnast())
+        self.assertEqual(self.competition.gymnasts.filter(rank__isnull=False).count(), 3)
+
+    def test_delete_reranks(self):
+        self.create_gymnasts(3)
+        Gymnast.objects.get(name='g2').delete()
+        self.assertEqual(sorted(self.competition.gymnasts.values_list('rank', flat=True)), [1, 2])
+
+    def test_rolled_back_save_leaves_ranks(self):
+        self.create_gymnasts(3)
+        ranks = dict(self.competition.gymnasts.values_list('name', 'rank'))
+        with self.assertRaises(ValueError), hooks.deferred(), transaction.atomic():
+            gymnast = Gymnast.objects.get(name='g0')
+            gymnast.result = 40
+            gymnast.save()
+            raise ValueError
+        self.assertEqual(dict(self.competition.gymnasts.values_list('name', 'rank')), ranks)
+
+    def test_flushed_on_commit(self):
+        with hooks.deferred(), transaction.atomic():
+            self.create_gymnasts(3)
+        self.assertEqual(sorted(self.competition.gymnasts.values_list('rank', flat=True)), [1, 2, 3])
+        with transaction.atomic():
+            with hooks.deferred():
+                Gymnast.objects.get(name='g2').delete()
+            # до фиксации транзакции места не трогаются
+            self.assertEqual(sorted(self.competition.gymnasts.values_list('rank', flat=True)), [2, 3])
+        self.assertEqual(sorted(self.competition.gymnasts.values_list('rank', flat=True)), [1, 2])
+
+    def test_middleware_defers_for_the_request(self):
+        def view(request):
+            self.create_gymnasts(5)
+            return HttpResponse()
+
+        with CaptureQueriesContext(connection) as queries:
+            DeferredHooksMiddleware(view)(RequestFactory().get('/'))
+        self.assertEqual(len(self.statements(queries, 'RANK() OVER')), 1)
+
+
+class ResultsPageTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.competition = make_competition()
+
+    def populate(self, count):
+        with hooks.suspended():
+            for i in range(count):
+                Gymnast.objects.create(competition=self.competition, name='g%s' % i,
+                                       year_of_birth=2010, category='KMS', result=i)
+                team = Team.objects.create(competition=self.competition, name='t%s' % i, result=i)
+                TeamGymnast.objects.create(team=team, name='member %s' % i)
+        self.competition.make_rank_list(Gymnast())
+        self.competition.make_rank_list(Team())
+        self.competition.update_standings(Gymnast)
+        self.competition.update_standings(Team)
+        self.competition.touch()
+
+    def url(self, name):
+        return reverse('competitions:%s' % name, args=[self.competition.pk])
+
+    def query_counts(self):
+        counts = {}
+        for name in ('detail', 'rank', 'protocol'):
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self.client.get(self.url(name)).status_code, 200)
+            counts[name] = len(queries)
+        return counts
+
+    def test_query_count_does_not_depend_on_field_size(self):
+        self.populate(3)
+        small = self.query_counts()
+        self.populate(30)
+        self.assertEqual(self.query_counts(), small)
+        # версия результатов + соревнование + гимнастки + команды: суммы по
+        # видам и члены команд лежат в строках таблицы результатов
+        self.assertEqual(small, {'detail': 4, 'rank': 4, 'protocol': 4})
+
+    def test_cached_until_results_change(self):
+        self.populate(3)
+        first = self.client.get(self.url('rank'))
+        with self.assertNumQueries(1):
+            self.assertEqual(self.client.get(self.url('rank')).content, first.content)
+        gymnast = Gymnast.objects.get(name='g0')
+        gymnast.result = 10
+        gymnast.save()
+        response = self.client.get(self.url('rank'))
+        self.assertNotEqual(response['ETag'], first['ETag'])
+        self.assertEqual(response.context['gymnasts'][0].name, 'g0')
+
+    def test_conditional_get(self):
+        self.populate(1)
+        response = self.client.get(self.url('protocol'))
+        with self.assertNumQueries(1):
+            repeat = self.client.get(self.url('protocol'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(repeat.status_code, 304)
+        repeat = self.client.get(self.url('protocol'),
+                                 HTTP_IF_MODIFIED_SINCE=response['Last-Modified'])
+        self.assertEqual(repeat.status_code, 304)
+
+    def test_rank_page_lists_ranked_competitors_in_order(self):
+        self.populate(3)
+        response = self.client.get(reverse('competitions:rank', args=[self.competition.pk]))
+        self.assertEqual([g.name for g in response.context['gymnasts']], ['g2', 'g1'])
+        self.assertContains(response, 'КМС')
+
+
+class AdminChangeListTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.competition = make_competition()
+        with hooks.suspended():
+            for i in range(30):
+                Gymnast.objects.create(competition=self.competition, name='g%s' % i, year_of_birth=2010,
+                                       city='c%s' % (i % 3), number=i + 1)
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        self.url = reverse('admin:competitions_gymnast_changelist')
+
+    def changelist_queries(self, query=''):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(self.url + query)
+        self.assertEqual(response.status_code, 200)
+        return response, [q['sql'] for q in queries]
+
+    def test_lean_changelist(self):
+        response, first = self.changelist_queries()
+        self.assertEqual(sum('DISTINCT' in sql for sql in first), 2)
+        self.assertContains(response, '>c2<')
+        response, queries = self.changelist_queries()
+        # значения фильтров -- из кэша; соревнования -- тем же запросом, что и гимнастки
+        self.assertFalse([sql for sql in queries if 'DISTINCT' in sql])
+        listed, = [sql for sql in queries if '"competitions_gymnast"."name"' in sql]
+        self.assertIn('"competitions_competition"."title"', listed)
+        self.assertNotIn('"competitions_gymnast"."result"', listed)
+        self.assertEqual(len(response.context['cl'].result_list), 30)
+        response, queries = self.changelist_queries('?competition__id__exact=%s&city=c1' % self.competition.pk)
+        self.assertEqual(response.context['cl'].result_count, 10)
+
+    def test_estimated_count_for_whole_table(self):
+        Gymnast.objects.filter(name='g5').delete()
+        paginator = EstimatedCountPaginator(Gymnast.objects.order_by('pk'), 10)
+        paginator.estimate_from = 1
+        # оценка по крайним ключам, без COUNT(*)
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(paginator.count, 30)
+        self.assertNotIn('COUNT', queries[0]['sql'])
+        filtered = EstimatedCountPaginator(Gymnast.objects.filter(competition=self.competition).order_by('pk'), 10)
+        filtered.estimate_from = 1
+        self.assertEqual(filtered.count, 29)
+
+    def test_estimate_after_archiving(self):
+        later = make_competition('later')
+        first = Gymnast.objects.get(name='g0')
+        first.competition = later
+        first.save()
+        Gymnast.objects.create(competition=later, name='last', year_of_birth=2010)
+        self.competition.end = datetime.date(2019, 5, 1)
+        self.competition.save()
+        archive_competition(self.competition)
+        # ключи заархивированных гимнасток пропущены, оценка по крайним завышена
+        self.assertEqual(estimated_count(Gymnast), 31)
+        paginator = EstimatedCountPaginator(Gymnast.objects.order_by('pk'), 10)
+        paginator.estimate_from = 10
+        self.assertEqual(paginator.count, 2)
+        self.assertEqual(paginator.num_pages, 1)
+
+
+class LiveResultsTests(TestCase):
+
+    def setUp(self):
+        self.competition = make_competition()
+        for i in range(3):
+            Gymnast.objects.create(competition=self.competition, name='g%s' % i,
+                                   year_of_birth=2010, result=i + 1)
+
+    def read_event(self, content):
+        lines = next(content).decode().strip().splitlines()
+        fields = dict(line.split(': ', 1) for line in lines)
+        return fields['event'], json.loads(fields['data'])
+
+    def test_stream_sends_snapshot_then_changed_rows_only(self):
+        response = self.client.get(reverse('competitions:live', args=[self.competition.pk]))
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        content = iter(response.streaming_content)
+        self.assertTrue(next(content).startswith(b'retry:'))
+        event, snapshot = self.read_event(content)
+        self.assertEqual((event, len(snapshot)), ('standings', 3))
+
+        gymnast = Gymnast.objects.get(name='g0')
+        gymnast.result = 10
+        gymnast.save()
+        # в TestCase on_commit не срабатывает, публикуем вручную
+        with CaptureQueriesContext(connection) as queries:
+            live.broker.publish(self.competition.pk)
+        # одна узкая таблица результатов, без гимнасток и команд
+        self.assertEqual(len(queries), 1)
+        self.assertIn('competitions_standing', queries[0]['sql'])
+        self.assertNotIn('competitions_gymnast', queries[0]['sql'])
+        event, changes = self.read_event(content)
+        self.assertEqual(event, 'changes')
+        self.assertEqual(sorted((row['name'], row['rank']) for row in changes['changed']),
+                         [('g0', 1), ('g1', 3), ('g2', 2)])
+        self.assertEqual(changes['changed'][0]['category_rank'], changes['changed'][0]['rank'])
+
+        response.close()
+        self.assertNotIn(self.competition.pk, live.broker.channels)
+
+    def test_unwatched_competition_costs_no_queries(self):
+        with self.assertNumQueries(0):
+            live.broker.publish(self.competition.pk)
+
+
+class ApiTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.competition = make_competition()
+        with hooks.suspended():
+            for i, result in enumerate([5, 7, 7, 3, 0]):
+                Gymnast.objects.create(competition=self.competition, name='g%s' % i,
+                                       year_of_birth=2010, result=result)
+            team = Team.objects.create(competition=self.competition, name='t', result=4)
+            self.member = TeamGymnast.objects.create(team=team, name='member')
+        self.competition.make_rank_list(Gymnast())
+        self.competition.make_rank_list(Team())
+        Performance.objects.bulk_create(Performance(gymnast=gymnast, apparatus=1, result=Decimal('9.5'))
+                                        for gymnast in Gymnast.objects.all())
+
+    def url(self, name, **params):
+        url = reverse('competitions:api-%s' % name, args=[self.competition.pk])
+        return url + '?' + '&'.join('%s=%s' % item for item in params.items())
+
+    def test_default_fields_skip_performances(self):
+        data = self.client.get(self.url('gymnasts')).json()
+        self.assertEqual(len(data['results']), 5)
+        self.assertNotIn('performances', data['results'][0])
+        data = self.client.get(self.url('gymnasts', fields='name,performances')).json()
+        self.assertEqual(data['results'][0], {'name': 'g0', 'performances': [
+            {'apparatus': 1, 'penalty': None, 'tv_d': None, 'tv_e': None, 'score': None,
+             'result': '9.500'}]})
+        response = self.client.get(self.url('gymnasts', fields='name,password'))
+        self.assertEqual(response.status_code, 400)
+
+    def test_cursor_pagination_by_rank(self):
+        names, url = [], self.url('gymnasts', ordering='rank', limit=2, fields='name,rank')
+        while url:
+            with self.assertNumQueries(2):
+                data = self.client.get(url).json()
+            names += [(row['name'], row['rank']) for row in data['results']]
+            url = data['next']
+        # без места (итог 0) идут последними
+        self.assertEqual(names, [('g1', 1), ('g2', 1), ('g0', 3), ('g3', 4), ('g4', None)])
+
+    def test_teams_with_members(self):
+        with self.assertNumQueries(3):
+            data = self.client.get(self.url('teams')).json()
+        self.assertEqual(data['results'][0]['members'], [{'id': self.member.pk, 'name': 'member'}])
+
+    def test_archived_list_reads_one_query(self):
+        pks = sorted(Gymnast.objects.values_list('pk', flat=True))
+        archive_competition(self.competition)
+        # версия результатов и страница строк Standing, без запроса на строку
+        with self.assertNumQueries(2):
+            data = self.client.get(self.url('gymnasts')).json()
+        self.assertEqual(sorted(row['id'] for row in data['results']), pks)
+
+    def test_conditional_get(self):
+        response = self.client.get(self.url('gymnasts'))
+        with self.assertNumQueries(1):
+            repeat = self.client.get(self.url('gymnasts'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(repeat.status_code, 304)
+        gymnast = Gymnast.objects.get(name='g3')
+        gymnast.result = 10
+        gymnast.save()
+        response = self.client.get(self.url('gymnasts'), HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_competitions(self):
+        data = self.client.get(reverse('competitions:api-list')).json()
+        self.assertEqual([row['slug'] for row in data['results']], ['test'])
+        data = self.client.get(self.url('detail')).json()
+        self.assertEqual(data['title'], 'test')
+        self.assertEqual(self.client.get(reverse('competitions:api-detail', args=[0])).status_code, 404)
+
+
+class StartListImportTests(TestCase):
+    CSV = ('имя;год рождения;разряд;город;участник;члены команды\n'
+           'Иванова;2010;КМС;Москва;;\n'
+           'Петрова;2011;I;Тверь;;\n'
+           'Звезда;;;Москва;команда;"Иванова; Сидорова"\n')
+
+    def setUp(self):
+        self.competition = make_competition()
+        self.competition.sortition(seed=1)
+
+    def test_imports_csv_with_one_rerank(self):
+        with CaptureQueriesContext(connection) as queries:
+            counts = import_start_list(self.competition, io.BytesIO(self.CSV.encode()), 'list.csv')
+        self.assertEqual(counts, {Gymnast: 2, Team: 1, TeamGymnast: 2})
+        self.assertEqual(sum('RANK()' in q['sql'] for q in queries), 2)
+        self.assertEqual(Gymnast.objects.get(name='Иванова').category, 'KMS')
+        self.assertEqual(list(Team.objects.get().team_gymnasts.values_list('name', flat=True)),
+                         ['Иванова', 'Сидорова'])
+        competition = Competition.objects.get()
+        self.assertFalse(competition.gymnasts_are_sorted or competition.teams_are_sorted)
+
+    def test_invalid_rows_abort_import(self):
+        data = 'name,year_of_birth,category\na,2010,KMS\nb,1990,KMS\nc,2010,XX\n'
+        with self.assertRaises(StartListError) as raised:
+            import_start_list(self.competition, io.BytesIO(data.encode()), 'list.csv')
+        self.assertEqual([message.split(':')[0] for message in raised.exception.errors],
+                         ['Строка 3', 'Строка 4'])
+        self.assertFalse(Gymnast.objects.exists())
+
+    def test_xlsx(self):
+        from openpyxl import Workbook
+        workbook = Workbook()
+        workbook.active.append(['name', 'year_of_birth', 'category'])
+        for i in range(30):
+            workbook.active.append(['g%s' % i, 2010, 'MS'])
+        file = io.BytesIO()
+        workbook.save(file)
+        file.seek(0)
+        counts = import_start_list(self.competition, file, 'list.xlsx', chunk_size=7)
+        self.assertEqual(counts[Gymnast], 30)
+
+    def test_cp1251_csv_is_reported(self):
+        with self.assertRaises(StartListError) as raised:
+            import_start_list(self.competition, io.BytesIO(self.CSV.encode('cp1251')), 'list.csv')
+        self.assertIn('UTF-8', raised.exception.errors[0])
+        self.assertFalse(Gymnast.objects.exists())
+
+    def test_broken_xlsx_is_a_form_error(self):
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        url = reverse('admin:competitions_competition_import', args=[self.competition.pk])
+        upload = io.BytesIO(self.CSV.encode())
+        upload.name = 'list.xlsx'
+        response = self.client.post(url, {'file': upload})
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, 'не является книгой XLSX')
+
+    def test_command_and_admin(self):
+        with tempfile.NamedTemporaryFile('w', suffix='.csv', delete=False) as file:
+            file.write(self.CSV)
+        self.addCleanup(os.remove, file.name)
+        out = StringIO()
+        call_command('import_startlist', 'test', file.name, stdout=out)
+        self.assertIn('гимнасток 2, команд 1', out.getvalue())
+
+        user = User.objects.create_superuser('admin', 'admin@example.com', 'password')
+        self.client.force_login(user)
+        url = reverse('admin:competitions_competition_import', args=[self.competition.pk])
+        with open(file.name, 'rb') as upload:
+            response = self.client.post(url, {'file': upload})
+        self.assertRedirects(response, reverse('admin:competitions_competition_change',
+                                               args=[self.competition.pk]))
+        self.assertEqual(Gymnast.objects.count(), 4)
+
+
+class MarksEntryTests(TestCase):
+
+    def setUp(self):
+        self.competition = make_competition()
+        with hooks.suspended():
+            self.gymnasts = [Gymnast.objects.create(competition=self.competition, name='g%s' % i,
+                                                    year_of_birth=2010)
+                             for i in range(3)]
+            for gymnast in self.gymnasts:
+                add_performance(gymnast, 2, d=[3])
+        self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+        self.url = reverse('admin:competitions_competition_marks',
+                           args=[self.competition.pk, 'gymnast', 1])
+
+    def post(self, marks):
+        data = {'form-TOTAL_FORMS': len(marks), 'form-INITIAL_FORMS': len(marks)}
+        for i, (gymnast, values) in enumerate(marks):
+            data['form-%s-id' % i] = gymnast.pk
+            data.update(('form-%s-%s' % (i, name), value) for name, value in values.items())
+        return self.client.post(self.url, data)
+
+    def test_marks_match_admin_form_save(self):
+        self.assertContains(self.client.get(self.url), 'g2')
+        marks = [(self.gymnasts[0], {'d1': 4.5, 'd2': 2, 'e1': 1.2, 'e2': 0.5, 'e3': 0.6,
+                                     'e4': 0.7, 'e5': 0.5, 'penalty': 0.3}),
+                 (self.gymnasts[1], {'d1': 5, 'e1': 1}),
+                 (self.gymnasts[2], {})]
+        self.assertRedirects(self.post(marks), self.url)
+        self.assertEqual([g.name for g in Gymnast.objects.order_by('rank')], ['g0', 'g1', 'g2'])
+
+        entered = (performance_values(Gymnast), list(Gymnast.objects.order_by('pk').values_list('result')))
+        # то же, что пересчитает update_result при сохранении через админку
+        for gymnast in Gymnast.objects.all():
+            gymnast.update_result()
+        self.assertEqual((performance_values(Gymnast),
+                          list(Gymnast.objects.order_by('pk').values_list('result'))), entered)
+
+    def test_query_count_does_not_depend_on_number_of_competitors(self):
+        with hooks.suspended():
+            for i in range(10):
+                Gymnast.objects.create(competition=self.competition, name='x%s' % i, year_of_birth=2010)
+        marks = {pk: {'d1': 3} for pk in Gymnast.objects.values_list('pk', flat=True)}
+        counts = []
+        for apparatus in (1, 1):
+            with CaptureQueriesContext(connection) as queries:
+                enter_marks(self.competition, Gymnast, apparatus, marks)
+            counts.append(len([q for q in queries if 'SAVEPOINT' not in q['sql']]))
+        # блокировка соревнования, участники, выступления (+ создание и
+        # перечитывание новых), удаление и вставка оценок D1 (сбавки не
+        # вводились), выступления и оценки для пересчёта, запись выступлений и
+        # итогов, пересчёт мест, строки таблицы результатов (имеющиеся,
+        # участники, выступления, запись, места остальных), версия результатов
+        self.assertEqual(counts, [18, 16])
+        self.assertEqual(Gymnast.objects.filter(rank=4).count(), 10)
+
+    def test_json_and_validation(self):
+        response = self.client.post(self.url, json.dumps([{'id': self.gymnasts[0].pk, 'd1': 11}]),
+                                    content_type='application/json')
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('d1', response.json()['errors'][0])
+        response = self.client.post(self.url, json.dumps([{'id': self.gymnasts[0].pk, 'd1': 4}]),
+                                    content_type='application/json')
+        self.assertEqual(response.json(), {'saved': 1})
+        performance = self.gymnasts[0].performances.get(apparatus=1)
+        self.assertEqual(list(performance.marks.values_list('panel', 'slot', 'value')), [(Mark.D, 1, 4000)])
+
+
+class ExportTests(TestCase):
+
+    def setUp(self):
+        self.competition = make_competition()
+        with hooks.suspended():
+            for i in range(3):
+                Gymnast.objects.create(competition=self.competition, name='g%s' % i,
+                                       year_of_birth=2010, category='KMS', result=i)
+            team = Team.objects.create(competition=self.competition, name='t', result=5)
+            TeamGymnast.objects.create(team=team, name='member 1')
+            TeamGymnast.objects.create(team=team, name='member 2')
+        Performance.objects.create(gymnast=Gymnast.objects.get(name='g2'), apparatus=2, result=2)
+        self.competition.make_rank_list(Gymnast())
+        self.competition.make_rank_list(Team())
+        self.competition.update_standings(Gymnast)
+        self.competition.update_standings(Team)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.settings = override_settings(EXPORT_CACHE_DIR=directory.name)
+        self.settings.enable()
+        self.addCleanup(self.settings.disable)
+        self.directory = directory.name
+
+    def url(self, document, fmt):
+        return reverse('competitions:export', args=[self.competition.pk, document, fmt])
+
+    def test_xlsx_protocol(self):
+        from openpyxl import load_workbook
+        # версия результатов, соревнование, гимнастки, команды с членами, slug
+        with self.assertNumQueries(5):
+            response = self.client.get(self.url('protocol', 'xlsx'))
+        self.assertIn('test-protocol.xlsx', response['Content-Disposition'])
+        workbook = load_workbook(io.BytesIO(b''.join(response.streaming_content)))
+        gymnasts, teams = [list(sheet.values) for sheet in workbook.worksheets]
+        self.assertEqual(gymnasts[-4][6:], ('Обруч', 'Мяч', 'Булава', 'Лента', 'Сумма'))
+        self.assertEqual(gymnasts[-3][:4], ('1', 'g2', '2010', 'КМС'))
+        self.assertEqual(gymnasts[-3][6:], ('-', '2.000', '-', '-', '2.000'))
+        self.assertEqual(gymnasts[-1][:2], ('-', 'g0'))
+        self.assertEqual([row[1] for row in teams[-3:]], ['t', 'member 1', 'member 2'])
+
+    def test_pdf_cached_per_version(self):
+        response = self.client.get(self.url('rank', 'pdf'))
+        self.assertTrue(b''.join(response.streaming_content).startswith(b'%PDF'))
+        with self.assertNumQueries(2):
+            repeat = self.client.get(self.url('rank', 'pdf'))
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+        with self.assertNumQueries(1):
+            repeat = self.client.get(self.url('rank', 'pdf'), HTTP_IF_NONE_MATCH=repeat['ETag'])
+        self.assertEqual(repeat.status_code, 304)
+
+        gymnast = Gymnast.objects.get(name='g0')
+        gymnast.result = 10
+        gymnast.save()
+        response = self.client.get(self.url('rank', 'pdf'))
+        self.assertEqual(response.status_code, 200)
+        response.close()
+        self.assertEqual(len(os.listdir(self.directory)), 1)
+
+    def test_pdf_without_cyrillic_font_is_unavailable(self):
+        with override_settings(EXPORT_PDF_FONT=os.path.join(self.directory, 'missing.ttf')), \
+                self.assertLogs('competitions.export', 'ERROR'):
+            response = self.client.get(self.url('rank', 'pdf'))
+        self.assertEqual(response.status_code, 404)
+        self.assertEqual(os.listdir(self.directory), [])
+
+
+class BenchmarkDataTests(TestCase):
+
+    def snapshot(self, competition):
+        return (list(competition.gymnasts.order_by('pk').values_list('name', 'category', 'result')),
+                list(Mark.objects.filter(performance__gymnast__competition=competition)
+                     .order_by('pk').values_list('panel', 'slot', 'value')),
+                list(competition.teams.order_by('pk').values_list('name', 'result')))
+
+    def test_same_seed_gives_same_data(self):
+        first = benchmarks.make_competition(20, teams=4, seed=7, marks='normal')
+        second = benchmarks.make_competition(20, teams=4, seed=7, marks='normal')
+        self.assertEqual(self.snapshot(first), self.snapshot(second))
+        self.assertEqual(second.teams.count(), 4)
+        # итоги посчитаны по оценкам судей
+        gymnast = second.gymnasts.first()
+        result = gymnast.result
+        gymnast.update_result()
+        self.assertEqual(gymnast.stored_result(), result)
+
+    def test_sparse_marks(self):
+        competition = benchmarks.make_competition(20, seed=1, marks='sparse')
+        marks = Mark.objects.filter(performance__gymnast__competition=competition).count()
+        self.assertTrue(0 < marks < 20 * 4 * 7)
+
+
+class ProfilingTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        profiling.stats.reset()
+        self.competition = make_competition()
+        with hooks.suspended():
+            self.gymnast = Gymnast.objects.create(competition=self.competition, name='g',
+                                                  year_of_birth=2010, result=1)
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.log = os.path.join(directory.name, 'requests.jsonl')
+
+    def test_aggregates_per_view_and_logs(self):
+        with self.settings(PROFILING=True, PROFILING_LOG=self.log):
+            for i in range(2):
+                self.client.get(reverse('competitions:protocol', args=[self.competition.pk]))
+            self.client.get('/competitions/nowhere')
+            self.client.force_login(User.objects.create_superuser('admin', 'admin@example.com', 'password'))
+            report = self.client.get(reverse('competitions:profile')).json()
+        self.assertTrue(report['enabled'])
+        views = {row['view']: row for row in report['views']}
+        protocol = views['GET competitions:protocol']
+        # версия результатов, соревнование, гимнастки, команды; второй раз
+        # страница отдаётся из кэша после проверки версии
+        self.assertEqual((protocol['requests'], protocol['queries']), (2, 4 + 1))
+        self.assertGreater(protocol['template_seconds'], 0)
+        self.assertLessEqual(protocol['sql_seconds'], protocol['seconds'])
+        self.assertIn('GET unresolved', views)
+        with open(self.log) as file:
+            lines = [json.loads(line) for line in file]
+        self.assertEqual([(line['view'], line['status']) for line in lines[:3]],
+                         [('GET competitions:protocol', 200)] * 2 + [('GET unresolved', 404)])
+
+    def test_disabled_by_default_and_staff_only(self):
+        self.client.get(reverse('competitions:protocol', args=[self.competition.pk]))
+        self.assertEqual(profiling.stats.report(), [])
+        response = self.client.get(reverse('competitions:profile'))
+        self.assertEqual(response.status_code, 302)
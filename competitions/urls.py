@@ -1,6 +1,7 @@
 from django.conf.urls import url
-from django.views.generic import ListView, DetailView
+from django.views.generic import ListView
 from .models import Competition
+from . import api, views
 
 app_name = 'competitions'
 urlpatterns = [
@@ -8,13 +9,19 @@ urlpatterns = [
                                     # queryset=Post.objects.all().order_by("-date")[:25],
                                     queryset=Competition.objects.all().order_by("title")[:25],
                                     template_name="competitions.html")),
-                url(r'^(?P<pk>\d+)$', DetailView.as_view(
-                                    model=Competition,
-                                    template_name="competition.html")),
-                url(r'^(?P<pk>\d+)/rank$', DetailView.as_view(
-                                    model=Competition,
-                                    template_name="competition_rank.html")),
-                url(r'^(?P<pk>\d+)/protocol$', DetailView.as_view(
-                                    model=Competition,
-                                    template_name="competition_protocol.html")),
+                url(r'^(?P<pk>\d+)$', views.CompetitionDetailView.as_view(),
+                    name='detail'),
+                url(r'^(?P<pk>\d+)/rank$', views.CompetitionRankView.as_view(),
+                    name='rank'),
+                url(r'^(?P<pk>\d+)/protocol$', views.CompetitionProtocolView.as_view(),
+                    name='protocol'),
+                url(r'^(?P<pk>\d+)/live$', views.competition_live, name='live'),
+                url(r'^(?P<pk>\d+)/(?P<document>protocol|rank)\.(?P<fmt>xlsx|pdf)$',
+                    views.competition_export, name='export'),
+                url(r'^profile$', views.profiling_report, name='profile'),
+                url(r'^api/$', api.CompetitionListApi.as_view(), name='api-list'),
+                url(r'^api/(?P<pk>\d+)$', api.CompetitionApi.as_view(), name='api-detail'),
+                url(r'^api/(?P<pk>\d+)/gymnasts$', api.GymnastListApi.as_view(),
+                    name='api-gymnasts'),
+                url(r'^api/(?P<pk>\d+)/teams$', api.TeamListApi.as_view(), name='api-teams'),
             ]
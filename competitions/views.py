@@ -1,4 +1,16 @@
-from django.shortcuts import render
+from django.conf import settings
+from django.contrib.admin.views.decorators import staff_member_required
+from django.core.cache import cache
+from django.db import connection
+from django.http import FileResponse, Http404, HttpResponse, JsonResponse, StreamingHttpResponse
+from django.shortcuts import get_object_or_404, render
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+from django.views.decorators.http import require_http_methods
+from django.views.generic import DetailView
+
+from . import export, live, profiling
+from .models import Competition, Gymnast, Standing, Team
 
 
 def index(request):
@@ -11,3 +23,167 @@ def contact(request):
                         ['Все свои пожелания Вы можете отправлять на наш почтовый адрес:',
                          'cool.rhythmicgymnastics@yandex.ru']
                    })
+
+
+def results_state(pk):
+    # Версия и время изменения результатов (по ним строятся ключ кэша и ETag)
+    # и признак архивного соревнования
+    try:
+        version, modified, archived = (Competition.objects.values_list('version', 'modified', 'archived')
+                                       .get(pk=pk))
+    except Competition.DoesNotExist:
+        raise Http404('Соревнование не найдено')
+    return '%s.%s.%s' % (pk, version, int(modified.timestamp() * 1000000)), modified, archived
+
+
+def results_version(pk):
+    return results_state(pk)[:2]
+
+
+class CompetitionView(DetailView):
+    # Участники читаются из таблицы результатов (см. standings): по запросу
+    # на гимнасток и команд, уже отсортированных в БД и только с выводимыми
+    # полями; суммы по видам и члены команд лежат в тех же строках.
+    # Готовая страница кэшируется до следующего изменения результатов.
+    model = Competition
+    gymnast_fields = ('name', 'year_of_birth', 'category', 'city', 'coach', 'number')
+    team_fields = ('name', 'city', 'coach', 'number')
+    ordering = ('competitor_id',)
+    ranked_only = False
+
+    def get(self, request, *args, **kwargs):
+        version, modified = results_version(kwargs['pk'])
+        etag = '"%s.%s"' % (self.template_name, version)
+        last_modified = int(modified.timestamp())
+        response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+        if response is None:
+            key = 'competitions:%s:%s' % (self.template_name, version)
+            content = cache.get(key)
+            if content is None:
+                response = super().get(request, *args, **kwargs).render()
+                cache.set(key, response.content, settings.RESULTS_CACHE_TIMEOUT)
+            else:
+                response = HttpResponse(content)
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        return response
+
+    def get_ordering(self, model):
+        return self.ordering
+
+    def get_competitors(self, model, fields):
+        queryset = (Standing.objects
+                    .filter(competition=self.object, kind=model._meta.model_name)
+                    .only(*fields)
+                    .order_by(*self.get_ordering(model)))
+        if self.ranked_only:
+            queryset = queryset.filter(rank__isnull=False)
+        return queryset
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context['gymnasts'] = self.get_competitors(Gymnast, self.gymnast_fields)
+        context['teams'] = self.get_competitors(Team, self.team_fields + ('members',))
+        return context
+
+
+class CompetitionDetailView(CompetitionView):
+    template_name = 'competition.html'
+
+    def get_ordering(self, model):
+        if model is Gymnast:
+            drawn = self.object.gymnasts_are_sorted
+        else:
+            drawn = self.object.teams_are_sorted
+        return ('number', 'competitor_id') if drawn else ('competitor_id',)
+
+
+class CompetitionRankView(CompetitionView):
+    template_name = 'competition_rank.html'
+    gymnast_fields = ('name', 'year_of_birth', 'category', 'city', 'result', 'rank', 'category_rank',
+                      'age_rank')
+    team_fields = ('name', 'city', 'result', 'rank')
+    ordering = ('rank', 'name')
+    ranked_only = True
+
+
+class CompetitionProtocolView(CompetitionView):
+    template_name = 'competition_protocol.html'
+    gymnast_fields = ('name', 'year_of_birth', 'category', 'city', 'coach', 'rank', 'result')
+    team_fields = ('name', 'city', 'coach', 'rank', 'result')
+    ordering = ('-result', 'name')
+
+    def get_competitors(self, model, fields):
+        return super().get_competitors(model, fields + ('apparatus_sums',))
+
+    def get_context_data(self, **kwargs):
+        # Суммы по видам раскладываются по столбцам видов программы соревнования
+        context = super().get_context_data(**kwargs)
+        for model, key in ((Gymnast, 'gymnasts'), (Team, 'teams')):
+            apparatus = self.object.apparatus(model)
+            context[key] = list(context[key])
+            for competitor in context[key]:
+                competitor.results = competitor.apparatus_results(len(apparatus))
+            context['%s_apparatus' % model._meta.model_name] = apparatus
+        return context
+
+
+def competition_live(request, pk):
+    competition = get_object_or_404(Competition.objects.only('pk'), pk=pk)
+    channel, seq, standings = live.broker.subscribe(competition.pk)
+    if not connection.in_atomic_block:
+        # Дальше поток только ждёт событий, соединение с БД ему не нужно
+        connection.close()
+
+    def stream(seq=seq):
+        try:
+            yield 'retry: %s\n\n' % settings.LIVE_RETRY_MS
+            yield live.format_event('standings', list(standings.values()), seq)
+            while True:
+                events = live.broker.wait(channel, seq, settings.LIVE_KEEPALIVE)
+                if not events:
+                    yield ': keepalive\n\n'
+                elif events[0][0] != seq + 1:
+                    # клиент отстал больше, чем хранит история, шлём снимок целиком
+                    with channel.condition:
+                        seq, snapshot = channel.seq, list(channel.standings.values())
+                    yield live.format_event('standings', snapshot, seq)
+                else:
+                    for seq, data in events:
+                        yield live.format_event('changes', data, seq)
+        finally:
+            live.broker.unsubscribe(competition.pk, channel)
+
+    response = StreamingHttpResponse(stream(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    response['X-Accel-Buffering'] = 'no'
+    return response
+
+
+def competition_export(request, pk, document, fmt):
+    version, modified = results_version(pk)
+    etag = '"%s.%s.%s"' % (document, fmt, version)
+    last_modified = int(modified.timestamp())
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is None:
+        try:
+            path = export.export_path(pk, version, document, fmt)
+        except export.ExportUnavailable as error:
+            raise Http404(error)
+        slug = Competition.objects.values_list('slug', flat=True).get(pk=pk)
+        response = FileResponse(open(path, 'rb'), as_attachment=True,
+                                filename='%s-%s.%s' % (slug, document, fmt))
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+@staff_member_required
+@require_http_methods(['GET', 'POST'])
+def profiling_report(request):
+    # POST обнуляет накопленные замеры, например перед началом соревнования
+    if request.method == 'POST':
+        profiling.stats.reset()
+    return JsonResponse({'enabled': getattr(settings, 'PROFILING', False),
+                         'views': profiling.stats.report()},
+                        json_dumps_params={'ensure_ascii': False})
@@ -0,0 +1,45 @@
+"""Настройки БД из переменных окружения (см. settings_production).
+
+DB_ENGINE=sqlite (по умолчанию) -- файл DB_NAME (по умолчанию db.sqlite3
+проекта) в режиме WAL: читатели не ждут пишущего и наоборот, а пишущие ждут
+друг друга до timeout вместо ошибки "database is locked".
+
+DB_ENGINE=postgresql -- DB_NAME, DB_USER, DB_PASSWORD, DB_HOST, DB_PORT.
+Соединения постоянные (DB_CONN_MAX_AGE секунд, по умолчанию 600), т.е. у
+каждого процесса сервера свой небольшой пул. С DB_POOLER=pgbouncer общий
+пул держит PgBouncer в режиме транзакций, а серверные курсоры Django
+отключаются: с таким пулом они не работают.
+"""
+import os
+
+SQLITE_OPTIONS = {
+    'timeout': 20,
+    # при WAL fsync нужен только на контрольных точках, а не на каждой записи
+    'pragmas': {'journal_mode': 'WAL', 'synchronous': 'NORMAL'},
+    'immediate': True,
+}
+
+
+def database(environ, base_dir):
+    engine = environ.get('DB_ENGINE', 'sqlite')
+    max_age = int(environ.get('DB_CONN_MAX_AGE', 600))
+    if engine == 'sqlite':
+        return {
+            'ENGINE': 'rhythmicgymnastics.sqlite3',
+            'NAME': environ.get('DB_NAME') or os.path.join(base_dir, 'db.sqlite3'),
+            'OPTIONS': dict(SQLITE_OPTIONS),
+            'CONN_MAX_AGE': max_age,
+        }
+    if engine == 'postgresql':
+        return {
+            'ENGINE': 'django.db.backends.postgresql',
+            'NAME': environ.get('DB_NAME', 'rhythmicgymnastics'),
+            'USER': environ.get('DB_USER', ''),
+            'PASSWORD': environ.get('DB_PASSWORD', ''),
+            'HOST': environ.get('DB_HOST', ''),
+            'PORT': environ.get('DB_PORT', ''),
+            'OPTIONS': {'connect_timeout': 5},
+            'CONN_MAX_AGE': max_age,
+            'DISABLE_SERVER_SIDE_CURSORS': environ.get('DB_POOLER') == 'pgbouncer',
+        }
+    raise ValueError('DB_ENGINE: sqlite или postgresql, а не "%s"' % engine)
@@ -11,6 +11,7 @@ https://docs.djangoproject.com/en/1.11/ref/settings/
 """
 
 import os
+import tempfile
 
 # Build paths inside the project like this: os.path.join(BASE_DIR, ...)
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
@@ -41,6 +42,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'competitions.middleware.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -48,6 +50,7 @@ MIDDLEWARE = [
     'django.contrib.auth.middleware.AuthenticationMiddleware',
     'django.contrib.messages.middleware.MessageMiddleware',
     'django.middleware.clickjacking.XFrameOptionsMiddleware',
+    'competitions.middleware.DeferredHooksMiddleware',
 ]
 
 ROOT_URLCONF = 'rhythmicgymnastics.urls'
@@ -83,6 +86,37 @@ DATABASES = {
 }
 
 
+# Cache
+# Страницы результатов кэшируются до следующего изменения соревнования.
+# Подойдёт и FileBasedCache, внешний сервис не нужен.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    }
+}
+
+RESULTS_CACHE_TIMEOUT = 60 * 60
+
+# Значения фильтров по городу и номеру в списках участников админки
+ADMIN_FILTER_CACHE_TIMEOUT = 10 * 60
+
+# Трансляция результатов: интервал keepalive (с) и пауза переподключения (мс)
+LIVE_KEEPALIVE = 15
+LIVE_RETRY_MS = 3000
+
+# Выгрузки протоколов (XLSX, PDF) хранятся по версиям результатов.
+# Для кириллицы в PDF нужен TrueType-шрифт; если путь не задан, DejaVu Sans
+# ищется в обычных местах (export.PDF_FONTS).
+EXPORT_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'rhythmicgymnastics-exports')
+EXPORT_PDF_FONT = os.environ.get('EXPORT_PDF_FONT') or None
+
+# Замеры запросов (время, SQL, шаблоны) по видам страниц: сводка для
+# персонала на /competitions/profile, построчный журнал JSON в PROFILING_LOG
+PROFILING = os.environ.get('PROFILING') == '1'
+PROFILING_LOG = os.environ.get('PROFILING_LOG') or None
+
+
 # Password validation
 # https://docs.djangoproject.com/en/1.11/ref/settings/#auth-password-validators
 
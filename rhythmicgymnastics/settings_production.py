@@ -0,0 +1,23 @@
+"""
+Настройки для работы на соревнованиях:
+DJANGO_SETTINGS_MODULE=rhythmicgymnastics.settings_production
+
+Секретный ключ и имена хостов берутся из DJANGO_SECRET_KEY и
+DJANGO_ALLOWED_HOSTS (через запятую), БД -- из DB_* (см. databases).
+"""
+
+import os
+
+from .databases import database
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR
+
+DEBUG = False
+
+SECRET_KEY = os.environ['DJANGO_SECRET_KEY']
+
+ALLOWED_HOSTS = [host for host in os.environ.get('DJANGO_ALLOWED_HOSTS', 'localhost').split(',') if host]
+
+DATABASES = {
+    'default': database(os.environ, BASE_DIR),
+}
@@ -0,0 +1,33 @@
+"""SQLite для одновременной работы нескольких секретарей и публичных страниц.
+
+Кроме параметров sqlite3.connect (timeout и т.д.) в OPTIONS понимает:
+pragmas -- словарь PRAGMA, выполняемых на каждом новом соединении, и
+immediate -- начинать транзакции с BEGIN IMMEDIATE. Обычный BEGIN берёт
+блокировку записи только на первой записи; если к этому времени другой
+секретарь уже записал своё, SQLite отвечает "database is locked", не дожидаясь
+timeout. BEGIN IMMEDIATE ждёт очереди сразу, в начале транзакции.
+"""
+from django.db.backends.sqlite3 import base
+
+OPTIONS = ('pragmas', 'immediate')
+
+
+class DatabaseWrapper(base.DatabaseWrapper):
+
+    def get_connection_params(self):
+        params = super().get_connection_params()
+        for name in OPTIONS:
+            params.pop(name, None)
+        return params
+
+    def get_new_connection(self, conn_params):
+        conn = super().get_new_connection(conn_params)
+        for name, value in self.settings_dict['OPTIONS'].get('pragmas', {}).items():
+            conn.execute('PRAGMA %s = %s' % (name, value))
+        return conn
+
+    def _start_transaction_under_autocommit(self):
+        if self.settings_dict['OPTIONS'].get('immediate'):
+            self.cursor().execute('BEGIN IMMEDIATE')
+        else:
+            super()._start_transaction_under_autocommit()